@@ -1,15 +1,15 @@
 # import types
-import time
-import requests
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
-import base64
-from PIL import Image
-from io import BytesIO
+from clients import openai_client
+from metrics import logger, openai_call
+from keywords import keyword_service
+from local_keywords import get_local_extractor
+from image_pipeline import fetch_image, prepare_image, read_image, save_copy
+from perceptual_index import image_index
+from download_index import revalidate
 import hashlib
 
-
 load_dotenv(
     os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env")
 )
@@ -17,78 +17,36 @@ load_dotenv(
 
 AYFIE_API_KEY = os.getenv("AYFIE_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# "ayfie" (default) or "local" for the in-process TF-IDF extractor
+KEYWORD_BACKEND = os.getenv("KEYWORD_BACKEND", "ayfie")
 
 
-def get_keywords(text: str, top_n=5, ngram_range=(1, 1)):
-    url = "https://portal.ayfie.com/api/keyword"
-    headers = {
-        "accept": "application/json",
-        "X-API-KEY": AYFIE_API_KEY,
-        "Content-Type": "application/json",
-    }
-
-    payload = {
-        "text": text,
-        "top_n": top_n,
-        "ngram_range": ngram_range,
-        "diversify": False,
-        "diversity": 0.7,
-    }
+# Load the saved counts, or start the corpus fit, before the first request
+if KEYWORD_BACKEND == "local":
+    get_local_extractor()
 
-    try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()  # Raise an exception for bad status codes
-        data = response.json()
 
-        # Extract keywords from the response
-        keywords = data.get("result", {})
-        return keywords
+def _keyword_backend():
+    if KEYWORD_BACKEND == "local":
+        return get_local_extractor()
+    return keyword_service
 
-    except requests.exceptions.RequestException as e:
-        print(f"Error in analyzing text: {e}\n{text} : {type(text)}")
-        return {}
 
+def get_keywords(text: str, top_n=5, ngram_range=(1, 1)):
+    return _keyword_backend().extract(text, top_n, ngram_range)
 
-def get_img_description(path_to_image, max_width=1024, max_height=1024):
-    client = OpenAI()
-
-    with Image.open(path_to_image) as img:
-        # Get original image dimensions
-        original_width, original_height = img.size
-        # print(f"Original dimensions: {original_width}x{original_height}")
-
-        # Check if the image needs to be resized
-        if original_width > max_width or original_height > max_height:
-            # Calculate the scaling factor to maintain the aspect ratio
-            width_ratio = max_width / original_width
-            height_ratio = max_height / original_height
-            scaling_factor = min(width_ratio, height_ratio)
-
-            # Calculate the new dimensions
-            new_width = int(original_width * scaling_factor)
-            new_height = int(original_height * scaling_factor)
-            # print(f"Resized dimensions: {new_width}x{new_height}")
-
-            # Resize the image
-            resized_img = img.resize((new_width, new_height), Image.LANCZOS).convert(
-                "RGB"
-            )
-            # Save the resized image to the output path
-
-            buff = BytesIO()
-            resized_img.save(buff, format="JPEG")
-            img_str = base64.b64encode(buff.getvalue()).decode("utf-8")
-
-            data = img_str
-
-            # print(f"Image resized and saved")
-        else:
-            with open(path_to_image, "rb") as image_file:
-                data = base64.b64encode(image_file.read()).decode("utf-8")
-            # print("Image dimensions are within the limits, no resizing needed.")
 
+def get_keywords_many(texts, top_n=5, ngram_range=(1, 1)):
+    """`get_keywords` for a list of texts, fetching uncached ones concurrently."""
+    return _keyword_backend().extract_many(texts, top_n, ngram_range)
+
+
+def describe_image(prepared):
+    """Ask the vision model what is in a `PreparedImage`."""
     try:
-        response = client.chat.completions.create(
+        response = openai_call(
+            "get_img_description",
+            openai_client.chat.completions.create,
             model="gpt-4o-mini",
             messages=[
                 {
@@ -97,7 +55,7 @@ def get_img_description(path_to_image, max_width=1024, max_height=1024):
                         {"type": "text", "text": "What’s in this image?"},
                         {
                             "type": "image_url",
-                            "image_url": {"url": f"data:image/png;base64,{data}"},
+                            "image_url": {"url": prepared.data_url},
                         },
                     ],
                 }
@@ -107,31 +65,64 @@ def get_img_description(path_to_image, max_width=1024, max_height=1024):
 
         return response.choices[0].message.content
     except Exception as e:
-        print(f"Error in analyzing image: {e}")
+        logger.warning("Error in analyzing image: %s", e)
         return ""
 
 
+def get_img_description(path_to_image, max_width=1024, max_height=1024):
+    data, content_hash = read_image(path_to_image)
+    return describe_image(prepare_image(data, content_hash, max_width, max_height))
+
+
 def generate_cache_key(image_data):
     """Generate a cache key for an image based on its contents."""
     return hashlib.md5(image_data).hexdigest()
 
 
-def get_image_description_with_cache(path_to_image, cache):
-    """Check if image description is cached, if not, generate and cache it."""
-    with open(path_to_image, "rb") as image_file:
-        image_data = image_file.read()
-        cache_key = generate_cache_key(image_data)
+def describe_image_bytes(data, content_hash, cache, describe=describe_image):
+    """Cached description of raw image bytes whose md5 is `content_hash`.
 
-        # Check if the description is already cached
-        if cache.get(cache_key):
-            return cache[cache_key]
+    `describe` makes the actual vision call on a miss.
+    """
+    description = cache.get(content_hash)
+    if description:
+        return description
 
-        # If not cached, generate a new description
-        description = get_img_description(path_to_image)
+    prepared = prepare_image(data, content_hash)
 
-        # Cache the result
-        cache[cache_key] = description
-        return description
+    # Reuse the description of a near-identical image when there is one
+    match = image_index.find(prepared.perceptual_hash)
+    if match is not None:
+        description = cache.get(match)
+        if description:
+            cache[content_hash] = description
+            return description
+
+    description = describe(prepared)
+    cache[content_hash] = description
+    if description:
+        image_index.add(prepared.perceptual_hash, content_hash)
+    return description
+
+
+def get_image_description_with_cache(path_to_image, cache):
+    """Check if image description is cached, if not, generate and cache it."""
+    data, content_hash = read_image(path_to_image)
+    return describe_image_bytes(data, content_hash, cache)
+
+
+def get_image_description_from_url(url, cache, save_to=None):
+    """Download `url` and describe it without writing it to disk unless `save_to`."""
+    content_hash, data = revalidate(url)
+    if data is None:
+        if content_hash is not None:
+            description = cache.get(content_hash)
+            if description:
+                return description
+        data, content_hash = fetch_image(url, save_to)
+    elif save_to is not None:
+        save_copy(url, data, content_hash, save_to)
+    return describe_image_bytes(data, content_hash, cache)
 
 
 # # Example usage:
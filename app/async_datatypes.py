@@ -0,0 +1,458 @@
+import asyncio
+import os
+import uuid
+import weakref
+
+from clients import create_async_postgrest
+from datatypes import (
+    Bookmark,
+    Like,
+    Message,
+    Reply,
+    Retweet,
+    Tweet,
+    User,
+    UserFollow,
+    UserProfile,
+    counter_aggregator,
+)
+from entity_cache import tweet_cache, user_cache
+
+# Asyncio mirror of datatypes.py. All queries share a keep-alive HTTP/2
+# connection pool, and at most ASYNC_MAX_CONCURRENCY of them are in flight at
+# once, so callers can `asyncio.gather` hundreds of reads and writes. Counter
+# updates and cache invalidation go through the same helpers as the sync
+# classes.
+
+ASYNC_MAX_CONCURRENCY = int(os.getenv("ASYNC_MAX_CONCURRENCY", "50"))
+ASYNC_CHUNK_SIZE = 200
+
+# Semaphores and httpx pools are bound to the event loop they are first used
+# on, so each loop (e.g. each `asyncio.run`) gets its own pair
+_loop_state = weakref.WeakKeyDictionary()
+
+
+def _get_loop_state():
+    loop = asyncio.get_running_loop()
+    state = _loop_state.get(loop)
+    if state is None:
+        state = (asyncio.Semaphore(ASYNC_MAX_CONCURRENCY), create_async_postgrest())
+        _loop_state[loop] = state
+    return state
+
+
+def table(name):
+    return _get_loop_state()[1].table(name)
+
+
+async def execute(query, error_message):
+    """Run `query` under the concurrency limit, raising `error_message` on failure."""
+    async with _get_loop_state()[0]:
+        try:
+            return await query.execute()
+        except Exception as e:
+            raise Exception(f"{error_message}: {e}")
+
+
+async def load_many(table_name, from_db, ids, key="id"):
+    """Fetch rows whose `key` is in `ids` with concurrent chunked `.in_()` queries.
+
+    Returns `(entities, missing_ids)` with entities in the order of `ids`.
+    """
+    unique_ids = list(dict.fromkeys(ids))
+    chunks = [
+        unique_ids[start : start + ASYNC_CHUNK_SIZE]
+        for start in range(0, len(unique_ids), ASYNC_CHUNK_SIZE)
+    ]
+    responses = await asyncio.gather(
+        *(
+            execute(
+                table(table_name).select("*").in_(key, chunk),
+                f"Error fetching {table_name} rows",
+            )
+            for chunk in chunks
+        )
+    )
+    found = {row[key]: from_db(row) for response in responses for row in response.data}
+    entities = [found[i] for i in ids if i in found]
+    missing = [i for i in unique_ids if i not in found]
+    return entities, missing
+
+
+class AsyncUser(User):
+    @classmethod
+    async def get_by_id(cls, user_id):
+        response = await execute(
+            table("User").select("*").eq("id", user_id), "Error fetching user"
+        )
+        if response.data:
+            return cls.from_db(response.data[0])
+        else:
+            return None
+
+    @classmethod
+    async def get_all_users(cls):
+        response = await execute(table("User").select("*"), "Error fetching users")
+        return [cls.from_db(user_data) for user_data in response.data]
+
+    @classmethod
+    async def create(
+        cls,
+        username,
+        name=None,
+        bio=None,
+        website=None,
+        email=None,
+        provider=None,
+        password=None,
+        badge=None,
+        bgImage=None,
+        profileImage=None,
+        is_bot=False,
+        bot_theme=None,
+        bot_prompt=None,
+    ):
+        data = {
+            "id": str(uuid.uuid4()),
+            "username": username,
+            "name": name,
+            "bio": bio,
+            "website": website,
+            "email": email,
+            "provider": provider or "local",
+            "password": password,
+            "badge": badge,
+            "bgImage": bgImage,
+            "profileImage": profileImage,
+            "createdAt": "now()",
+            "followersCount": 0,
+            "followingCount": 0,
+            "likeCount": 0,
+            "isBot": is_bot,
+            "botTheme": bot_theme,
+            "botPrompt": bot_prompt,
+        }
+        await execute(table("User").insert(data), "Error creating user")
+        return cls.from_db(data)
+
+    async def load_profile(self):
+        """Async counterpart of the lazy `userProfile` property."""
+        if self._userProfile is None:
+            self._userProfile = await AsyncUserProfile.get_by_user_id(
+                self.id
+            ) or AsyncUserProfile(self.id)
+        return self._userProfile
+
+    async def update_profile(self, **kwargs):
+        profile = await self.load_profile()
+        for key, value in kwargs.items():
+            if hasattr(profile, key):
+                setattr(profile, key, value)
+        await profile.update()
+
+    async def tweet(self, content, images=None):
+        return await AsyncTweet.create(user_id=self.id, body=content, images=images)
+
+    async def reply(self, tweet_id, content, images=None):
+        return await AsyncReply.create(
+            user_id=self.id, tweet_id=tweet_id, body=content, images=images
+        )
+
+    async def follow(self, target_user_id):
+        await AsyncUserFollow.create(self.id, target_user_id)
+        counter_aggregator.increment("User", self.id, "followingCount")
+        counter_aggregator.increment("User", target_user_id, "followersCount")
+        # As in `User.follow`, drop the cached users instead of editing them
+        user_cache.invalidate(self.id)
+        user_cache.invalidate(target_user_id)
+        return True
+
+    async def like_tweet(self, tweet_id):
+        await AsyncLike.create(user_id=self.id, tweet_id=tweet_id)
+
+    async def retweet_tweet(self, tweet_id):
+        await AsyncRetweet.create(user_id=self.id, tweet_id=tweet_id)
+
+    async def bookmark_tweet(self, tweet_id):
+        await AsyncBookmark.create(user_id=self.id, tweet_id=tweet_id)
+
+    async def _related_ids(self, table_name, column, filter_column, error_message):
+        response = await execute(
+            table(table_name).select(column).eq(filter_column, self.id), error_message
+        )
+        return [record[column] for record in response.data]
+
+    async def get_following(self):
+        ids = await self._related_ids(
+            "UserFollow", "followingId", "followerId", "Error fetching following"
+        )
+        users, _ = await load_many("User", AsyncUser.from_db, ids)
+        return users
+
+    async def get_followers(self):
+        ids = await self._related_ids(
+            "UserFollow", "followerId", "followingId", "Error fetching followers"
+        )
+        users, _ = await load_many("User", AsyncUser.from_db, ids)
+        return users
+
+    async def get_liked_tweets(self):
+        ids = await self._related_ids(
+            "Like", "tweetId", "userId", "Error fetching liked tweets"
+        )
+        tweets, _ = await load_many("Tweet", AsyncTweet.from_db, ids)
+        return tweets
+
+    async def get_retweets(self):
+        ids = await self._related_ids(
+            "Retweet", "tweetId", "userId", "Error fetching retweets"
+        )
+        tweets, _ = await load_many("Tweet", AsyncTweet.from_db, ids)
+        return tweets
+
+    async def get_bookmarks(self):
+        ids = await self._related_ids(
+            "Bookmark", "tweetId", "userId", "Error fetching bookmarks"
+        )
+        tweets, _ = await load_many("Tweet", AsyncTweet.from_db, ids)
+        return tweets
+
+
+class AsyncUserProfile(UserProfile):
+    @classmethod
+    async def get_by_user_id(cls, user_id):
+        response = await execute(
+            table("UserProfile").select("*").eq("userId", user_id),
+            "Error fetching user profile",
+        )
+        if response.data:
+            return cls.from_db(response.data[0])
+        else:
+            return None
+
+    @classmethod
+    async def create(cls, user_id, **fields):
+        profile = cls(user_id, **fields)
+        await profile.update()
+        return profile
+
+    async def update(self):
+        data = {
+            "ageGroup": self.age_group,
+            "gender": self.gender,
+            "race": self.race,
+            "location": self.location,
+            "incomeRange": self.income_range,
+            "relationshipStatus": self.relationship_status,
+            "education": self.education,
+            "occupation": self.occupation,
+            "interests": self.interests,
+        }
+        if self.id is None:
+            data.update({"id": str(uuid.uuid4()), "userId": self.user_id})
+            response = await execute(
+                table("UserProfile").insert(data), "Error creating user profile"
+            )
+            self.id = data["id"]
+            self.created_at = response.data[0].get("createdAt")
+            return True
+        await execute(
+            table("UserProfile").update(data).eq("userId", self.user_id),
+            "Error updating user profile",
+        )
+        return True
+
+
+class AsyncTweet(Tweet):
+    __slots__ = ()
+
+    @classmethod
+    async def create(cls, user_id, body, images=None):
+        data = {
+            "id": str(uuid.uuid4()),
+            "userId": user_id,
+            "body": body,
+            "images": images or [],
+            "likeCount": 0,
+            "retweetCount": 0,
+            "replyCount": 0,
+            "createdAt": "now()",
+        }
+        response = await execute(table("Tweet").insert(data), "Error creating tweet")
+        return cls.from_db(response.data[0])
+
+    @classmethod
+    async def get_by_id(cls, tweet_id):
+        response = await execute(
+            table("Tweet").select("*").eq("id", tweet_id), "Error fetching tweet"
+        )
+        if response.data:
+            return cls.from_db(response.data[0])
+        else:
+            return None
+
+    @classmethod
+    async def get_recent_tweets(cls, limit=10):
+        response = await execute(
+            table("Tweet").select("*").order("createdAt", desc=True).limit(limit),
+            "Error fetching tweets",
+        )
+        return [cls.from_db(tweet_data) for tweet_data in response.data]
+
+    async def get_replies(self):
+        response = await execute(
+            table("Reply").select("*").eq("tweetId", self.id),
+            "Error fetching replies",
+        )
+        return [AsyncReply.from_db(reply_data) for reply_data in response.data]
+
+    async def _user_ids(self, table_name, error_message):
+        response = await execute(
+            table(table_name).select("userId").eq("tweetId", self.id), error_message
+        )
+        return [record["userId"] for record in response.data]
+
+    async def get_likes(self):
+        user_ids = await self._user_ids("Like", "Error fetching likes")
+        users, _ = await load_many("User", AsyncUser.from_db, user_ids)
+        return users
+
+    async def get_retweets(self):
+        user_ids = await self._user_ids("Retweet", "Error fetching retweets")
+        users, _ = await load_many("User", AsyncUser.from_db, user_ids)
+        return users
+
+    async def like(self, user_id):
+        await AsyncLike.create(user_id=user_id, tweet_id=self.id)
+
+    async def retweet(self, user_id):
+        await AsyncRetweet.create(user_id=user_id, tweet_id=self.id)
+
+    async def reply(self, user_id, content, images=None):
+        await AsyncReply.create(
+            user_id=user_id, tweet_id=self.id, body=content, images=images
+        )
+
+
+class AsyncReply(Reply):
+    __slots__ = ()
+
+    @classmethod
+    async def create(cls, user_id, tweet_id, body, images=None):
+        data = {
+            "id": str(uuid.uuid4()),
+            "userId": user_id,
+            "tweetId": tweet_id,
+            "body": body,
+            "images": images or [],
+            "createdAt": "now()",
+        }
+        response = await execute(table("Reply").insert(data), "Error creating reply")
+        cls._count(tweet_id)
+        return cls.from_db(response.data[0])
+
+
+class AsyncRetweet(Retweet):
+    __slots__ = ()
+
+    @classmethod
+    async def create(cls, user_id, tweet_id):
+        data = {
+            "id": str(uuid.uuid4()),
+            "userId": user_id,
+            "tweetId": tweet_id,
+            "retweetDate": "now()",
+        }
+        response = await execute(
+            table("Retweet").insert(data), "Error creating retweet"
+        )
+        cls._count(tweet_id)
+        return cls.from_db(response.data[0])
+
+
+class AsyncLike(Like):
+    __slots__ = ()
+
+    @classmethod
+    async def create(cls, user_id, tweet_id):
+        data = {
+            "id": str(uuid.uuid4()),
+            "userId": user_id,
+            "tweetId": tweet_id,
+            "createdAt": "now()",
+        }
+        # The insert and the author lookup don't depend on each other
+        response, author_id = await asyncio.gather(
+            execute(table("Like").insert(data), "Error creating like"),
+            cls._author_id(tweet_id),
+        )
+        counter_aggregator.increment("Tweet", tweet_id, "likeCount")
+        tweet_cache.invalidate(tweet_id)
+        if author_id:
+            counter_aggregator.increment("User", author_id, "likeCount")
+            user_cache.invalidate(author_id)
+        return cls.from_db(response.data[0])
+
+    @staticmethod
+    async def _author_id(tweet_id):
+        # `Like._count` would block on a cache miss; the author is usually cached
+        tweet = tweet_cache.get(tweet_id)
+        if tweet is not None:
+            return tweet.user_id
+        response = await execute(
+            table("Tweet").select("userId").eq("id", tweet_id), "Error fetching tweet"
+        )
+        return response.data[0]["userId"] if response.data else None
+
+
+class AsyncBookmark(Bookmark):
+    __slots__ = ()
+
+    @classmethod
+    async def create(cls, user_id, tweet_id):
+        data = {
+            "id": str(uuid.uuid4()),
+            "userId": user_id,
+            "tweetId": tweet_id,
+            "createdAt": "now()",
+        }
+        response = await execute(
+            table("Bookmark").insert(data), "Error creating bookmark"
+        )
+        return cls.from_db(response.data[0])
+
+
+class AsyncMessage(Message):
+    __slots__ = ()
+
+    @classmethod
+    async def create(cls, sender_id, recipient_id, body, image=None):
+        data = {
+            "id": str(uuid.uuid4()),
+            "senderId": sender_id,
+            "recipientId": recipient_id,
+            "body": body,
+            "image": image,
+            "createdAt": "now()",
+        }
+        response = await execute(
+            table("Message").insert(data), "Error creating message"
+        )
+        return cls.from_db(response.data[0])
+
+
+class AsyncUserFollow(UserFollow):
+    __slots__ = ()
+
+    @classmethod
+    async def create(cls, follower_id, following_id):
+        data = {
+            "id": str(uuid.uuid4()),
+            "followerId": follower_id,
+            "followingId": following_id,
+            "createdAt": "now()",
+        }
+        response = await execute(
+            table("UserFollow").insert(data), "Error creating follow relationship"
+        )
+        return cls.from_db(response.data[0])
@@ -0,0 +1,48 @@
+class BatchLoader:
+    """DataLoader-style loader that coalesces id lookups into chunked `.in_()` queries.
+
+    Ids already held by `cache` are served from it; the rest are de-duplicated
+    and fetched `chunk_size` at a time, and every fetched entity is written
+    back to the cache.
+    """
+
+    def __init__(self, client, table, from_db, cache=None, key="id", chunk_size=200):
+        self.client = client
+        self.table = table
+        self.from_db = from_db
+        self.cache = cache
+        self.key = key
+        self.chunk_size = chunk_size
+
+    def load(self, key):
+        entities, _ = self.load_many([key])
+        return entities[0] if entities else None
+
+    def load_many(self, keys):
+        """Return `(entities, missing_keys)` with entities in the order of `keys`."""
+        unique_keys = list(dict.fromkeys(keys))
+        found = {}
+        pending = []
+        for key in unique_keys:
+            entity = self.cache.get(key) if self.cache is not None else None
+            if entity is None:
+                pending.append(key)
+            else:
+                found[key] = entity
+
+        for start in range(0, len(pending), self.chunk_size):
+            chunk = pending[start : start + self.chunk_size]
+            response = (
+                self.client.table(self.table).select("*").in_(self.key, chunk).execute()
+            )
+            if response.error:
+                raise Exception(f"Error fetching {self.table} rows: {response.error}")
+            for row in response.data:
+                entity = self.from_db(row)
+                found[row[self.key]] = entity
+                if self.cache is not None:
+                    self.cache.set(row[self.key], entity)
+
+        entities = [found[key] for key in keys if key in found]
+        missing = [key for key in unique_keys if key not in found]
+        return entities, missing
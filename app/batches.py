@@ -0,0 +1,168 @@
+import sys
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+
+import numpy as np
+
+NAT = np.datetime64("NaT", "ms")
+
+
+def parse_datetime64(value):
+    """Parse a Supabase timestamp into a naive UTC datetime64[ms] (NaT if unparseable)."""
+    if not value:
+        return NAT
+    try:
+        parsed = datetime.fromisoformat(str(value))
+    except ValueError:
+        return NAT
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.datetime64(parsed, "ms")
+
+
+def format_datetime64(value):
+    """Inverse of `parse_datetime64` for entities: an ISO string, or None for NaT."""
+    if np.isnat(value):
+        return None
+    return str(value)
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class ColumnarBatch(ABC):
+    """Column-per-field container for bulk reads.
+
+    Subclasses list their columns as `(attribute, db_key, kind)` tuples where
+    kind is one of "id" (interned strings), "object", "int" or "datetime".
+    Numeric and datetime columns are NumPy arrays, so filters such as
+    `batch[batch.likeCount > 100]` run vectorized and return a new batch.
+    """
+
+    _columns = ()
+
+    def __init__(self, **columns):
+        for attr, _, _ in self._columns:
+            setattr(self, attr, columns[attr])
+
+    @classmethod
+    def from_rows(cls, rows):
+        values = {attr: [] for attr, _, _ in cls._columns}
+        for row in rows:
+            for attr, db_key, kind in cls._columns:
+                value = row.get(db_key)
+                if kind == "id":
+                    value = _intern(value)
+                elif kind == "int":
+                    value = value or 0
+                elif kind == "datetime":
+                    value = parse_datetime64(value)
+                values[attr].append(value)
+        return cls(
+            **{
+                attr: cls._to_array(values[attr], kind)
+                for attr, _, kind in cls._columns
+            }
+        )
+
+    @classmethod
+    def concat(cls, batches):
+        batches = list(batches)
+        if not batches:
+            return cls.from_rows([])
+        return cls(
+            **{
+                attr: np.concatenate([getattr(batch, attr) for batch in batches])
+                for attr, _, _ in cls._columns
+            }
+        )
+
+    @staticmethod
+    def _to_array(values, kind):
+        if kind == "int":
+            return np.asarray(values, dtype=np.int64)
+        if kind == "datetime":
+            return np.asarray(values, dtype="datetime64[ms]")
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        return array
+
+    def __len__(self):
+        return len(getattr(self, self._columns[0][0]))
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self.entity(index)
+        return type(self)(
+            **{attr: getattr(self, attr)[index] for attr, _, _ in self._columns}
+        )
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.entity(index)
+
+    def filter(self, mask):
+        return self[np.asarray(mask, dtype=bool)]
+
+    @abstractmethod
+    def entity(self, index):
+        """The row at `index` as a datatypes entity."""
+
+
+class TweetBatch(ColumnarBatch):
+    _columns = (
+        ("id", "id", "id"),
+        ("user_id", "userId", "id"),
+        ("body", "body", "object"),
+        ("images", "images", "object"),
+        ("likeCount", "likeCount", "int"),
+        ("retweetCount", "retweetCount", "int"),
+        ("replyCount", "replyCount", "int"),
+        ("createdAt", "createdAt", "datetime"),
+    )
+
+    def entity(self, index):
+        from datatypes import Tweet
+
+        return Tweet(
+            id=self.id[index],
+            user_id=self.user_id[index],
+            body=self.body[index],
+            images=self.images[index],
+            likeCount=int(self.likeCount[index]),
+            retweetCount=int(self.retweetCount[index]),
+            replyCount=int(self.replyCount[index]),
+            createdAt=format_datetime64(self.createdAt[index]),
+        )
+
+
+class UserBatch(ColumnarBatch):
+    _columns = (
+        ("id", "id", "id"),
+        ("username", "username", "id"),
+        ("name", "name", "object"),
+        ("bio", "bio", "object"),
+        ("provider", "provider", "id"),
+        ("profileImage", "profileImage", "object"),
+        ("followersCount", "followersCount", "int"),
+        ("followingCount", "followingCount", "int"),
+        ("likeCount", "likeCount", "int"),
+        ("createdAt", "createdAt", "datetime"),
+    )
+
+    def entity(self, index):
+        from datatypes import User
+
+        return User(
+            id=self.id[index],
+            username=self.username[index],
+            name=self.name[index],
+            bio=self.bio[index],
+            provider=self.provider[index],
+            profileImage=self.profileImage[index],
+            followersCount=int(self.followersCount[index]),
+            followingCount=int(self.followingCount[index]),
+            likeCount=int(self.likeCount[index]),
+            createdAt=format_datetime64(self.createdAt[index]),
+        )
@@ -0,0 +1,154 @@
+import atexit
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+
+from postgrest.exceptions import APIError
+
+from metrics import logger
+
+# SQLSTATE classes of errors caused by the rows themselves: invalid values
+# (22) and constraint violations such as duplicate keys (23)
+ROW_ERROR_CLASSES = ("22", "23")
+
+
+def _is_row_error(error):
+    """Whether `error` is the database rejecting row data, as opposed to the
+    request failing (timeouts, dropped connections, 5xx, bad columns)."""
+    return isinstance(error, APIError) and (error.code or "")[:2] in ROW_ERROR_CLASSES
+
+
+class BulkWriter:
+    """Unit-of-work buffer that sends pending rows as multi-row inserts.
+
+    `submit` queues a row and returns a Future. Rows are grouped per table and
+    written as one INSERT once `max_batch_size` rows are waiting or the oldest
+    has waited `max_latency` seconds. Each Future resolves to the row as
+    returned by the server (passed through `factory` when given), so callers
+    need no follow-up read. If the database rejects a batch because of its
+    rows it is retried row by row, so only the offending rows' Futures carry
+    the error; any other failure is set on every Future of the batch, since
+    the insert may or may not have been applied.
+    """
+
+    def __init__(self, client, max_batch_size=500, max_latency=1.0):
+        self.client = client
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self._buffers = defaultdict(list)
+        self._oldest = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.rows_written = 0
+        self.batches_written = 0
+        self.rows_failed = 0
+
+    def submit(self, table, row, factory=None, on_success=None):
+        """Queue `row` for `table`; `on_success(result)` runs once it is stored."""
+        future = Future()
+        with self._lock:
+            buffer = self._buffers[table]
+            buffer.append((row, future, factory, on_success))
+            self._oldest.setdefault(table, time.monotonic())
+            full = len(buffer) >= self.max_batch_size
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        if full:
+            self.flush(table)
+        return future
+
+    def flush(self, table=None):
+        """Write the buffered rows of `table`, or of every table when None."""
+        with self._lock:
+            tables = [table] if table is not None else list(self._buffers)
+            pending = []
+            for name in tables:
+                entries = self._buffers.pop(name, [])
+                self._oldest.pop(name, None)
+                if entries:
+                    pending.append((name, entries))
+        for name, entries in pending:
+            for start in range(0, len(entries), self.max_batch_size):
+                self._write(name, entries[start : start + self.max_batch_size])
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": sum(len(entries) for entries in self._buffers.values()),
+                "rows_written": self.rows_written,
+                "batches_written": self.batches_written,
+                "rows_failed": self.rows_failed,
+            }
+
+    def _write(self, table, entries):
+        rows = [row for row, _, _, _ in entries]
+        try:
+            response = self.client.table(table).insert(rows).execute()
+            if getattr(response, "error", None):
+                raise Exception(response.error)
+        except Exception as e:
+            if len(entries) > 1 and _is_row_error(e):
+                # Multi-row inserts are all-or-nothing; retry one at a time so
+                # the error is reported against the row that caused it
+                for entry in entries:
+                    self._write(table, [entry])
+                return
+            with self._lock:
+                self.rows_failed += len(entries)
+            logger.warning(
+                "Error inserting %d %s row(s) starting with %s: %s",
+                len(entries),
+                table,
+                rows[0].get("id"),
+                e,
+            )
+            for _, future, _, _ in entries:
+                future.set_exception(e)
+            return
+
+        with self._lock:
+            self.batches_written += 1
+            self.rows_written += len(entries)
+        stored = {data.get("id"): data for data in response.data or []}
+        for row, future, factory, on_success in entries:
+            result = stored.get(row.get("id"), row)
+            if factory is not None:
+                result = factory(result)
+            future.set_result(result)
+            if on_success is not None:
+                try:
+                    on_success(result)
+                except Exception as e:
+                    logger.warning("Error in %s insert callback: %s", table, e)
+
+    def _run(self):
+        interval = self.max_latency / 4
+        while not self._stop.wait(interval):
+            now = time.monotonic()
+            with self._lock:
+                due = [
+                    table
+                    for table, oldest in self._oldest.items()
+                    if now - oldest >= self.max_latency
+                ]
+            for table in due:
+                self.flush(table)
+
+
+BULK_WRITE_BATCH_SIZE = int(os.getenv("BULK_WRITE_BATCH_SIZE", "500"))
+BULK_WRITE_MAX_LATENCY = float(os.getenv("BULK_WRITE_MAX_LATENCY", "1"))
+
+
+def create_bulk_writer(client):
+    """Build a writer from the environment settings and flush it at exit."""
+    writer = BulkWriter(client, BULK_WRITE_BATCH_SIZE, BULK_WRITE_MAX_LATENCY)
+    atexit.register(writer.close)
+    return writer
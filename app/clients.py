@@ -0,0 +1,236 @@
+import os
+import threading
+import time
+from collections import defaultdict
+
+import httpx
+from dotenv import load_dotenv
+from openai import OpenAI
+from postgrest import AsyncPostgrestClient, SyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
+from supabase import Client, ClientOptions
+
+import metrics
+from local_backend import AsyncBackendView, create_backend
+
+load_dotenv(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env")
+)
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# "supabase" (default), or "memory"/"sqlite" for the local engine in
+# local_backend.py; STORAGE_PATH sets the SQLite file
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase")
+STORAGE_PATH = os.getenv("STORAGE_PATH")
+
+# Connection pool tuning shared by every client built here
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
+
+_lock = threading.RLock()
+_clients = {}
+_http_clients = {}
+_request_counts = defaultdict(int)
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def _timeout(timeout=None):
+    if isinstance(timeout, httpx.Timeout):
+        return timeout
+    return httpx.Timeout(timeout or HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+
+
+def _count_request(name):
+    def hook(request):
+        _request_counts[name] += 1
+
+    return hook
+
+
+def _start_timer(request):
+    request.extensions["metrics_start"] = time.monotonic()
+
+
+def _read_body(response):
+    # Response hooks run before the body is read; reading it here makes its
+    # transfer time and size (Content-Length is often absent) part of the call
+    response.read()
+
+
+def _record_supabase_response(response):
+    """Record a PostgREST call as ("supabase", "<METHOD> <table or rpc>")."""
+    request = response.request
+    start = request.extensions.get("metrics_start")
+    if start is None:
+        return
+    resource = request.url.path.partition("/rest/v1/")[2] or request.url.path
+    metrics.record(
+        "supabase",
+        f"{request.method} {resource}",
+        time.monotonic() - start,
+        error=response.status_code >= 400,
+        request_bytes=len(request.content),
+        response_bytes=response.num_bytes_downloaded,
+    )
+
+
+def _pooled_http_client(name, **kwargs):
+    event_hooks = {"request": [_count_request(name)], "response": []}
+    if name == "supabase":
+        event_hooks["request"].append(_start_timer)
+        event_hooks["response"] += [_read_body, _record_supabase_response]
+    client = httpx.Client(
+        http2=True,
+        limits=_limits(),
+        event_hooks=event_hooks,
+        **kwargs,
+    )
+    _http_clients[name] = client
+    return client
+
+
+class PooledPostgrestClient(SyncPostgrestClient):
+    def create_session(self, base_url, headers, timeout, verify=True):
+        return _pooled_http_client(
+            "supabase",
+            base_url=base_url,
+            headers=headers,
+            timeout=_timeout(timeout),
+            verify=verify,
+            follow_redirects=True,
+        )
+
+
+class PooledAsyncPostgrestClient(AsyncPostgrestClient):
+    def create_session(self, base_url, headers, timeout, verify=True):
+        async def hook(request):
+            _request_counts["supabase_async"] += 1
+            _start_timer(request)
+
+        async def response_hook(response):
+            # See _read_body
+            await response.aread()
+            _record_supabase_response(response)
+
+        client = httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=_timeout(timeout),
+            verify=verify,
+            follow_redirects=True,
+            http2=True,
+            limits=_limits(),
+            event_hooks={"request": [hook], "response": [response_hook]},
+        )
+        _http_clients["supabase_async"] = client
+        return client
+
+
+class PooledSupabaseClient(Client):
+    """Supabase client whose PostgREST session uses the shared pool settings."""
+
+    @staticmethod
+    def _init_postgrest_client(rest_url, headers, schema, timeout=None, verify=True):
+        return PooledPostgrestClient(
+            rest_url, headers=headers, schema=schema, timeout=timeout, verify=verify
+        )
+
+
+def _get_or_create(name, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = factory()
+                _clients[name] = client
+    return client
+
+
+def get_supabase():
+    """The process-wide Supabase client, built on first use."""
+    if STORAGE_BACKEND != "supabase":
+        return _get_or_create(
+            "local", lambda: create_backend(STORAGE_BACKEND, STORAGE_PATH)
+        )
+    return _get_or_create(
+        "supabase",
+        lambda: PooledSupabaseClient.create(
+            SUPABASE_URL,
+            SUPABASE_KEY,
+            ClientOptions(postgrest_client_timeout=_timeout()),
+        ),
+    )
+
+
+def create_async_postgrest():
+    """A new asyncio PostgREST client.
+
+    Its httpx pool belongs to the event loop that first uses it, so callers
+    keep one per loop (see async_datatypes) rather than sharing it process-wide.
+    """
+    if STORAGE_BACKEND != "supabase":
+        return AsyncBackendView(get_supabase())
+    return PooledAsyncPostgrestClient(
+        f"{SUPABASE_URL}/rest/v1",
+        headers={
+            **DEFAULT_POSTGREST_CLIENT_HEADERS,
+            "apiKey": SUPABASE_KEY,
+            "Authorization": f"Bearer {SUPABASE_KEY}",
+        },
+        timeout=_timeout(),
+    )
+
+
+def get_openai():
+    """The process-wide OpenAI client, built on first use."""
+    return _get_or_create(
+        "openai",
+        lambda: OpenAI(
+            api_key=OPENAI_API_KEY,
+            http_client=_pooled_http_client("openai", timeout=_timeout()),
+        ),
+    )
+
+
+def pool_stats():
+    """Request counts and open/idle connection counts for each pooled HTTP client."""
+    stats = {}
+    for name, http_client in list(_http_clients.items()):
+        pool = getattr(getattr(http_client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        stats[name] = {
+            "requests": _request_counts[name],
+            "connections": len(connections),
+            "idle_connections": sum(1 for conn in connections if conn.is_idle()),
+            "max_connections": HTTP_MAX_CONNECTIONS,
+            "max_keepalive_connections": HTTP_MAX_KEEPALIVE,
+        }
+    return stats
+
+
+class LazyClient:
+    """Module-level stand-in that builds the real client on first attribute access."""
+
+    def __init__(self, factory):
+        self._factory = factory
+
+    def __getattr__(self, name):
+        return getattr(self._factory(), name)
+
+
+supabase = LazyClient(get_supabase)
+openai_client = LazyClient(get_openai)
@@ -1,82 +1,88 @@
-from supabase import create_client, Client
 from datatypes import *
 from analyze import *
+from clients import supabase, openai_client
+from description_cache import image_cache
+from image_executor import image_describer
+from tweet_enrichment import tweet_enricher
+from metrics import acquire_openai_quota, count_error, logger, openai_call
+from entity_cache import profile_cache
+from pagination import iter_rows
+from pipeline import Pipeline, Stage
+from prompt_builder import (
+    PromptBuilder,
+    compact,
+    dedupe,
+    estimate_tokens,
+    keyword_terms,
+    labeled_lines,
+)
+from watermarks import (
+    ACTIVITY_TABLES,
+    GLOBAL,
+    PROFILE,
+    decode_cursor,
+    encode_cursor,
+    watermarks,
+)
+import hashlib
+from collections import Counter
 import requests
 import os
-from openai import OpenAI
-from PIL import Image
-from io import BytesIO
-import base64
 import json
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 from typing import Optional, List
 
-
 load_dotenv(
     os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env")
 )
-image_cache = {}
-
-# Initialize Supabase Client
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 AYFIE_API_KEY = os.getenv("AYFIE_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
 
+# Worker threads and input queue bound for each stage of the profile pipeline
+PROFILE_FETCH_WORKERS = int(os.getenv("PROFILE_FETCH_WORKERS", "8"))
+PROFILE_ENRICH_WORKERS = int(os.getenv("PROFILE_ENRICH_WORKERS", "8"))
+PROFILE_LLM_WORKERS = int(os.getenv("PROFILE_LLM_WORKERS", "8"))
+PROFILE_WRITE_WORKERS = int(os.getenv("PROFILE_WRITE_WORKERS", "2"))
+PROFILE_QUEUE_SIZE = int(os.getenv("PROFILE_QUEUE_SIZE", "32"))
+# Users fetched together by one fetch worker, five queries per chunk
+PROFILE_FETCH_BATCH_SIZE = int(os.getenv("PROFILE_FETCH_BATCH_SIZE", "200"))
 
-def get_recent_tweets(user_id, n):
-    """Fetch the most recent n tweets for a user."""
-    tweets_response = (
-        supabase.from_("Tweet")
-        .select("*")
-        .eq("userId", user_id)
-        .order("createdAt", desc=True)
-        .limit(n)
-        .execute()
-    )
-    return tweets_response.data
+# Budget for the structured profile completion, used for rate limiting
+PROFILE_OUTPUT_TOKENS = 500
+# Hard cap on the estimated size of the compiled profile prompt
+PROFILE_PROMPT_TOKENS = int(os.getenv("PROFILE_PROMPT_TOKENS", "3000"))
 
 
-def get_recent_replies(user_id, m):
-    """Fetch the most recent m replies for a user."""
-    replies_response = (
-        supabase.from_("Reply")
-        .select("*, Tweet(body, images)")
-        .eq("userId", user_id)
-        .order("createdAt", desc=True)
-        .limit(m)
-        .execute()
-    )
+def _recent(table, columns, user_id, limit, since=None):
+    query = supabase.from_(table).select(columns).eq("userId", user_id)
+    if since is not None:
+        query = query.gt("createdAt", since)
+    return query.order("createdAt", desc=True).limit(limit).execute().data
 
-    return replies_response.data
 
+def get_recent_tweets(user_id, n, since=None):
+    """Fetch the most recent n tweets for a user, only those after `since` if given."""
+    return _recent("Tweet", "*", user_id, n, since)
 
-def get_recent_likes(user_id, l):
-    """Fetch the most recent l liked tweets for a user."""
-    likes_response = (
-        supabase.from_("Like")
-        .select("*, Tweet(body, images)")
-        .eq("userId", user_id)
-        .order("createdAt", desc=True)
-        .limit(l)
-        .execute()
-    )
 
-    return likes_response.data
+def get_recent_replies(user_id, m, since=None):
+    """Fetch the most recent m replies for a user, only those after `since` if given."""
+    return _recent("Reply", "*, Tweet(body, images)", user_id, m, since)
 
 
-def analyze_user_data(user_id, n_tweets, m_replies, l_likes):
-    # Fetch recent tweets, replies, and likes
-    recent_tweets = get_recent_tweets(user_id, n_tweets)
-    recent_replies = get_recent_replies(user_id, m_replies)
-    recent_likes = get_recent_likes(user_id, l_likes)
+def get_recent_likes(user_id, l, since=None):
+    """Fetch the most recent l liked tweets for a user, only those after `since` if given."""
+    return _recent("Like", "*, Tweet(body, images)", user_id, l, since)
 
-    prev_profile = {}
 
+def _newest(rows, default=None):
+    return max((row["createdAt"] for row in rows), default=default)
+
+
+def get_previous_profile(user_id):
+    """The user's current UserProfile row, or {} if there is none."""
     try:
         prev_profile_response = (
             supabase.from_("UserProfile")
@@ -87,97 +93,202 @@ def analyze_user_data(user_id, n_tweets, m_replies, l_likes):
         )
     except Exception as e:
         prev_profile_response = None
-        print(e)
+        logger.warning("Error fetching previous profile: %s", e)
 
     if prev_profile_response:
-        prev_profile = prev_profile_response.data
+        return prev_profile_response.data
+    return {}
+
+
+def fetch_user_activity(user_id, n_tweets, m_replies, l_likes, since=None):
+    """Database reads behind `analyze_user_data`: recent activity and the previous profile."""
+    since = since or {}
+    return {
+        "tweets": get_recent_tweets(user_id, n_tweets, since.get("tweets")),
+        "replies": get_recent_replies(user_id, m_replies, since.get("replies")),
+        "likes": get_recent_likes(user_id, l_likes, since.get("likes")),
+        "prevProfile": get_previous_profile(user_id),
+        "since": since,
+    }
 
-    # Initialize cache for image descriptions
+
+def get_recent_activity_many(table, user_ids, per_user, since=None):
+    """Newest `per_user` rows of `table` for each of `user_ids`, grouped by user.
+
+    One `recent_activity` call (see the matching migration) replaces a query
+    per user. `since` maps a user id to the createdAt after which to read.
+    Reply and Like rows embed their tweet's body and images like
+    `get_recent_replies` / `get_recent_likes`.
+    """
+    rows = (
+        supabase.rpc(
+            "recent_activity",
+            {
+                "activity": table,
+                "user_ids": user_ids,
+                "per_user": per_user,
+                "since": since or {},
+            },
+        )
+        .execute()
+        .data
+    )
+    grouped = {user_id: [] for user_id in user_ids}
+    for row in rows or []:
+        grouped[row["userId"]].append(row)
+    for user_rows in grouped.values():
+        user_rows.sort(key=lambda row: row["createdAt"], reverse=True)
+    return grouped
+
+
+def fetch_users_activity(user_ids, n_tweets, m_replies, l_likes, since=None):
+    """`fetch_user_activity` plus `fetch_user_info` for many users at once.
+
+    `since` maps each user id to its watermarks. Users are read
+    PROFILE_FETCH_BATCH_SIZE at a time with one query per activity table plus
+    one UserProfile and one User query, rather than five queries per user.
+    Returns {user_id: activity}, with the User row under "user" (None if the
+    user doesn't exist).
+    """
+    since = since or {}
+    limits = {"tweets": n_tweets, "replies": m_replies, "likes": l_likes}
+    activities = {}
+    for start in range(0, len(user_ids), PROFILE_FETCH_BATCH_SIZE):
+        chunk = list(user_ids[start : start + PROFILE_FETCH_BATCH_SIZE])
+        for user_id in chunk:
+            activities[user_id] = {
+                "prevProfile": {},
+                "since": since.get(user_id) or {},
+                "user": None,
+            }
+        for kind, table in ACTIVITY_TABLES.items():
+            cutoffs = {
+                user_id: activities[user_id]["since"][kind]
+                for user_id in chunk
+                if activities[user_id]["since"].get(kind)
+            }
+            grouped = get_recent_activity_many(table, chunk, limits[kind], cutoffs)
+            for user_id, rows in grouped.items():
+                activities[user_id][kind] = rows
+
+        profiles = (
+            supabase.from_("UserProfile").select("*").in_("userId", chunk).execute()
+        )
+        for row in profiles.data:
+            activities[row["userId"]]["prevProfile"] = row
+        users = (
+            supabase.from_("User")
+            .select("id, name, bio, profileImage")
+            .in_("id", chunk)
+            .execute()
+        )
+        for row in users.data:
+            activities[row["id"]]["user"] = row
+    return activities
+
+
+def analyze_user_data(user_id, n_tweets, m_replies, l_likes, since=None):
+    """Analyze a user's recent activity.
+
+    `since` maps "tweets"/"replies"/"likes" to the newest createdAt already
+    analyzed, so only newer items are fetched. The result's "watermarks" hold
+    the new values to store once the profile has been updated.
+    """
+    activity = fetch_user_activity(user_id, n_tweets, m_replies, l_likes, since)
+    return enrich_user_activity(activity)
+
+
+def enrich_user_activity(activity):
+    """Keyword and image analysis of the rows returned by `fetch_user_activity`."""
+    since = activity["since"]
+    recent_tweets = activity["tweets"]
+    recent_replies = activity["replies"]
+    recent_likes = activity["likes"]
 
     all_analysis = {
         "tweets": [],
         "replies": [],
         "likes": [],
-        "prevProfile": prev_profile,
+        "prevProfile": activity["prevProfile"],
+        "watermarks": {
+            "tweets": _newest(recent_tweets, since.get("tweets")),
+            "replies": _newest(recent_replies, since.get("replies")),
+            "likes": _newest(recent_likes, since.get("likes")),
+        },
     }
 
+    # Tweets the user posted, replied to or liked, enriched once per tweet id
+    tweets = {
+        tweet["id"]: (tweet.get("body"), tweet.get("images")) for tweet in recent_tweets
+    }
+    for row in recent_replies + recent_likes:
+        tweet = row.get("Tweet") or {}
+        tweets[row["tweetId"]] = (tweet.get("body"), tweet.get("images"))
+    enriched = tweet_enricher.enrich_many(tweets)
+
+    # Reply bodies are the user's own text, so their keywords aren't per tweet
+    reply_texts = [reply.get("body", "") for reply in recent_replies]
+    keywords_by_text = dict(zip(reply_texts, get_keywords_many(reply_texts)))
+
     # Analyze tweets
     for tweet in recent_tweets:
-        text = tweet.get("body", "")
-        keywords = get_keywords(text)
-        images = tweet.get("images", [])
-        images = [img for img in images if img != ""]
-        img_descriptions = []
-        for img_url in images:
-            try:
-                path = download_image_from_url(img_url, "app/cache")
-                img_descriptions.append(
-                    get_image_description_with_cache(path, image_cache)
-                )
-            except:
-                pass
+        record = enriched[tweet["id"]]
         all_analysis["tweets"].append(
-            {"text": text, "keywords": keywords, "image_descriptions": img_descriptions}
+            {
+                "text": tweet.get("body", ""),
+                "keywords": record["keywords"],
+                "image_descriptions": record["image_descriptions"],
+            }
         )
 
     # Analyze replies
     for reply in recent_replies:
         text = reply.get("body", "")
-        keywords = get_keywords(text)
-        tweet_images = reply.get("Tweet", {}).get("images", [])
-
-        images = [img for img in tweet_images if img != ""]
-        img_descriptions = []
-        for img_url in images:
-            try:
-                path = download_image_from_url(img_url, "app/cache")
-                img_descriptions.append(
-                    get_image_description_with_cache(path, image_cache)
-                )
-            except:
-                pass
-
         all_analysis["replies"].append(
-            {"text": text, "keywords": keywords, "image_descriptions": img_descriptions}
+            {
+                "text": text,
+                "keywords": keywords_by_text[text],
+                "image_descriptions": enriched[reply["tweetId"]]["image_descriptions"],
+            }
         )
 
     # Analyze likes
     for like in recent_likes:
-        tweet = like.get("Tweet", {})
-        text = tweet.get("body", "")
-        keywords = get_keywords(text)
-        images = tweet.get("images", [])
-
-        images = [img for img in images if img != ""]
-        img_descriptions = []
-        for img_url in images:
-            try:
-                path = download_image_from_url(img_url, "app/cache")
-                img_descriptions.append(
-                    get_image_description_with_cache(path, image_cache)
-                )
-            except:
-                pass
-
+        record = enriched[like["tweetId"]]
         all_analysis["likes"].append(
-            {"text": text, "keywords": keywords, "image_descriptions": img_descriptions}
+            {
+                "text": (like.get("Tweet") or {}).get("body", ""),
+                "keywords": record["keywords"],
+                "image_descriptions": record["image_descriptions"],
+            }
         )
 
     return all_analysis
 
 
-def analyze_user_profile(user_id):
-    # Fetch user information from Supabase
-    user_response = (
+def profile_hash(user_data):
+    """Hash of the User fields that feed the profile analysis."""
+    fields = [user_data.get(key) or "" for key in ("name", "bio", "profileImage")]
+    return hashlib.sha1("\x1f".join(fields).encode("utf-8")).hexdigest()
+
+
+def fetch_user_info(user_id):
+    """The User fields that feed the profile analysis."""
+    return (
         supabase.from_("User")
         .select("name, bio, profileImage")
         .eq("id", user_id)
         .single()
         .execute()
+        .data
     )
 
-    user_data = user_response.data
 
+def analyze_user_profile(user_id):
+    return analyze_user_info(fetch_user_info(user_id))
+
+
+def analyze_user_info(user_data):
     bio = user_data.get("bio", "")
 
     profile_image_url = user_data.get("profileImage")
@@ -187,44 +298,109 @@ def analyze_user_profile(user_id):
         "name": user_data.get("name", ""),
         "bio": bio,
         "bio_keywords": profile_keywords,
+        "profile_hash": profile_hash(user_data),
     }
 
     if profile_image_url != "" and profile_image_url is not None:
-        path = download_image_from_url(profile_image_url, "app/cache")
-        profile_image_description = get_image_description_with_cache(path, image_cache)
+        profile_image_description = image_describer.submit(profile_image_url).result()
         analysis["profile_image_description"] = profile_image_description
 
     return analysis
 
 
-def compile_profile_prompt(analysis, user_profile_analysis):
-    # Combine all tweets, replies, and likes data
-    combined_text = ""
-
-    combined_text += f"Previous user profile data: \n{analysis['prevProfile']}\n\n\n"
-
-    for tweet in analysis["tweets"]:
-        combined_text += f"Tweet: {tweet['text']} \n"
-        combined_text += f"Keywords: {tweet['keywords']} \n"
-        combined_text += f"Images: {tweet['image_descriptions']} \n\n"
+# Fields of a UserProfile row that carry no information for the model
+PROFILE_BOOKKEEPING = ("id", "userId", "createdAt")
 
-    for reply in analysis["replies"]:
-        combined_text += f"Reply: {reply['text']} \n"
-        combined_text += f"Keywords: {reply['keywords']} \n"
-        combined_text += f"Images: {reply['image_descriptions']} \n\n"
 
-    for like in analysis["likes"]:
-        combined_text += f"Liked Tweet: {like['text']} \n"
-        combined_text += f"Keywords: {like['keywords']} \n"
-        combined_text += f"Images: {like['image_descriptions']} \n\n"
+def compile_profile_prompt(analysis, user_profile_analysis, budget=None):
+    """The profile generation prompt, within `budget` tokens (PROFILE_PROMPT_TOKENS).
 
-    # Add user profile analysis
-    combined_text += f"User Bio: {user_profile_analysis['bio']} \n"
-    combined_text += f"User Bio Keywords: {user_profile_analysis['bio_keywords']} \n"
-    if "profile_image_description" in user_profile_analysis.keys():
-        combined_text += f"Profile Image Description: {user_profile_analysis['profile_image_description']} \n"
+    Keywords are merged across items and listed once by frequency, and each
+    distinct image description is listed once and referred to by number. If
+    the budget is exceeded, liked tweets are cut first and the previous
+    profile and bio last. The keywords and images then only cover the items
+    that were kept, and items only refer to images that made it in, so the
+    prompt is rebuilt until nothing more is cut.
+    """
+    previous = {
+        key: value
+        for key, value in (analysis["prevProfile"] or {}).items()
+        if key not in PROFILE_BOOKKEEPING
+    }
+    user_lines = labeled_lines(
+        [
+            ("Bio", user_profile_analysis["bio"]),
+            ("Bio keywords", keyword_terms(user_profile_analysis["bio_keywords"])),
+            ("Profile image", user_profile_analysis.get("profile_image_description")),
+        ]
+    )
 
-    return combined_text
+    def sections(counts, image_limit):
+        """A PromptBuilder over the first `counts[kind]` items of each kind,
+        listing at most `image_limit` images."""
+        images = []
+
+        def image_refs(descriptions):
+            refs = []
+            for description in dedupe(descriptions):
+                if description not in images:
+                    images.append(description)
+                number = images.index(description) + 1
+                if image_limit is None or number <= image_limit:
+                    refs.append(str(number))
+            return f" [images {', '.join(refs)}]" if refs else ""
+
+        keyword_counts = Counter()
+        items = {}
+        for kind in ("tweets", "replies", "likes"):
+            items[kind] = []
+            for item in analysis[kind][: counts[kind]]:
+                keyword_counts.update(
+                    term.lower() for term in dedupe(keyword_terms(item["keywords"]))
+                )
+                items[kind].append(
+                    f"- {compact(item['text'])}"
+                    f"{image_refs(item['image_descriptions'])}"
+                )
+        images = images[:image_limit]
+
+        builder = PromptBuilder(budget or PROFILE_PROMPT_TOKENS)
+        builder.add("previous_profile", compact(previous), 6, "Previous user profile:")
+        builder.add("tweets", items["tweets"], 4, "Tweets:")
+        builder.add("replies", items["replies"], 3, "Replies:")
+        builder.add("likes", items["likes"], 1, "Liked tweets:")
+        builder.add(
+            "keywords",
+            ", ".join(
+                term if count == 1 else f"{term} ({count})"
+                for term, count in keyword_counts.most_common()
+            ),
+            3,
+            "Keywords (occurrences):",
+        )
+        builder.add(
+            "images",
+            [f"{n}. {description}" for n, description in enumerate(images, 1)],
+            2,
+            "Images:",
+        )
+        builder.add("user", user_lines, 5, "User:")
+        return builder, len(images)
+
+    counts = {kind: len(analysis[kind]) for kind in ("tweets", "replies", "likes")}
+    image_limit = None
+    # Every pass keeps at most as many items and images as the last one did,
+    # so this stops once a pass cuts nothing
+    while True:
+        builder, image_count = sections(counts, image_limit)
+        prompt = builder.build()
+        report = builder.report()
+        kept = {kind: report[kind]["lines"] for kind in counts}
+        if kept == counts and report["images"]["lines"] == image_count:
+            break
+        counts, image_limit = kept, report["images"]["lines"]
+    logger.debug("Profile prompt tokens: %s", report)
+    return prompt
 
 
 class UserProfile_BM(BaseModel):
@@ -246,7 +422,9 @@ class UserProfile_BM(BaseModel):
 
 def generate_user_profile(combined_text):
 
-    completion = openai_client.beta.chat.completions.parse(
+    completion = openai_call(
+        "generate_user_profile",
+        openai_client.beta.chat.completions.parse,
         model="gpt-4o-mini",
         messages=[
             {
@@ -268,8 +446,7 @@ def generate_user_profile(combined_text):
         else:
             raise ValueError("Invalid parse")
     except Exception as e:
-        print(message.refusal)
-        print(f"error:{e}")
+        count_error("openai", "generate_user_profile", f"{message.refusal} ({e})")
         return ""
 
 
@@ -291,9 +468,8 @@ def update_user_profile(user_id, profile_json):
         existing_profile_response is not None and existing_profile_response.data
     ):  # If the profile exists, update it
         try:
-            print(f"{profile_json} : {type(profile_json)}")
+            logger.debug("%s : %s", profile_json, type(profile_json))
             profile_json["userId"] = user_id  # Add userId to the new profile
-            profile_json["id"] = str(uuid.uuid4())
 
             update_response = (
                 supabase.from_("UserProfile")
@@ -303,7 +479,7 @@ def update_user_profile(user_id, profile_json):
             )
             # print(f"Profile updated for user: {user_id}")
         except Exception as e:
-            print(f"Error updating profile: {e}")
+            logger.warning("Error updating profile: %s", e)
     else:  # If no profile exists, insert a new one
         try:
             profile_json["userId"] = user_id  # Add userId to the new profile
@@ -312,27 +488,171 @@ def update_user_profile(user_id, profile_json):
             supabase.from_("UserProfile").insert(profile_json).execute()
             # print(f"Profile created for user: {user_id}")
         except Exception as e:
-            print(f"Error creating profile: {e}")
+            logger.warning("Error creating profile: %s", e)
+
+    profile_cache.invalidate(user_id)
 
 
-def analyze_and_update_user_profile(user_id, n_tweets=5, m_replies=3, l_likes=3):
-    """Main function to analyze user data, generate profile, and update it."""
+def build_user_profile(analysis, user_profile_analysis):
+    """Generate the profile fields for an analyzed user with GPT-4o-mini."""
+    combined_text = compile_profile_prompt(analysis, user_profile_analysis)
+    acquire_openai_quota(estimate_tokens(combined_text) + PROFILE_OUTPUT_TOKENS)
+    return json.loads(generate_user_profile(combined_text).__dict__.get("content"))
+
+
+def analyze_and_update_user_profile(
+    user_id, n_tweets=5, m_replies=3, l_likes=3, since=None
+):
+    """Main function to analyze user data, generate profile, and update it.
+
+    Returns the watermarks covering what was analyzed (see `analyze_user_data`).
+    """
 
     # Step 1: Analyze user data (tweets, replies, likes)
-    analysis = analyze_user_data(user_id, n_tweets, m_replies, l_likes)
+    analysis = analyze_user_data(user_id, n_tweets, m_replies, l_likes, since)
 
     # Step 2: Analyze user profile information (bio, name, profile image)
     user_profile_analysis = analyze_user_profile(user_id)
 
-    # Step 3: Compile the analysis data into a single prompt string
-    combined_text = compile_profile_prompt(analysis, user_profile_analysis)
+    # Step 3: Use GPT-4o-mini to generate the user profile JSON
+    profile_data = build_user_profile(analysis, user_profile_analysis)
+
+    # Step 4: Update the user's profile in Supabase
+    update_user_profile(user_id, profile_data)
+
+    logger.info("User profile has been updated successfully.")
+
+    return {**analysis["watermarks"], PROFILE: user_profile_analysis["profile_hash"]}
+
+
+def _human_users(user_ids):
+    """The ids among `user_ids` that belong to human (non-AI) users."""
+    user_ids = list(user_ids)
+    humans = []
+    for start in range(0, len(user_ids), PROFILE_FETCH_BATCH_SIZE):
+        response = (
+            supabase.from_("User")
+            .select("id")
+            .in_("id", user_ids[start : start + PROFILE_FETCH_BATCH_SIZE])
+            .neq("provider", "ai")
+            .execute()
+        )
+        humans.extend(row["id"] for row in response.data)
+    return humans
+
+
+def find_changed_users(store=watermarks):
+    """Human users with activity or profile changes since they were last analyzed.
+
+    Each activity table is scanned only past its global (createdAt, id)
+    cursor, and User only past its (profileUpdatedAt, id) cursor, which a
+    trigger moves when the name, bio or profile image changes; edited users
+    whose profile hash matches the stored one are skipped. Users whose last
+    refresh failed are included again. Returns `(user_ids, cursors)`; store
+    `cursors` under GLOBAL once the users have been processed.
+    """
+    cursors = store.get(GLOBAL)
+    candidates = set(store.find(PROFILE, ""))
+    new_cursors = {}
+    for kind, table in ACTIVITY_TABLES.items():
+        after = decode_cursor(cursors.get(kind))
+        for row in iter_rows(supabase, table, "userId", prefetch=True, after=after):
+            candidates.add(row["userId"])
+            after = row["createdAt"], row["id"]
+        new_cursors[kind] = encode_cursor(after)
+    changed = _human_users(candidates)
+
+    after = decode_cursor(cursors.get(PROFILE))
+    for user in iter_rows(
+        supabase,
+        "User",
+        "id, name, bio, profileImage",
+        where=lambda query: query.neq("provider", "ai"),
+        order_by="profileUpdatedAt",
+        after=after,
+        prefetch=True,
+    ):
+        after = user["profileUpdatedAt"], user["id"]
+        if user["id"] not in candidates and (
+            store.get(user["id"]).get(PROFILE) != profile_hash(user)
+        ):
+            changed.append(user["id"])
+    new_cursors[PROFILE] = encode_cursor(after)
+    return changed, new_cursors
+
+
+def _fetch_stage(jobs):
+    # Jobs from one refresh share their limits and watermark store
+    limits, store = jobs[0]["limits"], jobs[0]["store"]
+    user_ids = [job["userId"] for job in jobs]
+    activities = fetch_users_activity(
+        user_ids, *limits, {user_id: store.get(user_id) for user_id in user_ids}
+    )
+    for job in jobs:
+        activity = activities[job["userId"]]
+        job["user"] = activity.pop("user")
+        job["activity"] = activity
+    return jobs
+
+
+def _enrich_stage(job):
+    if job["user"] is None:
+        raise Exception(f"User {job['userId']} not found")
+    job["analysis"] = enrich_user_activity(job.pop("activity"))
+    job["profileAnalysis"] = analyze_user_info(job.pop("user"))
+    return job
+
+
+def _llm_stage(job):
+    job["profile"] = build_user_profile(job["analysis"], job["profileAnalysis"])
+    return job
+
+
+def _write_stage(job):
+    user_id = job["userId"]
+    update_user_profile(user_id, job["profile"])
+    job["store"].update(
+        user_id,
+        {
+            **job["analysis"]["watermarks"],
+            PROFILE: job["profileAnalysis"]["profile_hash"],
+        },
+    )
 
-    # Step 4: Use GPT-4o-mini to generate the user profile JSON
-    profile_data = json.loads(
-        generate_user_profile(combined_text).__dict__.get("content")
+
+def build_profile_pipeline():
+    """A fresh profile pipeline, so each refresh reports only its own stats."""
+    return Pipeline(
+        [
+            Stage(
+                "fetch",
+                _fetch_stage,
+                PROFILE_FETCH_WORKERS,
+                batch_size=PROFILE_FETCH_BATCH_SIZE,
+            ),
+            Stage("enrich", _enrich_stage, PROFILE_ENRICH_WORKERS, PROFILE_QUEUE_SIZE),
+            Stage("llm", _llm_stage, PROFILE_LLM_WORKERS, PROFILE_QUEUE_SIZE),
+            Stage("write", _write_stage, PROFILE_WRITE_WORKERS, PROFILE_QUEUE_SIZE),
+        ]
     )
 
-    # Step 6: Update the user's profile in Supabase
-    update_user_profile(user_id, profile_data)
 
-    print("User profile has been updated successfully.")
+def refresh_changed_profiles(n_tweets=5, m_replies=3, l_likes=3, store=watermarks):
+    """Re-profile only users with new activity, analyzing only their new items.
+
+    Users stream through a `build_profile_pipeline` pipeline, so one user's LLM call overlaps
+    with the next users' reads and enrichment. Returns the refreshed user ids.
+    """
+    user_ids, cursors = find_changed_users(store)
+    jobs = (
+        {"userId": user_id, "limits": (n_tweets, m_replies, l_likes), "store": store}
+        for user_id in user_ids
+    )
+    pipeline = build_profile_pipeline()
+    completed, failed = pipeline.run(jobs, key=lambda job: job["userId"])
+    for user_id in failed:
+        # A blank profile hash marks them for `find_changed_users` to retry
+        store.update(user_id, {PROFILE: ""})
+    store.update(GLOBAL, cursors)
+    logger.info("Profile pipeline stats: %s", pipeline.stats())
+    return completed
@@ -0,0 +1,108 @@
+import atexit
+import os
+import threading
+import uuid
+from collections import defaultdict
+
+from metrics import logger
+
+
+class CounterAggregator:
+    """Write-behind accumulator for counter columns such as `Tweet.likeCount`.
+
+    Increments are coalesced per (table, id, column) and written in one
+    `increment_counters` RPC call, which applies every delta atomically in the
+    database (see the matching migration). A flush happens every
+    `flush_interval` seconds, as soon as `max_pending` distinct counters are
+    waiting, and at interpreter shutdown.
+
+    Every batch carries an id the function records with the updates. A batch
+    whose call fails is resent unchanged, under the same id, before anything
+    newer, so a call that timed out after committing is not applied twice.
+    """
+
+    def __init__(self, client, flush_interval=2.0, max_pending=500):
+        self.client = client
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = defaultdict(int)
+        self._unconfirmed = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.increments = 0
+        self.writes = 0
+
+    def increment(self, table, row_id, column, delta=1):
+        with self._lock:
+            self._pending[(table, row_id, column)] += delta
+            self.increments += 1
+            pending = len(self._pending)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        if pending >= self.max_pending:
+            self.flush()
+
+    def flush(self):
+        """Write every pending delta; a failed batch is resent on the next flush."""
+        with self._flush_lock:
+            if self._unconfirmed is not None:
+                if not self._send(*self._unconfirmed):
+                    return
+                self._unconfirmed = None
+            with self._lock:
+                batch, self._pending = self._pending, defaultdict(int)
+            increments = [
+                {"table": table, "id": row_id, "column": column, "delta": delta}
+                for (table, row_id, column), delta in batch.items()
+                if delta
+            ]
+            if not increments:
+                return
+            batch_id = str(uuid.uuid4())
+            if not self._send(batch_id, increments):
+                self._unconfirmed = (batch_id, increments)
+
+    def _send(self, batch_id, increments):
+        try:
+            response = self.client.rpc(
+                "increment_counters",
+                {"increments": increments, "batch_id": batch_id},
+            ).execute()
+            if getattr(response, "error", None):
+                raise Exception(response.error)
+        except Exception as e:
+            logger.warning("Error flushing counters: %s", e)
+            return False
+        self.writes += 1
+        return True
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "unconfirmed": len(self._unconfirmed[1]) if self._unconfirmed else 0,
+                "increments": self.increments,
+                "writes": self.writes,
+            }
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+
+COUNTER_FLUSH_INTERVAL = float(os.getenv("COUNTER_FLUSH_INTERVAL", "2"))
+COUNTER_FLUSH_SIZE = int(os.getenv("COUNTER_FLUSH_SIZE", "500"))
+
+
+def create_counter_aggregator(client):
+    """Build an aggregator from the environment settings and flush it at exit."""
+    aggregator = CounterAggregator(client, COUNTER_FLUSH_INTERVAL, COUNTER_FLUSH_SIZE)
+    atexit.register(aggregator.close)
+    return aggregator
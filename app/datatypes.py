@@ -1,17 +1,26 @@
-from supabase import create_client
 import os
-from dotenv import load_dotenv
 import uuid
 import requests
-
-load_dotenv()
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+from entity_cache import user_cache, tweet_cache, profile_cache
+from batch_loader import BatchLoader
+from batches import TweetBatch, UserBatch
+from pagination import DEFAULT_PAGE_SIZE, iter_pages
+from counters import create_counter_aggregator
+from bulk_writer import create_bulk_writer
+from clients import supabase
+from download_index import download_file
+from metrics import count_error, logger, track
+
+counter_aggregator = create_counter_aggregator(supabase)
+# Created after the aggregator so it is flushed first at exit and its
+# counter callbacks still reach the aggregator
+bulk_writer = create_bulk_writer(supabase)
 
 # Assuming all classes are defined in the same file
 
+# `User._userProfile` before the profile has been looked up
+_NOT_LOADED = object()
+
 
 class User:
     def __init__(
@@ -55,18 +64,26 @@ class User:
         self.bot_theme = bot_theme  # For AI users
         self.bot_prompt = bot_prompt  # For AI users
 
-        # Load or create the associated profile
-        self.userProfile = (
-            userProfile
-            or UserProfile.get_by_user_id(self.id)
-            or UserProfile.create(self.id)
-        )
+        # The associated profile is loaded on first access (see `userProfile`)
+        self._userProfile = userProfile if userProfile is not None else _NOT_LOADED
+
+    @property
+    def userProfile(self):
+        # None for a user without a stored profile; reading never inserts a
+        # row, `update_profile` creates it
+        if self._userProfile is _NOT_LOADED:
+            self._userProfile = UserProfile.get_by_user_id(self.id)
+        return self._userProfile
+
+    @userProfile.setter
+    def userProfile(self, profile):
+        self._userProfile = profile
 
     @classmethod
     def from_db(cls, user_data):
         return cls(
             id=user_data["id"],
-            username=user_data["username"],
+            username=user_data.get("username"),
             name=user_data.get("name"),
             bio=user_data.get("bio"),
             website=user_data.get("website"),
@@ -87,6 +104,10 @@ class User:
 
     @classmethod
     def get_by_id(cls, user_id):
+        return user_cache.get_or_load(user_id, cls._fetch_by_id)
+
+    @classmethod
+    def _fetch_by_id(cls, user_id):
         response = supabase.table("User").select("*").eq("id", user_id).execute()
         if response.error:
             raise Exception(f"Error fetching user: {response.error}")
@@ -136,7 +157,9 @@ class User:
         response = supabase.table("User").insert(data).execute()
         if response.error:
             raise Exception(f"Error creating user: {response.error}")
-        return cls.from_db(data)
+        user = cls.from_db(data)
+        user_cache.set(user.id, user)
+        return user
 
     def tweet(self, content, images=None):
         # Create a tweet by this user
@@ -159,12 +182,12 @@ class User:
         if response.error:
             raise Exception(f"Error following user: {response.error}")
         # Update following counts
-        supabase.table("User").update({"followingCount": self.followingCount + 1}).eq(
-            "id", self.id
-        ).execute()
-        supabase.table("User").update(
-            {"followersCount": supabase.func("followersCount + 1")}
-        ).eq("id", target_user_id).execute()
+        counter_aggregator.increment("User", self.id, "followingCount")
+        counter_aggregator.increment("User", target_user_id, "followersCount")
+        # `self` may be the instance other readers share through the cache, so
+        # drop both users' entries rather than changing counts in place
+        user_cache.invalidate(self.id)
+        user_cache.invalidate(target_user_id)
         return True
 
     def like_tweet(self, tweet_id):
@@ -186,7 +209,8 @@ class User:
         if response.error:
             raise Exception(f"Error fetching following: {response.error}")
         following_ids = [record["followingId"] for record in response.data]
-        return [User.get_by_id(user_id) for user_id in following_ids]
+        users, _ = user_loader.load_many(following_ids)
+        return users
 
     def get_followers(self):
         response = (
@@ -198,7 +222,8 @@ class User:
         if response.error:
             raise Exception(f"Error fetching followers: {response.error}")
         follower_ids = [record["followerId"] for record in response.data]
-        return [User.get_by_id(user_id) for user_id in follower_ids]
+        users, _ = user_loader.load_many(follower_ids)
+        return users
 
     def get_liked_tweets(self):
         response = (
@@ -207,7 +232,8 @@ class User:
         if response.error:
             raise Exception(f"Error fetching liked tweets: {response.error}")
         tweet_ids = [record["tweetId"] for record in response.data]
-        return [Tweet.get_by_id(tweet_id) for tweet_id in tweet_ids]
+        tweets, _ = tweet_loader.load_many(tweet_ids)
+        return tweets
 
     def get_retweets(self):
         response = (
@@ -216,7 +242,8 @@ class User:
         if response.error:
             raise Exception(f"Error fetching retweets: {response.error}")
         tweet_ids = [record["tweetId"] for record in response.data]
-        return [Tweet.get_by_id(tweet_id) for tweet_id in tweet_ids]
+        tweets, _ = tweet_loader.load_many(tweet_ids)
+        return tweets
 
     def get_bookmarks(self):
         response = (
@@ -225,17 +252,52 @@ class User:
         if response.error:
             raise Exception(f"Error fetching bookmarks: {response.error}")
         tweet_ids = [record["tweetId"] for record in response.data]
-        return [Tweet.get_by_id(tweet_id) for tweet_id in tweet_ids]
+        tweets, _ = tweet_loader.load_many(tweet_ids)
+        return tweets
 
     @classmethod
-    def get_all_users(cls):
+    def get_all_users(cls, with_profiles=False, as_batch=False):
         response = supabase.table("User").select("*").execute()
         if response.error:
             raise Exception(f"Error fetching users: {response.error}")
-        return [cls.from_db(user_data) for user_data in response.data]
+        if as_batch:
+            return UserBatch.from_rows(response.data)
+        users = [cls.from_db(user_data) for user_data in response.data]
+        if with_profiles:
+            # One query for the whole profile table instead of one per user
+            profiles = {profile.user_id: profile for profile in UserProfile.get_all()}
+            for user in users:
+                user.userProfile = profiles.get(user.id)
+        return users
+
+    @classmethod
+    def iter_users(
+        cls, page_size=DEFAULT_PAGE_SIZE, columns="*", prefetch=False, as_batch=False
+    ):
+        """Stream users in (createdAt, id) order, one page in memory at a time.
+
+        Yields User objects, or one UserBatch per page with `as_batch`.
+        """
+        for page in iter_pages(supabase, "User", columns, page_size, prefetch):
+            if as_batch:
+                yield UserBatch.from_rows(page)
+            else:
+                yield from (cls.from_db(user_data) for user_data in page)
+
+    @classmethod
+    def prefetch_profiles(cls, users):
+        """Attach profiles to `users` using chunked queries instead of one per user."""
+        pending = [user for user in users if user._userProfile is _NOT_LOADED]
+        profiles, _ = profile_loader.load_many([user.id for user in pending])
+        profiles = {profile.user_id: profile for profile in profiles}
+        for user in pending:
+            user.userProfile = profiles.get(user.id)
+        return users
 
     def update_profile(self, **kwargs):
         # Update the profile with new information
+        if self.userProfile is None:
+            self.userProfile = UserProfile.create(self.id)
         for key, value in kwargs.items():
             if hasattr(self.userProfile, key):
                 setattr(self.userProfile, key, value)
@@ -256,7 +318,9 @@ class UserProfile:
         occupation=None,
         interests=None,
         created_at=None,
+        id=None,
     ):
+        self.id = id
         self.user_id = user_id
         self.age_group = age_group
         self.gender = gender
@@ -283,10 +347,15 @@ class UserProfile:
             occupation=profile_data.get("occupation"),
             interests=profile_data.get("interests", []),
             created_at=profile_data.get("createdAt"),
+            id=profile_data.get("id"),
         )
 
     @classmethod
     def get_by_user_id(cls, user_id):
+        return profile_cache.get_or_load(user_id, cls._fetch_by_user_id)
+
+    @classmethod
+    def _fetch_by_user_id(cls, user_id):
         response = (
             supabase.table("UserProfile").select("*").eq("userId", user_id).execute()
         )
@@ -297,6 +366,13 @@ class UserProfile:
         else:
             return None
 
+    @classmethod
+    def get_all(cls):
+        response = supabase.table("UserProfile").select("*").execute()
+        if response.error:
+            raise Exception(f"Error fetching user profiles: {response.error}")
+        return [cls.from_db(profile_data) for profile_data in response.data]
+
     @classmethod
     def create(
         cls,
@@ -312,6 +388,7 @@ class UserProfile:
         interests=None,
     ):
         data = {
+            "id": str(uuid.uuid4()),
             "userId": user_id,
             "ageGroup": age_group,
             "gender": gender,
@@ -327,7 +404,9 @@ class UserProfile:
         response = supabase.table("UserProfile").insert(data).execute()
         if response.error:
             raise Exception(f"Error creating user profile: {response.error}")
-        return cls.from_db(data)
+        profile = cls.from_db(data)
+        profile_cache.set(user_id, profile)
+        return profile
 
     def update(self):
         data = {
@@ -349,10 +428,22 @@ class UserProfile:
         )
         if response.error:
             raise Exception(f"Error updating user profile: {response.error}")
+        profile_cache.set(self.user_id, self)
         return True
 
 
 class Tweet:
+    __slots__ = (
+        "id",
+        "user_id",
+        "body",
+        "images",
+        "likeCount",
+        "retweetCount",
+        "replyCount",
+        "createdAt",
+    )
+
     def __init__(
         self,
         id,
@@ -377,8 +468,8 @@ class Tweet:
     def from_db(cls, tweet_data):
         return cls(
             id=tweet_data["id"],
-            user_id=tweet_data["userId"],
-            body=tweet_data["body"],
+            user_id=tweet_data.get("userId"),
+            body=tweet_data.get("body"),
             images=tweet_data.get("images", []),
             likeCount=tweet_data.get("likeCount", 0),
             retweetCount=tweet_data.get("retweetCount", 0),
@@ -404,12 +495,18 @@ class Tweet:
         response = supabase.table("Tweet").insert(data).execute()
         if response.error:
             raise Exception(f"Error creating tweet: {response.error}")
-        return cls(
+        tweet = cls(
             id=tweet_id, user_id=user_id, body=body, images=images, createdAt="now()"
         )
+        tweet_cache.set(tweet_id, tweet)
+        return tweet
 
     @classmethod
     def get_by_id(cls, tweet_id):
+        return tweet_cache.get_or_load(tweet_id, cls._fetch_by_id)
+
+    @classmethod
+    def _fetch_by_id(cls, tweet_id):
         response = supabase.table("Tweet").select("*").eq("id", tweet_id).execute()
         if response.error:
             raise Exception(f"Error fetching tweet: {response.error}")
@@ -419,14 +516,30 @@ class Tweet:
             return None
 
     @classmethod
-    def get_all_tweets(cls):
+    def get_all_tweets(cls, as_batch=False):
         response = supabase.table("Tweet").select("*").execute()
         if response.error:
             raise Exception(f"Error fetching tweets: {response.error}")
+        if as_batch:
+            return TweetBatch.from_rows(response.data)
         return [cls.from_db(tweet_data) for tweet_data in response.data]
 
     @classmethod
-    def get_recent_tweets(cls, limit=10):
+    def iter_tweets(
+        cls, page_size=DEFAULT_PAGE_SIZE, columns="*", prefetch=False, as_batch=False
+    ):
+        """Stream tweets in (createdAt, id) order, one page in memory at a time.
+
+        Yields Tweet objects, or one TweetBatch per page with `as_batch`.
+        """
+        for page in iter_pages(supabase, "Tweet", columns, page_size, prefetch):
+            if as_batch:
+                yield TweetBatch.from_rows(page)
+            else:
+                yield from (cls.from_db(tweet_data) for tweet_data in page)
+
+    @classmethod
+    def get_recent_tweets(cls, limit=10, as_batch=False):
         response = (
             supabase.table("Tweet")
             .select("*")
@@ -436,6 +549,8 @@ class Tweet:
         )
         if response.error:
             raise Exception(f"Error fetching tweets: {response.error}")
+        if as_batch:
+            return TweetBatch.from_rows(response.data)
         return [cls.from_db(tweet_data) for tweet_data in response.data]
 
     def get_replies(self):
@@ -451,7 +566,8 @@ class Tweet:
         if response.error:
             raise Exception(f"Error fetching likes: {response.error}")
         user_ids = [record["userId"] for record in response.data]
-        return [User.get_by_id(user_id) for user_id in user_ids]
+        users, _ = user_loader.load_many(user_ids)
+        return users
 
     def get_retweets(self):
         response = (
@@ -460,7 +576,8 @@ class Tweet:
         if response.error:
             raise Exception(f"Error fetching retweets: {response.error}")
         user_ids = [record["userId"] for record in response.data]
-        return [User.get_by_id(user_id) for user_id in user_ids]
+        users, _ = user_loader.load_many(user_ids)
+        return users
 
     def like(self, user_id):
         Like.create(user_id=user_id, tweet_id=self.id)
@@ -473,6 +590,8 @@ class Tweet:
 
 
 class Reply:
+    __slots__ = ("id", "user_id", "tweet_id", "body", "images", "createdAt")
+
     def __init__(self, id, user_id, tweet_id, body, images=None, createdAt=None):
         self.id = id
         self.user_id = user_id
@@ -482,7 +601,18 @@ class Reply:
         self.createdAt = createdAt
 
     @classmethod
-    def create(cls, user_id, tweet_id, body, images=None):
+    def from_db(cls, reply_data):
+        return cls(
+            id=reply_data["id"],
+            user_id=reply_data["userId"],
+            tweet_id=reply_data["tweetId"],
+            body=reply_data.get("body"),
+            images=reply_data.get("images", []),
+            createdAt=reply_data.get("createdAt"),
+        )
+
+    @classmethod
+    def create(cls, user_id, tweet_id, body, images=None, buffered=False):
         if images is None:
             images = []
         reply_id = str(uuid.uuid4())
@@ -494,13 +624,14 @@ class Reply:
             "images": images,
             "createdAt": "now()",
         }
+        if buffered:
+            return bulk_writer.submit(
+                "Reply", data, cls.from_db, lambda reply: cls._count(tweet_id)
+            )
         response = supabase.table("Reply").insert(data).execute()
         if response.error:
             raise Exception(f"Error creating reply: {response.error}")
-        # Increment reply count
-        supabase.table("Tweet").update(
-            {"replyCount": supabase.func("replyCount + 1")}
-        ).eq("id", tweet_id).execute()
+        cls._count(tweet_id)
         return cls(
             id=reply_id,
             user_id=user_id,
@@ -510,8 +641,16 @@ class Reply:
             createdAt="now()",
         )
 
+    @staticmethod
+    def _count(tweet_id):
+        # Increment reply count
+        counter_aggregator.increment("Tweet", tweet_id, "replyCount")
+        tweet_cache.invalidate(tweet_id)
+
 
 class Retweet:
+    __slots__ = ("id", "tweet_id", "user_id", "retweetDate")
+
     def __init__(self, id, tweet_id, user_id, retweetDate):
         self.id = id
         self.tweet_id = tweet_id
@@ -519,7 +658,16 @@ class Retweet:
         self.retweetDate = retweetDate
 
     @classmethod
-    def create(cls, user_id, tweet_id):
+    def from_db(cls, retweet_data):
+        return cls(
+            id=retweet_data["id"],
+            tweet_id=retweet_data["tweetId"],
+            user_id=retweet_data["userId"],
+            retweetDate=retweet_data.get("retweetDate"),
+        )
+
+    @classmethod
+    def create(cls, user_id, tweet_id, buffered=False):
         retweet_id = str(uuid.uuid4())
         data = {
             "id": retweet_id,
@@ -527,19 +675,28 @@ class Retweet:
             "tweetId": tweet_id,
             "retweetDate": "now()",
         }
+        if buffered:
+            return bulk_writer.submit(
+                "Retweet", data, cls.from_db, lambda retweet: cls._count(tweet_id)
+            )
         response = supabase.table("Retweet").insert(data).execute()
         if response.error:
             raise Exception(f"Error creating retweet: {response.error}")
-        # Increment retweet count
-        supabase.table("Tweet").update(
-            {"retweetCount": supabase.func("retweetCount + 1")}
-        ).eq("id", tweet_id).execute()
+        cls._count(tweet_id)
         return cls(
             id=retweet_id, user_id=user_id, tweet_id=tweet_id, retweetDate="now()"
         )
 
+    @staticmethod
+    def _count(tweet_id):
+        # Increment retweet count
+        counter_aggregator.increment("Tweet", tweet_id, "retweetCount")
+        tweet_cache.invalidate(tweet_id)
+
 
 class Like:
+    __slots__ = ("id", "user_id", "tweet_id", "createdAt")
+
     def __init__(self, id, user_id, tweet_id, createdAt):
         self.id = id
         self.user_id = user_id
@@ -547,7 +704,16 @@ class Like:
         self.createdAt = createdAt
 
     @classmethod
-    def create(cls, user_id, tweet_id):
+    def from_db(cls, like_data):
+        return cls(
+            id=like_data["id"],
+            user_id=like_data["userId"],
+            tweet_id=like_data["tweetId"],
+            createdAt=like_data.get("createdAt"),
+        )
+
+    @classmethod
+    def create(cls, user_id, tweet_id, buffered=False):
         like_id = str(uuid.uuid4())
         data = {
             "id": like_id,
@@ -555,23 +721,31 @@ class Like:
             "tweetId": tweet_id,
             "createdAt": "now()",
         }
+        if buffered:
+            return bulk_writer.submit(
+                "Like", data, cls.from_db, lambda like: cls._count(tweet_id)
+            )
         response = supabase.table("Like").insert(data).execute()
         if response.error:
             raise Exception(f"Error creating like: {response.error}")
+        cls._count(tweet_id)
+        return cls(id=like_id, user_id=user_id, tweet_id=tweet_id, createdAt="now()")
+
+    @staticmethod
+    def _count(tweet_id):
         # Increment counts
-        supabase.table("Tweet").update(
-            {"likeCount": supabase.func("likeCount + 1")}
-        ).eq("id", tweet_id).execute()
-        # Update user's likeCount (likes received)
+        counter_aggregator.increment("Tweet", tweet_id, "likeCount")
+        # Update user's likeCount (likes received); the author is usually cached
         tweet = Tweet.get_by_id(tweet_id)
+        tweet_cache.invalidate(tweet_id)
         if tweet:
-            supabase.table("User").update(
-                {"likeCount": supabase.func("likeCount + 1")}
-            ).eq("id", tweet.user_id).execute()
-        return cls(id=like_id, user_id=user_id, tweet_id=tweet_id, createdAt="now()")
+            counter_aggregator.increment("User", tweet.user_id, "likeCount")
+            user_cache.invalidate(tweet.user_id)
 
 
 class Bookmark:
+    __slots__ = ("id", "user_id", "tweet_id", "created_at")
+
     def __init__(self, id, user_id, tweet_id, createdAt):
         self.id = id
         self.user_id = user_id
@@ -588,7 +762,7 @@ class Bookmark:
         )
 
     @classmethod
-    def create(cls, user_id, tweet_id):
+    def create(cls, user_id, tweet_id, buffered=False):
         bookmark_id = str(uuid.uuid4())
         data = {
             "id": bookmark_id,
@@ -596,6 +770,8 @@ class Bookmark:
             "tweetId": tweet_id,
             "createdAt": "now()",
         }
+        if buffered:
+            return bulk_writer.submit("Bookmark", data, cls.from_db)
         response = supabase.table("Bookmark").insert(data).execute()
         if response.error:
             raise Exception(f"Error creating bookmark: {response.error}")
@@ -605,6 +781,8 @@ class Bookmark:
 
 
 class Message:
+    __slots__ = ("id", "sender_id", "recipient_id", "body", "image", "created_at")
+
     def __init__(self, id, sender_id, recipient_id, body, image, createdAt):
         self.id = id
         self.sender_id = sender_id
@@ -625,7 +803,7 @@ class Message:
         )
 
     @classmethod
-    def create(cls, sender_id, recipient_id, body, image=None):
+    def create(cls, sender_id, recipient_id, body, image=None, buffered=False):
         message_id = str(uuid.uuid4())
         data = {
             "id": message_id,
@@ -635,6 +813,8 @@ class Message:
             "image": image,
             "createdAt": "now()",
         }
+        if buffered:
+            return bulk_writer.submit("Message", data, cls.from_db)
         response = supabase.table("Message").insert(data).execute()
         if response.error:
             raise Exception(f"Error creating message: {response.error}")
@@ -649,6 +829,8 @@ class Message:
 
 
 class UserFollow:
+    __slots__ = ("id", "follower_id", "following_id", "created_at")
+
     def __init__(self, id, follower_id, following_id, createdAt):
         self.id = id
         self.follower_id = follower_id
@@ -665,7 +847,7 @@ class UserFollow:
         )
 
     @classmethod
-    def create(cls, follower_id, following_id):
+    def create(cls, follower_id, following_id, buffered=False):
         follow_id = str(uuid.uuid4())
         data = {
             "id": follow_id,
@@ -673,6 +855,8 @@ class UserFollow:
             "followingId": following_id,
             "createdAt": "now()",
         }
+        if buffered:
+            return bulk_writer.submit("UserFollow", data, cls.from_db)
         response = supabase.table("UserFollow").insert(data).execute()
         if response.error:
             raise Exception(f"Error creating follow relationship: {response.error}")
@@ -684,45 +868,39 @@ class UserFollow:
         )
 
 
-def download_image_from_url(supabase_url, output_directory):
+user_loader = BatchLoader(supabase, "User", User.from_db, user_cache)
+tweet_loader = BatchLoader(supabase, "Tweet", Tweet.from_db, tweet_cache)
+profile_loader = BatchLoader(
+    supabase, "UserProfile", UserProfile.from_db, profile_cache, key="userId"
+)
 
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
 
-    filename = os.path.basename(supabase_url)
-    # Remove any query parameters from the filename
-    filename = filename.split("?")[0]
-    # Set the local file path
-    local_file_path = os.path.join(output_directory, filename)
+def download_image_from_url(supabase_url, output_directory):
     try:
-        # Download the image
-        response = requests.get(supabase_url)
-        response.raise_for_status()
-        with open(local_file_path, "wb") as f:
-            f.write(response.content)
-        # print(f"Downloaded image to {local_file_path}")
-        return local_file_path
+        # Streams to a content-addressed file; unchanged URLs are not re-fetched
+        return download_file(supabase_url, output_directory)
     except requests.exceptions.RequestException as e:
-        print(f"Failed to download background image: {e}")
+        logger.warning("Failed to download background image: %s", e)
         return None
 
 
 def set_image_and_get_url(src_file):
 
     if not os.path.isfile(src_file):
-        print("Source file not found.")
+        logger.warning("Source file not found: %s", src_file)
         return None
 
     with open(src_file, "rb") as f:
         data = f.read()
 
     # Upload the image to the storage bucket
-    response = supabase.storage.from_("images").upload(src_file, data)
-    print(response)
+    with track("supabase", "upload images") as call:
+        call.request_bytes = len(data)
+        response = supabase.storage.from_("images").upload(src_file, data)
     if response.status_code != "200":
-        print(f"Error uploading image: {response.__dict__}")
+        count_error("supabase", "upload images", response.__dict__)
     else:
-        print("Image uploaded successfully.")
+        logger.info("Image uploaded successfully.")
 
     # Generate the public URL
     public_url = supabase.storage.from_("images").get_public_url(src_file)
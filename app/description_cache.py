@@ -0,0 +1,174 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+
+
+class DescriptionCache:
+    """Disk-backed map from a content hash to text derived from that content.
+
+    Backed by a SQLite file in WAL mode so several processes (collect_data,
+    generate, view) can read and write the same cache concurrently. Entries
+    older than `max_age` seconds are treated as misses, and once more than
+    `max_entries` are stored the least recently used are deleted. Hits only
+    note their access time in memory; the times are written in one
+    transaction once `touch_batch` keys are waiting, before each eviction and
+    at exit, so reads don't each take the WAL write lock. Supports the
+    `get` / `[]` interface of the plain dict it replaces.
+    """
+
+    def __init__(
+        self, path, max_entries=50000, max_age=30 * 24 * 3600, touch_batch=100
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.touch_batch = touch_batch
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+        self._touched = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._connect().executescript("""
+            CREATE TABLE IF NOT EXISTS descriptions (
+                key TEXT PRIMARY KEY,
+                description TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS descriptions_last_used
+                ON descriptions (last_used);
+            """)
+        atexit.register(self.flush)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, default=None):
+        """Return the description stored for `key`, or `default` on a miss."""
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT description, created_at FROM descriptions WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or now - row[1] > self.max_age:
+            with self._lock:
+                self.misses += 1
+            return default
+        with self._lock:
+            self.hits += 1
+            self._touched[key] = now
+            due = len(self._touched) >= self.touch_batch
+        if due:
+            self.flush()
+        return row[0]
+
+    def flush(self):
+        """Write the access times of the entries read since the last flush."""
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        if not touched:
+            return
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "UPDATE descriptions SET last_used = MAX(last_used, ?) WHERE key = ?",
+                [(used, key) for key, used in touched.items()],
+            )
+
+    def set(self, key, description):
+        if not description:
+            return
+        now = time.time()
+        self._connect().execute(
+            "INSERT OR REPLACE INTO descriptions VALUES (?, ?, ?, ?)",
+            (key, description, now, now),
+        )
+        with self._lock:
+            self._writes_since_evict += 1
+            due = self._writes_since_evict >= 100
+            if due:
+                self._writes_since_evict = 0
+        if due:
+            self.evict()
+
+    def __getitem__(self, key):
+        description = self.get(key)
+        if description is None:
+            raise KeyError(key)
+        return description
+
+    def __setitem__(self, key, description):
+        self.set(key, description)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def evict(self):
+        """Delete expired entries and trim the cache down to `max_entries`."""
+        self.flush()
+        conn = self._connect()
+        expired = conn.execute(
+            "DELETE FROM descriptions WHERE created_at < ?",
+            (time.time() - self.max_age,),
+        ).rowcount
+        trimmed = conn.execute(
+            """
+            DELETE FROM descriptions WHERE key IN (
+                SELECT key FROM descriptions ORDER BY last_used DESC
+                LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_entries,),
+        ).rowcount
+        with self._lock:
+            self.evictions += expired + trimmed
+        return expired + trimmed
+
+    def clear(self):
+        with self._lock:
+            self._touched.clear()
+        self._connect().execute("DELETE FROM descriptions")
+
+    def stats(self):
+        size, stored_bytes = (
+            self._connect()
+            .execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(description)), 0) FROM descriptions"
+            )
+            .fetchone()
+        )
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": size,
+                "bytes": stored_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+IMAGE_CACHE_PATH = os.getenv(
+    "IMAGE_CACHE_PATH",
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "image_descriptions.sqlite3"
+    ),
+)
+IMAGE_CACHE_MAX_ENTRIES = int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", "50000"))
+IMAGE_CACHE_MAX_AGE = float(os.getenv("IMAGE_CACHE_MAX_AGE", str(30 * 24 * 3600)))
+
+image_cache = DescriptionCache(
+    IMAGE_CACHE_PATH, IMAGE_CACHE_MAX_ENTRIES, IMAGE_CACHE_MAX_AGE
+)
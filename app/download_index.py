@@ -0,0 +1,173 @@
+import hashlib
+import mimetypes
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from io import BytesIO
+
+import transport
+from file_cache import app_cache
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class DownloadIndex:
+    """Persistent map from URL to the content last downloaded from it.
+
+    Each entry keeps the content hash, the validators the server sent (ETag and
+    Last-Modified) and, when the body was saved, the local path, so later
+    requests for the URL can be made conditional.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS downloads ("
+            "url TEXT PRIMARY KEY, content_hash TEXT NOT NULL, etag TEXT, "
+            "last_modified TEXT, path TEXT, fetched_at REAL NOT NULL)"
+        )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def get(self, url):
+        row = (
+            self._connect()
+            .execute("SELECT * FROM downloads WHERE url = ?", (url,))
+            .fetchone()
+        )
+        return dict(row) if row is not None else None
+
+    def record(self, url, content_hash, response, path=None):
+        """Store what `response` for `url` contained.
+
+        A None `path` keeps the stored one while the content is unchanged and
+        clears it otherwise, so a stale file is never served for a later 304.
+        """
+        self._connect().execute(
+            "INSERT INTO downloads VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(url) DO UPDATE SET content_hash = excluded.content_hash, "
+            "etag = excluded.etag, last_modified = excluded.last_modified, "
+            "path = CASE WHEN excluded.content_hash IS NOT downloads.content_hash "
+            "THEN excluded.path ELSE COALESCE(excluded.path, downloads.path) END, "
+            "fetched_at = excluded.fetched_at",
+            (
+                url,
+                content_hash,
+                response.headers.get("ETag"),
+                response.headers.get("Last-Modified"),
+                path,
+                time.time(),
+            ),
+        )
+
+
+def conditional_headers(entry):
+    headers = {}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def read_body(response):
+    """Stream `response`'s body into memory, returning `(data, md5_hex)`."""
+    digest = hashlib.md5()
+    buffer = BytesIO()
+    for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+        digest.update(chunk)
+        buffer.write(chunk)
+    return buffer.getvalue(), digest.hexdigest()
+
+
+def revalidate(url):
+    """Ask the server whether `url` changed since it was last downloaded.
+
+    Returns `(content_hash, data)`: the stored hash and None when the server
+    answers 304, or the new body and its hash (recorded in the index) when it
+    sends one, so the caller doesn't download it a second time. A URL with
+    no stored validators gives `(None, None)` without a request.
+    """
+    entry = download_index.get(url)
+    headers = conditional_headers(entry)
+    if not headers:
+        return None, None
+    with transport.get(url, headers=headers, stream=True) as response:
+        if response.status_code == 304:
+            return entry["content_hash"], None
+        response.raise_for_status()
+        data, content_hash = read_body(response)
+    download_index.record(url, content_hash, response)
+    return content_hash, data
+
+
+def _extension(url, response):
+    extension = os.path.splitext(os.path.basename(url).split("?")[0])[1]
+    if extension:
+        return extension.lower()
+    content_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+    return mimetypes.guess_extension(content_type) or ""
+
+
+def download_file(url, output_directory):
+    """Download `url` into `output_directory`, named by the md5 of its content.
+
+    A URL seen before is fetched conditionally; if the server answers 304 and
+    the stored file is still there, no body is transferred. Otherwise the body
+    streams into a temporary file while being hashed, and is discarded when a
+    file with the same content is already stored. Returns the local path.
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    entry = download_index.get(url)
+    if entry and not (entry["path"] and os.path.exists(entry["path"])):
+        entry = None
+
+    with transport.get(
+        url, headers=conditional_headers(entry), stream=True
+    ) as response:
+        if entry and response.status_code == 304:
+            app_cache.touch(entry["path"])
+            return entry["path"]
+        response.raise_for_status()
+
+        digest = hashlib.md5()
+        with tempfile.NamedTemporaryFile(
+            dir=output_directory, suffix=".part", delete=False
+        ) as tmp:
+            try:
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            except BaseException:
+                tmp.close()
+                os.remove(tmp.name)
+                raise
+
+        content_hash = digest.hexdigest()
+        path = os.path.join(output_directory, content_hash + _extension(url, response))
+        if os.path.exists(path):
+            os.remove(tmp.name)
+            app_cache.touch(path)
+        else:
+            os.replace(tmp.name, path)
+            app_cache.register(path)
+        download_index.record(url, content_hash, response, path)
+    return path
+
+
+DOWNLOAD_INDEX_PATH = os.getenv(
+    "DOWNLOAD_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "downloads.sqlite3"),
+)
+
+download_index = DownloadIndex(DOWNLOAD_INDEX_PATH)
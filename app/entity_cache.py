@@ -0,0 +1,92 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class EntityCache:
+    """Read-through identity map with a TTL and LRU eviction.
+
+    Entries are keyed by primary key and hold the entity object itself, so two
+    lookups of the same id inside the TTL return the very same instance.
+    """
+
+    def __init__(self, max_size=1024, ttl=60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached entity for `key`, or None on a miss or expiry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Store `value` under `key`, evicting the least recently used entries."""
+        if value is None:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        """Return the cached entity for `key`, calling `loader(key)` on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = loader(key)
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+ENTITY_CACHE_SIZE = int(os.getenv("ENTITY_CACHE_SIZE", "4096"))
+ENTITY_CACHE_TTL = float(os.getenv("ENTITY_CACHE_TTL", "60"))
+
+user_cache = EntityCache(ENTITY_CACHE_SIZE, ENTITY_CACHE_TTL)
+tweet_cache = EntityCache(ENTITY_CACHE_SIZE, ENTITY_CACHE_TTL)
+profile_cache = EntityCache(ENTITY_CACHE_SIZE, ENTITY_CACHE_TTL)
+
+
+def entity_cache_stats():
+    """Hit/miss counters for every entity cache, keyed by table name."""
+    return {
+        "User": user_cache.stats(),
+        "Tweet": tweet_cache.stats(),
+        "UserProfile": profile_cache.stats(),
+    }
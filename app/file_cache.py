@@ -0,0 +1,220 @@
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+INDEX_NAME = ".index.sqlite3"
+# Temp files older than this are assumed abandoned by a crashed writer
+STALE_PART_AGE = 3600
+
+
+def atomic_write(path, data):
+    """Write `data` to `path` via a temp file and rename; readers never see half a file."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir=directory, suffix=".part", delete=False
+    ) as tmp:
+        try:
+            tmp.write(data)
+        except BaseException:
+            tmp.close()
+            os.remove(tmp.name)
+            raise
+    os.replace(tmp.name, path)
+
+
+class FileCache:
+    """Byte-bounded file cache over a directory such as app/cache.
+
+    File sizes, last access times and hit counts live in a SQLite index inside
+    the directory, so recording an access is one indexed UPDATE rather than a
+    directory scan. Whenever the tracked bytes exceed `max_bytes`, files are
+    deleted least recently used first (`policy="lru"`) or least frequently
+    used first (`policy="lfu"`) until the cache is back under budget.
+    Only files handed to `write` / `register` are managed; anything else in
+    the directory (e.g. files checked into it) is never evicted. `compact`
+    reconciles the index with what is actually on disk.
+    """
+
+    def __init__(self, directory, max_bytes=1 << 30, policy="lru"):
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"Unknown cache policy: {policy}")
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "name TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+            "last_access REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+        )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                os.path.join(self.directory, INDEX_NAME),
+                timeout=30,
+                isolation_level=None,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _name(self, path):
+        """Name of `path` inside the cache, or None if it lies outside it."""
+        path = os.path.abspath(path)
+        if os.path.dirname(path) != self.directory:
+            return None
+        return os.path.basename(path)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def get(self, name):
+        """Path of the cached file `name`, recording the access, or None."""
+        path = self.path(name)
+        updated = (
+            self._connect()
+            .execute(
+                "UPDATE files SET last_access = ?, hits = hits + 1 WHERE name = ?",
+                (time.time(), name),
+            )
+            .rowcount
+        )
+        found = updated and os.path.exists(path)
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return path if found else None
+
+    def touch(self, path):
+        """Record an access to `path` if it is a cached file."""
+        name = self._name(path)
+        if name is not None:
+            self.get(name)
+
+    def register(self, path):
+        """Start tracking a file written into the cache directory by someone else."""
+        name = self._name(path)
+        if name is None or not os.path.exists(path):
+            return
+        # The write counts as a use, so LFU doesn't evict a file just created
+        self._connect().execute(
+            "INSERT INTO files (name, size, last_access, hits) VALUES (?, ?, ?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET size = excluded.size, "
+            "last_access = excluded.last_access",
+            (name, os.path.getsize(path), time.time()),
+        )
+        self.evict()
+
+    def write(self, path, data):
+        """Atomically write `data` to `path`, tracking it when inside the cache."""
+        atomic_write(path, data)
+        self.register(path)
+
+    def size(self):
+        return (
+            self._connect()
+            .execute("SELECT COALESCE(SUM(size), 0), COUNT(*) FROM files")
+            .fetchone()
+        )
+
+    def evict(self, max_bytes=None):
+        """Delete files until the cache holds at most `max_bytes` (default budget)."""
+        budget = self.max_bytes if max_bytes is None else max_bytes
+        total, _ = self.size()
+        if total <= budget:
+            return 0
+        order = "last_access" if self.policy == "lru" else "hits, last_access"
+        conn = self._connect()
+        freed = 0
+        for name, size in conn.execute(
+            f"SELECT name, size FROM files ORDER BY {order}"
+        ).fetchall():
+            if total - freed <= budget:
+                break
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+            conn.execute("DELETE FROM files WHERE name = ?", (name,))
+            freed += size
+            with self._lock:
+                self.evicted_files += 1
+                self.evicted_bytes += size
+        return freed
+
+    def compact(self):
+        """Reconcile the index with the directory, then evict down to budget.
+
+        Index rows whose file is gone are dropped, sizes of tracked files are
+        refreshed, and `.part` files left by interrupted writes more than
+        STALE_PART_AGE seconds ago are removed. Untracked files are left alone.
+        """
+        conn = self._connect()
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".part"):
+                if time.time() - entry.stat().st_mtime > STALE_PART_AGE:
+                    os.remove(entry.path)
+        for (name,) in conn.execute("SELECT name FROM files").fetchall():
+            try:
+                size = os.path.getsize(self.path(name))
+            except FileNotFoundError:
+                conn.execute("DELETE FROM files WHERE name = ?", (name,))
+                continue
+            conn.execute("UPDATE files SET size = ? WHERE name = ?", (size, name))
+        self.evict()
+        return self.stats()
+
+    def stats(self):
+        total, files = self.size()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "files": files,
+                "bytes": total,
+                "max_bytes": self.max_bytes,
+                "policy": self.policy,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evicted_files": self.evicted_files,
+                "evicted_bytes": self.evicted_bytes,
+            }
+
+
+FILE_CACHE_DIR = os.getenv(
+    "FILE_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache"),
+)
+FILE_CACHE_MAX_BYTES = int(os.getenv("FILE_CACHE_MAX_BYTES", str(1 << 30)))
+FILE_CACHE_POLICY = os.getenv("FILE_CACHE_POLICY", "lru")
+
+app_cache = FileCache(FILE_CACHE_DIR, FILE_CACHE_MAX_BYTES, FILE_CACHE_POLICY)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the FILE_CACHE_DIR directory.")
+    parser.add_argument("command", choices=["compact", "stats"])
+    parser.add_argument(
+        "--max-bytes", type=int, help="Evict down to this many bytes instead"
+    )
+    args = parser.parse_args()
+    if args.command == "compact":
+        app_cache.compact()
+        if args.max_bytes is not None:
+            app_cache.evict(args.max_bytes)
+    print(json.dumps(app_cache.stats(), indent=2))
@@ -1,6 +1,11 @@
-from supabase import create_client, Client
 from datatypes import *
 from analyze import *
+from clients import supabase, openai_client
+from description_cache import image_cache
+import transport
+from file_cache import app_cache
+from metrics import logger, openai_call
+from prompt_builder import PromptBuilder, compact, labeled_lines, profile_lines
 import requests
 import os
 from openai import OpenAI
@@ -16,17 +21,13 @@ import random
 load_dotenv(
     os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env")
 )
-image_cache = {}
-
-# Initialize Supabase Client
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 AYFIE_API_KEY = os.getenv("AYFIE_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 SD_API_KEY = os.getenv("SD_API_KEY")
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+
+# Hard cap on the estimated size of a targeted content prompt
+TARGETED_PROMPT_TOKENS = int(os.getenv("TARGETED_PROMPT_TOKENS", "1000"))
 
 
 def generate_targeted_content(author_user_id, target_user_id, prompt_topic=None):
@@ -77,37 +78,42 @@ def generate_targeted_content(author_user_id, target_user_id, prompt_topic=None)
     #    return f"Error: Target user profile not found for user ID {target_user_id}"
 
     # Step 3: Construct the prompt for GPT-4o-mini
-    prompt = f"""
-    You are {author_name}. Your bio says: "{author_bio}".
-    You are writing a personalized post, written in a tone and formality level corresponding to your image as described in your bio. This personalized post is directed for a person with the following profile:
-
-
-    Name: {target_name}
-    Username: {target_username}
-    Bio: {target_bio}
-    
-    Age Group: {target_profile.get('ageGroup', 'unknown')}
-    Gender: {target_profile.get('gender', 'unknown')}
-    Race: {target_profile.get('race', 'unknown')}
-    Location: {target_profile.get('location', 'unknown')}
-    Income Range: {target_profile.get('incomeRange', 'unknown')}
-    Relationship Status: {target_profile.get('relationshipStatus', 'unknown')}
-    Education: {target_profile.get('education', 'unknown')}
-    Occupation: {target_profile.get('occupation', 'unknown')}
-    Interests: {', '.join(target_profile.get('interests', []))}
-    Additional Facts: {', '.join(target_profile.get('facts', []))}
-
-    """
-
+    builder = PromptBuilder(TARGETED_PROMPT_TOKENS)
+    builder.add(
+        "author",
+        [
+            f'You are {compact(author_name)}. Your bio says: "{compact(author_bio)}".',
+            "You are writing a personalized post, written in a tone and formality level corresponding to your image as described in your bio. This personalized post is directed for a person with the following profile:",
+        ],
+        10,
+    )
+    builder.add(
+        "target",
+        labeled_lines(
+            [("Name", target_name), ("Username", target_username), ("Bio", target_bio)]
+        )
+        + profile_lines(target_profile),
+        5,
+    )
     if prompt_topic:
-        prompt += f"Post Topic: {prompt_topic}\n"
-
-    prompt += "Write a post with this information in mind. If no post topic is specified, talk about something that interests or relates to the target, but make it subtle. Rather, moreso ensure that whatever you write about is aligned and natural in both content and style described in your bio. For example, someone who's bio mentions that they're a car salesman, should porbably speak in a sales-y way and post ads. etc.\n"
-    prompt += "Do not explicitly tailor your post for the target user, rather, subtley shape your post so that it is aligned to what the target user would like, given their demographics and background.\nAdditionally, ensure you speak in a somewhat blase and casual tone, and be cold and somewhat rude and very blunt.\n"
-    prompt += "Keep your results very short, under 140 characters\n"
+        builder.add("topic", f"Post Topic: {prompt_topic}", 9)
+    builder.add(
+        "instructions",
+        [
+            "Write a post with this information in mind. If no post topic is specified, talk about something that interests or relates to the target, but make it subtle. Rather, moreso ensure that whatever you write about is aligned and natural in both content and style described in your bio. For example, someone who's bio mentions that they're a car salesman, should porbably speak in a sales-y way and post ads. etc.",
+            "Do not explicitly tailor your post for the target user, rather, subtley shape your post so that it is aligned to what the target user would like, given their demographics and background.",
+            "Additionally, ensure you speak in a somewhat blase and casual tone, and be cold and somewhat rude and very blunt.",
+            "Keep your results very short, under 140 characters",
+        ],
+        10,
+    )
+    prompt = builder.build()
+    logger.debug("Targeted content prompt tokens: %s", builder.report())
 
     # Step 4: Use GPT-4o-mini to generate content
-    response = openai_client.chat.completions.create(
+    response = openai_call(
+        "generate_targeted_content",
+        openai_client.chat.completions.create,
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": "You are a personalized content generator."},
@@ -126,7 +132,7 @@ def generate_targeted_content(author_user_id, target_user_id, prompt_topic=None)
 
 def generate_image(prompt, output_path):
 
-    response = requests.post(
+    response = transport.post(
         f"https://api.stability.ai/v2beta/stable-image/generate/core",
         headers={"authorization": f"Bearer {SD_API_KEY}", "accept": "image/*"},
         files={"none": ""},
@@ -137,8 +143,7 @@ def generate_image(prompt, output_path):
     )
 
     if response.status_code == 200:
-        with open(output_path, "wb") as file:
-            file.write(response.content)
+        app_cache.write(output_path, response.content)
     else:
         raise Exception(str(response.json()))
 
@@ -150,7 +155,7 @@ def generate_image_cheap(prompt, output_path):
     if SD_API_KEY is None:
         raise Exception("Missing Stability API key.")
 
-    response = requests.post(
+    response = transport.post(
         f"{api_host}/v1/generation/{engine_id}/text-to-image",
         headers={
             "Content-Type": "application/json",
@@ -173,5 +178,4 @@ def generate_image_cheap(prompt, output_path):
     data = response.json()
 
     for i, image in enumerate(data["artifacts"]):
-        with open(output_path, "wb") as f:
-            f.write(base64.b64decode(image["base64"]))
+        app_cache.write(output_path, base64.b64decode(image["base64"]))
@@ -0,0 +1,157 @@
+import math
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from analyze import describe_image, describe_image_bytes
+from description_cache import image_cache
+from download_index import revalidate
+from image_pipeline import fetch_image
+from metrics import (
+    acquire_openai_quota,
+    count_error,
+    logger,
+    openai_requests,
+    openai_tokens,
+)
+
+# Matches the max_tokens of the vision request in analyze.describe_image
+VISION_MAX_OUTPUT_TOKENS = 400
+
+
+def estimate_vision_tokens(width, height):
+    """Rough prompt + completion tokens for one high-detail image request."""
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    tiles = math.ceil(width * scale / 512) * math.ceil(height * scale / 512)
+    return 85 + 170 * tiles + VISION_MAX_OUTPUT_TOKENS
+
+
+class ImageDescriber:
+    """Describes batches of image URLs concurrently within the OpenAI quota.
+
+    Downloads and vision calls run on a bounded thread pool. Every vision call
+    first takes its share of the OpenAI quota (`acquire_openai_quota`), so
+    bursts queue up instead of hitting 429s. Requests for a
+    URL or image content that is already being described share that work, and
+    finished descriptions go through the persistent description cache.
+    """
+
+    def __init__(self, cache, max_workers=8):
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="images"
+        )
+        self._by_url = {}
+        self._by_hash = {}
+        self._lock = threading.Lock()
+        self.vision_calls = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def _describe_limited(self, prepared):
+        acquire_openai_quota(estimate_vision_tokens(prepared.width, prepared.height))
+        with self._lock:
+            self.vision_calls += 1
+        return describe_image(prepared)
+
+    def _shared(self, table, key, work):
+        """Run `work()` once per `key` in `table`, sharing the result while in flight."""
+        with self._lock:
+            future = table.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            future = Future()
+            table[key] = future
+        try:
+            future.set_result(work())
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                table.pop(key, None)
+        return future
+
+    def _describe_url(self, url):
+        # A URL the server confirms unchanged needs no download on a cache hit,
+        # and a changed one is only downloaded by the revalidation request
+        content_hash, data = revalidate(url)
+        if data is None:
+            if content_hash is not None:
+                description = self.cache.get(content_hash)
+                if description:
+                    return description
+            data, content_hash = fetch_image(url)
+        future = self._shared(
+            self._by_hash,
+            content_hash,
+            lambda: describe_image_bytes(
+                data, content_hash, self.cache, self._describe_limited
+            ),
+        )
+        return future.result()
+
+    def submit(self, url):
+        """Future for the description of `url`."""
+        with self._lock:
+            future = self._by_url.get(url)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            future = Future()
+            self._by_url[url] = future
+
+        def run():
+            try:
+                future.set_result(self._describe_url(url))
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                count_error("images", "describe", f"{url}: {e}")
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._by_url.pop(url, None)
+
+        self._executor.submit(run)
+        return future
+
+    def describe_urls(self, urls):
+        """Map each URL in `urls` to its description; failed images are left out.
+
+        Each failure is counted and logged once by `submit`, however many
+        callers were waiting on it.
+        """
+        futures = {url: self.submit(url) for url in dict.fromkeys(urls) if url}
+        descriptions = {}
+        failed = 0
+        for url, future in futures.items():
+            try:
+                descriptions[url] = future.result()
+            except Exception:
+                failed += 1
+        if failed:
+            logger.warning(
+                "Left out %d of %d images that could not be described",
+                failed,
+                len(futures),
+            )
+        return descriptions
+
+    def stats(self):
+        with self._lock:
+            return {
+                "vision_calls": self.vision_calls,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "in_flight": len(self._by_url),
+                # Shared with every other OpenAI caller
+                "rate_limit_wait": openai_requests.waited + openai_tokens.waited,
+            }
+
+
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "8"))
+
+image_describer = ImageDescriber(image_cache, IMAGE_WORKERS)
@@ -0,0 +1,141 @@
+import base64
+import hashlib
+import os
+from io import BytesIO
+
+from PIL import Image
+
+import transport
+from download_index import download_index, read_body
+from perceptual_index import dhash
+
+# Formats the vision endpoint accepts as-is, with their data-URL mime types
+PASSTHROUGH_MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+    "GIF": "image/gif",
+}
+
+IMAGE_MAX_SIZE = int(os.getenv("IMAGE_MAX_SIZE", "1024"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+# Images that fit but are larger than this are re-encoded to shrink the payload
+IMAGE_PASSTHROUGH_BYTES = int(os.getenv("IMAGE_PASSTHROUGH_BYTES", str(512 * 1024)))
+
+
+class PreparedImage:
+    """An image ready to send to the vision model, plus the hashes of its source."""
+
+    __slots__ = (
+        "content_hash",
+        "perceptual_hash",
+        "mime_type",
+        "data",
+        "width",
+        "height",
+    )
+
+    def __init__(self, content_hash, perceptual_hash, mime_type, data, width, height):
+        self.content_hash = content_hash
+        self.perceptual_hash = perceptual_hash
+        self.mime_type = mime_type
+        self.data = data
+        self.width = width
+        self.height = height
+
+    @property
+    def data_url(self):
+        encoded = base64.b64encode(self.data).decode("utf-8")
+        return f"data:{self.mime_type};base64,{encoded}"
+
+
+def fetch_image(url, save_to=None):
+    """Download `url`, hashing the body as it streams in.
+
+    Returns `(data, md5_hex)`. The bytes only touch disk when `save_to` names a
+    directory, in which case they are also written there by `save_copy`.
+    """
+    with transport.get(url, stream=True) as response:
+        response.raise_for_status()
+        data, content_hash = read_body(response)
+    download_index.record(url, content_hash, response)
+    if save_to is not None:
+        save_copy(url, data, content_hash, save_to)
+    return data, content_hash
+
+
+def save_copy(url, data, content_hash, save_to):
+    """Write `data` into directory `save_to`, named by its md5 `content_hash`.
+
+    Like `download_index.download_file`, so URLs that share a file name don't
+    overwrite each other and one image reached through several URLs is kept
+    once. The extension comes from the URL, else from the image format.
+    Returns the path.
+    """
+    os.makedirs(save_to, exist_ok=True)
+    extension = os.path.splitext(os.path.basename(url).split("?")[0])[1].lower()
+    if not extension:
+        with Image.open(BytesIO(data)) as img:
+            extension = "." + img.format.lower()
+    path = os.path.join(save_to, content_hash + extension)
+    if not os.path.exists(path):
+        with open(path, "wb") as f:
+            f.write(data)
+    return path
+
+
+def read_image(path):
+    """Read `path` once, returning `(data, md5_hex)`."""
+    with open(path, "rb") as f:
+        data = f.read()
+    return data, hashlib.md5(data).hexdigest()
+
+
+def prepare_image(
+    data,
+    content_hash=None,
+    max_width=IMAGE_MAX_SIZE,
+    max_height=IMAGE_MAX_SIZE,
+    quality=IMAGE_JPEG_QUALITY,
+):
+    """Downscale `data` to fit `max_width` x `max_height` and encode it once.
+
+    Images that already fit, are in a format the model accepts and are under
+    IMAGE_PASSTHROUGH_BYTES are passed through untouched with their real mime
+    type. Otherwise JPEGs are decoded at a reduced DCT scale (`draft`) and
+    other formats are shrunk by an integer factor (`reduce`) before the final
+    LANCZOS pass, so the full-size bitmap is never resampled. The result is a
+    single JPEG encode at `quality`.
+    """
+    if content_hash is None:
+        content_hash = hashlib.md5(data).hexdigest()
+    with Image.open(BytesIO(data)) as img:
+        width, height = img.size
+        mime_type = PASSTHROUGH_MIME_TYPES.get(img.format)
+        fits = width <= max_width and height <= max_height
+        if fits and mime_type and len(data) <= IMAGE_PASSTHROUGH_BYTES:
+            return PreparedImage(
+                content_hash, dhash(img), mime_type, data, width, height
+            )
+
+        scale = min(max_width / width, max_height / height, 1.0)
+        target = (max(1, int(width * scale)), max(1, int(height * scale)))
+        if img.format == "JPEG":
+            img.draft("RGB", target)
+        img = img.convert("RGB")
+        factor = min(img.width // target[0], img.height // target[1])
+        if factor >= 2:
+            img = img.reduce(factor)
+        if img.size != target:
+            img = img.resize(target, Image.LANCZOS)
+
+        buff = BytesIO()
+        img.save(buff, format="JPEG", quality=quality, optimize=True)
+        return PreparedImage(
+            content_hash,
+            dhash(img),
+            "image/jpeg",
+            buff.getvalue(),
+            img.width,
+            img.height,
+        )
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+import transport
+from description_cache import DescriptionCache
+from metrics import logger
+
+load_dotenv(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env")
+)
+
+AYFIE_API_KEY = os.getenv("AYFIE_API_KEY")
+AYFIE_KEYWORD_URL = "https://portal.ayfie.com/api/keyword"
+
+
+def keyword_cache_key(text, top_n, ngram_range):
+    """Cache key for one extraction: the text's hash plus the request options."""
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{digest}:{top_n}:{ngram_range[0]}-{ngram_range[1]}"
+
+
+class KeywordService:
+    """Memoizing front end for the Ayfie keyword endpoint.
+
+    Results are stored in a persistent cache keyed by text hash, `top_n` and
+    `ngram_range`, so a liked tweet is only ever extracted once. The endpoint
+    takes a single text per call, so `extract_many` batches on our side: it
+    de-duplicates the texts, answers what it can from the cache and sends the
+    rest through a bounded worker pool over the shared transport. Concurrent
+    requests for the same uncached text share a single call.
+    """
+
+    def __init__(self, cache, max_workers=8):
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="keywords"
+        )
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.coalesced = 0
+
+    def _fetch(self, text, top_n, ngram_range):
+        response = transport.post(
+            AYFIE_KEYWORD_URL,
+            headers={
+                "accept": "application/json",
+                "X-API-KEY": AYFIE_API_KEY,
+                "Content-Type": "application/json",
+            },
+            json={
+                "text": text,
+                "top_n": top_n,
+                "ngram_range": ngram_range,
+                "diversify": False,
+                "diversity": 0.7,
+            },
+        )
+        response.raise_for_status()
+        return response.json().get("result", {})
+
+    def _submit(self, text, top_n, ngram_range):
+        """Return a Future for the keywords of `text`, sharing in-flight calls."""
+        key = keyword_cache_key(text, top_n, ngram_range)
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            future = Future()
+            self._in_flight[key] = future
+
+        def run():
+            try:
+                with self._lock:
+                    self.requests += 1
+                keywords = self._fetch(text, top_n, ngram_range)
+                self.cache[key] = json.dumps(keywords)
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                logger.warning(
+                    "Error in analyzing text: %s\n%s : %s", e, text, type(text)
+                )
+                keywords = {}
+            with self._lock:
+                self._in_flight.pop(key, None)
+            future.set_result(keywords)
+
+        self._executor.submit(run)
+        return future
+
+    def _cached(self, text, top_n, ngram_range):
+        stored = self.cache.get(keyword_cache_key(text, top_n, ngram_range))
+        return json.loads(stored) if stored is not None else None
+
+    def extract(self, text, top_n=5, ngram_range=(1, 1)):
+        return self.extract_many([text], top_n, ngram_range)[0]
+
+    def extract_many(self, texts, top_n=5, ngram_range=(1, 1)):
+        """Keywords for each of `texts`, in order, with one call per unique miss."""
+        ngram_range = tuple(ngram_range)
+        results = {}
+        pending = {}
+        for text in dict.fromkeys(texts):
+            if not isinstance(text, str) or not text.strip():
+                results[text] = {}
+                continue
+            cached = self._cached(text, top_n, ngram_range)
+            if cached is not None:
+                results[text] = cached
+            else:
+                pending[text] = self._submit(text, top_n, ngram_range)
+        for text, future in pending.items():
+            results[text] = future.result()
+        return [results[text] for text in texts]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._in_flight),
+                "cache": self.cache.stats(),
+            }
+
+
+KEYWORD_CACHE_PATH = os.getenv(
+    "KEYWORD_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "keywords.sqlite3"),
+)
+KEYWORD_WORKERS = int(os.getenv("KEYWORD_WORKERS", "8"))
+
+keyword_service = KeywordService(
+    DescriptionCache(KEYWORD_CACHE_PATH), max_workers=KEYWORD_WORKERS
+)
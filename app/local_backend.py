@@ -0,0 +1,652 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+from postgrest.exceptions import APIError
+
+# Local stand-ins for the Supabase client. They implement the part of the
+# `table(...).select().eq().order().limit().execute()` query API that app/
+# uses, so the driver loop and profile pipeline can run against an in-memory
+# or SQLite store instead of a live project. Select `STORAGE_BACKEND=memory`
+# or `STORAGE_BACKEND=sqlite` (see clients.py).
+
+TIMESTAMP_COLUMNS = {"createdAt", "retweetDate", "profileUpdatedAt"}
+# The timestamp column each table defaults to now(); createdAt unless listed
+TIMESTAMP_DEFAULTS = {"Retweet": "retweetDate"}
+# Timestamps a trigger sets to now() when any of the listed columns changes
+TOUCHED_COLUMNS = {"User": ("profileUpdatedAt", ("name", "bio", "profileImage"))}
+INDEXED_COLUMNS = (
+    "userId",
+    "tweetId",
+    "createdAt",
+    "followerId",
+    "followingId",
+    "profileUpdatedAt",
+)
+
+# Column defaults the database would otherwise fill in
+DEFAULTS = {
+    "User": {"followersCount": 0, "followingCount": 0, "likeCount": 0},
+    "Tweet": {"images": [], "likeCount": 0, "retweetCount": 0, "replyCount": 0},
+    "Reply": {"images": []},
+    "UserProfile": {"interests": [], "facts": []},
+}
+
+# Tables the recent_activity function can read, newest rows first per user
+ACTIVITY_TABLES = ("Tweet", "Reply", "Like")
+
+COUNTER_COLUMNS = {
+    "Tweet": {"likeCount", "retweetCount", "replyCount"},
+    "User": {"likeCount", "followersCount", "followingCount"},
+}
+
+
+def now_timestamp():
+    return _format_timestamp(datetime.now(timezone.utc))
+
+
+def _format_timestamp(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat(timespec="milliseconds")
+
+
+def normalize_timestamp(value):
+    """Render timestamps the way PostgREST returns a `timestamp(3)` column."""
+    if value in ("now()", "now"):
+        return now_timestamp()
+    if not isinstance(value, str):
+        return value
+    try:
+        return _format_timestamp(datetime.fromisoformat(value))
+    except ValueError:
+        return value
+
+
+class LocalResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+        self.error = None
+
+
+def _split_top_level(text):
+    """Split on commas that are not inside parentheses or double quotes."""
+    parts, depth, quoted, current = [], 0, False, []
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        if char == "," and depth == 0 and not quoted:
+            parts.append("".join(current).strip())
+            current = []
+        else:
+            current.append(char)
+    if current:
+        parts.append("".join(current).strip())
+    return [part for part in parts if part]
+
+
+def _parse_value(op, raw):
+    if raw.startswith('"') and raw.endswith('"'):
+        return raw[1:-1]
+    if op == "in":
+        return [_parse_value("eq", item) for item in _split_top_level(raw[1:-1])]
+    if op == "is":
+        # `is_(column, None)` arrives as "None"; PostgREST spells it "null"
+        values = {"null": None, "none": None, "true": True, "false": False}
+        if raw.lower() not in values:
+            raise ValueError(f"Unsupported is. filter value: {raw}")
+        return values[raw.lower()]
+    return raw
+
+
+def parse_logic_tree(text, combinator="or"):
+    """Parse a PostgREST `or=(...)` filter into a ("or"/"and", [filters]) tree."""
+    filters = []
+    for item in _split_top_level(text):
+        for nested in ("and", "or"):
+            if item.startswith(f"{nested}(") and item.endswith(")"):
+                filters.append(parse_logic_tree(item[len(nested) + 1 : -1], nested))
+                break
+        else:
+            column, op, raw = item.split(".", 2)
+            filters.append(("cmp", op, column, _parse_value(op, raw)))
+    return (combinator, filters)
+
+
+def parse_columns(columns):
+    """Split a select string into plain columns and `Table(col, ...)` embeds."""
+    plain, embeds = [], []
+    for item in _split_top_level(columns):
+        if item.endswith(")") and "(" in item:
+            name, inner = item[:-1].split("(", 1)
+            embeds.append((name.strip(), parse_columns(inner)[0]))
+        else:
+            plain.append(item)
+    return plain, embeds
+
+
+def project(row, columns):
+    if "*" in columns:
+        return dict(row)
+    return {column: row.get(column) for column in columns}
+
+
+def _compare(op, actual, expected):
+    if op == "is":
+        return actual is expected
+    if op == "in":
+        return actual in expected
+    if actual is None:
+        return False
+    if isinstance(actual, (int, float)) and isinstance(expected, str):
+        expected = float(expected)
+    if op == "eq":
+        return actual == expected
+    if op == "neq":
+        return actual != expected
+    if op == "gt":
+        return actual > expected
+    if op == "gte":
+        return actual >= expected
+    if op == "lt":
+        return actual < expected
+    if op == "lte":
+        return actual <= expected
+    raise ValueError(f"Unsupported filter operator: {op}")
+
+
+def matches(row, node):
+    kind = node[0]
+    if kind == "cmp":
+        _, op, column, value = node
+        return _compare(op, row.get(column), value)
+    results = (matches(row, child) for child in node[1])
+    return all(results) if kind == "and" else any(results)
+
+
+class QueryBuilder:
+    """Chainable query mirroring the PostgREST request builder."""
+
+    def __init__(self, backend, table):
+        self.backend = backend
+        self.table = table
+        self.action = "select"
+        self.columns = "*"
+        self.payload = None
+        self.on_conflict = "id"
+        self.filters = []
+        self.ordering = []
+        self.limit_count = None
+        self.count_mode = None
+        self.single_row = False
+
+    def select(self, *columns, count=None):
+        self.columns = ",".join(columns) if columns else "*"
+        self.count_mode = count
+        return self
+
+    def insert(self, rows, **kwargs):
+        self.action, self.payload = "insert", rows
+        return self
+
+    def upsert(self, rows, on_conflict="id", **kwargs):
+        self.action, self.payload = "upsert", rows
+        self.on_conflict = on_conflict or "id"
+        return self
+
+    def update(self, values, **kwargs):
+        self.action, self.payload = "update", values
+        return self
+
+    def delete(self, **kwargs):
+        self.action = "delete"
+        return self
+
+    def _filter(self, op, column, value):
+        self.filters.append(("cmp", op, column, value))
+        return self
+
+    def eq(self, column, value):
+        return self._filter("eq", column, value)
+
+    def neq(self, column, value):
+        return self._filter("neq", column, value)
+
+    def gt(self, column, value):
+        return self._filter("gt", column, value)
+
+    def gte(self, column, value):
+        return self._filter("gte", column, value)
+
+    def lt(self, column, value):
+        return self._filter("lt", column, value)
+
+    def lte(self, column, value):
+        return self._filter("lte", column, value)
+
+    def in_(self, column, values):
+        return self._filter("in", column, list(values))
+
+    def is_(self, column, value):
+        return self._filter("is", column, _parse_value("is", str(value)))
+
+    def or_(self, filters, **kwargs):
+        self.filters.append(parse_logic_tree(filters))
+        return self
+
+    def order(self, column, desc=False, **kwargs):
+        # Like postgrest-py, "a,b" orders by several columns
+        for name in column.split(","):
+            self.ordering.append((name.strip(), desc))
+        return self
+
+    def limit(self, size, **kwargs):
+        self.limit_count = size
+        return self
+
+    def single(self):
+        self.single_row = True
+        return self
+
+    def maybe_single(self):
+        return self.single()
+
+    def execute(self):
+        response = self.backend.execute(self)
+        if self.single_row:
+            if len(response.data) != 1:
+                raise Exception(
+                    f"Expected a single {self.table} row, got {len(response.data)}"
+                )
+            response.data = response.data[0]
+        return response
+
+
+class AsyncQueryBuilder(QueryBuilder):
+    async def execute(self):
+        return QueryBuilder.execute(self)
+
+
+class RPCCall:
+    def __init__(self, backend, name, params):
+        self.backend = backend
+        self.name = name
+        self.params = params or {}
+
+    def execute(self):
+        if self.name == "increment_counters":
+            return self._increment_counters()
+        if self.name == "recent_activity":
+            return self._recent_activity()
+        if self.name == "last_active_users":
+            return self._last_active_users()
+        raise Exception(f"Unknown function: {self.name}")
+
+    def _increment_counters(self):
+        batch_id = self.params.get("batch_id")
+        with self.backend._lock:
+            if batch_id is not None:
+                if self.backend.get("CounterBatch", batch_id) is not None:
+                    return LocalResponse(None)
+            increments = self.params.get("increments", [])
+            # Like the database function, a bad item rejects the whole batch
+            for item in increments:
+                table, column = item["table"], item["column"]
+                if column not in COUNTER_COLUMNS.get(table, ()):
+                    raise Exception(f"Unsupported counter {table}.{column}")
+            for item in increments:
+                self.backend.increment(
+                    item["table"], item["id"], item["column"], int(item["delta"])
+                )
+            if batch_id is not None:
+                self.backend.put(
+                    "CounterBatch", {"id": batch_id, "appliedAt": now_timestamp()}
+                )
+        return LocalResponse(None)
+
+    def _recent_activity(self):
+        table = self.params["activity"]
+        if table not in ACTIVITY_TABLES:
+            raise Exception(f"Unsupported activity table {table}")
+        since = self.params.get("since") or {}
+        rows = []
+        with self.backend._lock:
+            for user_id in self.params["user_ids"]:
+                filters = [("cmp", "eq", "userId", user_id)]
+                if since.get(user_id):
+                    filters.append(
+                        ("cmp", "gt", "createdAt", normalize_timestamp(since[user_id]))
+                    )
+                for row in self.backend.find(
+                    table, filters, [("createdAt", True)], self.params["per_user"]
+                ):
+                    if table != "Tweet":
+                        tweet = self.backend.get("Tweet", row.get("tweetId"))
+                        row = {
+                            **row,
+                            "Tweet": (
+                                project(tweet, ["body", "images"]) if tweet else None
+                            ),
+                        }
+                    rows.append(row)
+        return LocalResponse(rows)
+
+    def _last_active_users(self):
+        ai = self.params.get("ai")
+        rows = []
+        with self.backend._lock:
+            for user in self.backend.find("User", []):
+                if ai is not None and (user.get("provider") == "ai") != ai:
+                    continue
+                latest = []
+                for table in ("Tweet", "Reply"):
+                    newest = self.backend.find(
+                        table,
+                        [("cmp", "eq", "userId", user["id"])],
+                        [("createdAt", True)],
+                        1,
+                    )
+                    if newest and newest[0].get("createdAt"):
+                        latest.append(newest[0]["createdAt"])
+                if latest:
+                    rows.append(
+                        {
+                            "userId": user["id"],
+                            "provider": user.get("provider"),
+                            "lastActivity": max(latest),
+                        }
+                    )
+        rows.sort(key=lambda row: row["userId"])
+        rows.sort(key=lambda row: row["lastActivity"], reverse=True)
+        return LocalResponse(rows[: self.params["max_users"]])
+
+
+class LocalBackend:
+    """Shared query execution; subclasses provide row storage."""
+
+    query_class = QueryBuilder
+
+    def __init__(self):
+        self._lock = threading.RLock()
+
+    def table(self, name):
+        return self.query_class(self, name)
+
+    def from_(self, name):
+        return self.table(name)
+
+    def rpc(self, name, params=None):
+        return RPCCall(self, name, params)
+
+    @property
+    def storage(self):
+        raise Exception("File storage is not available with a local backend")
+
+    def _prepare_row(self, table, row):
+        prepared = {**DEFAULTS.get(table, {}), **row}
+        prepared.setdefault(TIMESTAMP_DEFAULTS.get(table, "createdAt"), "now()")
+        if table in TOUCHED_COLUMNS:
+            prepared.setdefault(TOUCHED_COLUMNS[table][0], "now()")
+        for column in TIMESTAMP_COLUMNS & prepared.keys():
+            prepared[column] = normalize_timestamp(prepared[column])
+        return prepared
+
+    @staticmethod
+    def _touch(table, old, new):
+        """Stamp `new` like the table's update trigger would, if it has one."""
+        if table not in TOUCHED_COLUMNS:
+            return new
+        stamp, watched = TOUCHED_COLUMNS[table]
+        if any(old.get(column) != new.get(column) for column in watched):
+            new = {**new, stamp: now_timestamp()}
+        return new
+
+    def execute(self, query):
+        with self._lock:
+            if query.action in ("insert", "upsert"):
+                rows = query.payload
+                rows = rows if isinstance(rows, list) else [rows]
+                stored = []
+                # Check every row before storing any, so a rejected multi-row
+                # insert leaves the table untouched like the database would
+                for row in rows:
+                    row = self._prepare_row(query.table, row)
+                    existing = None
+                    if query.action == "upsert":
+                        conflict = (
+                            "cmp",
+                            "eq",
+                            query.on_conflict,
+                            row.get(query.on_conflict),
+                        )
+                        existing = next(iter(self.find(query.table, [conflict])), None)
+                    if existing is not None:
+                        row = self._touch(
+                            query.table,
+                            existing,
+                            {**existing, **row, "id": existing["id"]},
+                        )
+                    elif self.get(query.table, row["id"]) is not None or any(
+                        other["id"] == row["id"] for other in stored
+                    ):
+                        raise APIError(
+                            {
+                                "code": "23505",
+                                "message": "duplicate key value violates unique "
+                                f'constraint "{query.table}_pkey"',
+                                "details": f"Key (id)=({row['id']}) already exists.",
+                                "hint": None,
+                            }
+                        )
+                    stored.append(row)
+                for row in stored:
+                    self.put(query.table, row)
+                return LocalResponse(stored)
+
+            if query.action in ("update", "delete"):
+                rows = self.find(query.table, query.filters)
+                changed = []
+                for row in rows:
+                    if query.action == "delete":
+                        self.remove(query.table, row["id"])
+                    else:
+                        row = self._touch(query.table, row, {**row, **query.payload})
+                        self.put(query.table, row)
+                    changed.append(row)
+                return LocalResponse(changed)
+
+            rows = self.find(
+                query.table, query.filters, query.ordering, query.limit_count
+            )
+            count = None
+            if query.count_mode:
+                count = self.count(query.table, query.filters)
+            plain, embeds = parse_columns(query.columns)
+            data = []
+            for row in rows:
+                result = project(row, plain)
+                for name, columns in embeds:
+                    foreign_key = name[0].lower() + name[1:] + "Id"
+                    related = self.get(name, row.get(foreign_key))
+                    result[name] = project(related, columns) if related else None
+                data.append(result)
+            return LocalResponse(data, count)
+
+    def increment(self, table, row_id, column, delta):
+        with self._lock:
+            row = self.get(table, row_id)
+            if row is not None:
+                row = {**row, column: (row.get(column) or 0) + delta}
+                self.put(table, row)
+
+    def count(self, table, filters):
+        return len(self.find(table, filters))
+
+
+class MemoryBackend(LocalBackend):
+    """Rows held in per-table dicts; filters are evaluated in Python."""
+
+    def __init__(self):
+        super().__init__()
+        self.tables = {}
+
+    def get(self, table, row_id):
+        return self.tables.get(table, {}).get(row_id)
+
+    def put(self, table, row):
+        self.tables.setdefault(table, {})[row["id"]] = row
+
+    def remove(self, table, row_id):
+        self.tables.get(table, {}).pop(row_id, None)
+
+    def find(self, table, filters, ordering=(), limit=None):
+        node = ("and", filters)
+        rows = [
+            row for row in self.tables.get(table, {}).values() if matches(row, node)
+        ]
+        for column, desc in reversed(ordering):
+            rows.sort(
+                key=lambda row: (row.get(column) is None, row.get(column)),
+                reverse=desc,
+            )
+        return rows[:limit] if limit is not None else rows
+
+
+class SQLiteBackend(LocalBackend):
+    """Rows stored as JSON documents in SQLite, with expression indexes on the
+    columns the app filters and sorts by."""
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self._tables = set()
+
+    def _ensure_table(self, table):
+        if table in self._tables:
+            return
+        with self.connection:
+            self.connection.execute(
+                f'CREATE TABLE IF NOT EXISTS "{table}" '
+                "(id TEXT PRIMARY KEY, data TEXT NOT NULL)"
+            )
+            for column in INDEXED_COLUMNS:
+                self.connection.execute(
+                    f'CREATE INDEX IF NOT EXISTS "{table}_{column}_idx" '
+                    f'ON "{table}" ({self._path(column)})'
+                )
+        self._tables.add(table)
+
+    @staticmethod
+    def _path(column):
+        return f"json_extract(data, '$.\"{column}\"')"
+
+    def _compile(self, node, params):
+        kind = node[0]
+        if kind == "cmp":
+            _, op, column, value = node
+            path = self._path(column)
+            if op == "is":
+                return f"{path} IS {'NULL' if value is None else int(value)}"
+            if op == "in":
+                if not value:
+                    return "0"
+                params.extend(value)
+                return f"{path} IN ({', '.join('?' for _ in value)})"
+            sql_op = {
+                "eq": "=",
+                "neq": "<>",
+                "gt": ">",
+                "gte": ">=",
+                "lt": "<",
+                "lte": "<=",
+            }[op]
+            params.append(value)
+            return f"{path} {sql_op} ?"
+        if not node[1]:
+            return "1"
+        joiner = " AND " if kind == "and" else " OR "
+        return (
+            "(" + joiner.join(self._compile(child, params) for child in node[1]) + ")"
+        )
+
+    def get(self, table, row_id):
+        self._ensure_table(table)
+        found = self.connection.execute(
+            f'SELECT data FROM "{table}" WHERE id = ?', (row_id,)
+        ).fetchone()
+        return json.loads(found[0]) if found else None
+
+    def put(self, table, row):
+        self._ensure_table(table)
+        with self.connection:
+            self.connection.execute(
+                f'INSERT OR REPLACE INTO "{table}" (id, data) VALUES (?, ?)',
+                (row["id"], json.dumps(row)),
+            )
+
+    def remove(self, table, row_id):
+        self._ensure_table(table)
+        with self.connection:
+            self.connection.execute(f'DELETE FROM "{table}" WHERE id = ?', (row_id,))
+
+    def find(self, table, filters, ordering=(), limit=None):
+        self._ensure_table(table)
+        params = []
+        sql = f'SELECT data FROM "{table}" WHERE ' + self._compile(
+            ("and", filters), params
+        )
+        if ordering:
+            # Postgres puts NULLs last ascending and first descending; SQLite
+            # does the opposite unless told
+            sql += " ORDER BY " + ", ".join(
+                f"{self._path(column)} "
+                f"{'DESC NULLS FIRST' if desc else 'ASC NULLS LAST'}"
+                for column, desc in ordering
+            )
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return [json.loads(data) for (data,) in self.connection.execute(sql, params)]
+
+    def count(self, table, filters):
+        self._ensure_table(table)
+        params = []
+        sql = f'SELECT COUNT(*) FROM "{table}" WHERE ' + self._compile(
+            ("and", filters), params
+        )
+        return self.connection.execute(sql, params).fetchone()[0]
+
+
+class AsyncBackendView:
+    """Wraps a local backend so its queries are awaitable, for async_datatypes."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def table(self, name):
+        return AsyncQueryBuilder(self.backend, name)
+
+    def from_(self, name):
+        return self.table(name)
+
+    async def aclose(self):
+        pass
+
+
+def create_backend(kind, path=None):
+    if kind == "memory":
+        return MemoryBackend()
+    if kind == "sqlite":
+        return SQLiteBackend(
+            path or os.path.join(os.path.dirname(__file__), "local.sqlite3")
+        )
+    raise ValueError(f"Unknown storage backend: {kind}")
@@ -0,0 +1,306 @@
+import hashlib
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from clients import supabase
+from metrics import logger
+from pagination import iter_rows
+
+# Words that never start, end or appear inside a candidate phrase
+STOPWORDS = frozenset("""
+    a about above after again against all am an and any are as at be because
+    been before being below between both but by can could did do does doing
+    down during each few for from further had has have having he her here hers
+    herself him himself his how i if in into is it its itself just me more most
+    my myself no nor not now of off on once only or other our ours ourselves
+    out over own same she should so some such than that the their theirs them
+    themselves then there these they this those through to too under until up
+    very was we were what when where which while who whom why will with would
+    you your yours yourself yourselves im dont cant wont ive youre thats
+    rt via amp get got really
+    """.split())
+
+_WORD = re.compile(r"[^\W_]+(?:'[^\W_]+)?")
+_PHRASE_BREAK = re.compile(r"[.,;:!?()\[\]{}\"\n\r\t|/\\]+|https?://\S+")
+
+
+def candidate_phrases(text):
+    """Split `text` into runs of non-stopword words, as RAKE does."""
+    phrases = []
+    for chunk in _PHRASE_BREAK.split(text.lower()):
+        phrase = []
+        for word in _WORD.findall(chunk):
+            word = word.replace("'", "")
+            if word in STOPWORDS or len(word) < 2 or word.isdigit():
+                if phrase:
+                    phrases.append(phrase)
+                phrase = []
+            else:
+                phrase.append(word)
+        if phrase:
+            phrases.append(phrase)
+    return phrases
+
+
+def candidate_terms(text, ngram_range=(1, 1)):
+    """Every n-gram with n in `ngram_range` that fits inside one candidate phrase."""
+    low, high = ngram_range
+    terms = []
+    for phrase in candidate_phrases(text):
+        for n in range(low, high + 1):
+            for start in range(len(phrase) - n + 1):
+                terms.append(" ".join(phrase[start : start + n]))
+    return terms
+
+
+def text_digest(text):
+    """Stable 64-bit id of `text`, for remembering which texts were counted."""
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class TfidfKeywordExtractor:
+    """In-process keyword extractor returning the same shape as `get_keywords`.
+
+    Document frequencies are kept for every term seen by `partial_fit`, so the
+    model can be fit on the Tweet/Reply corpus once and then updated as new
+    texts arrive: `extract_many` counts any text it hasn't seen before it
+    scores it. Identical texts are only counted once that way. `save` and
+    `load` persist the counts between runs.
+
+    `extract_many` scores a whole batch at once: candidate terms are mapped to
+    vocabulary ids, and TF-IDF and the per-text top-n selection are computed
+    with NumPy over flat (text, term) arrays. With an `ngram_range` above 1 the
+    candidates are n-grams drawn from RAKE-style stopword-delimited phrases.
+    """
+
+    def __init__(self, max_ngram=3):
+        self.max_ngram = max_ngram
+        self.vocabulary = {}
+        self.terms = []
+        self._df = np.zeros(1024, dtype=np.int64)
+        self.n_docs = 0
+        # Digests of the texts counted so far, and when the corpus fit happened
+        self._seen = set()
+        self.fitted_at = time.time()
+        # Texts counted since the last `save`
+        self.unsaved = 0
+        self._lock = threading.Lock()
+
+    def _term_ids(self, terms, grow):
+        ids = np.empty(len(terms), dtype=np.int64)
+        for i, term in enumerate(terms):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                if not grow:
+                    ids[i] = -1
+                    continue
+                term_id = len(self.terms)
+                self.vocabulary[term] = term_id
+                self.terms.append(term)
+            ids[i] = term_id
+        if grow and len(self.terms) > len(self._df):
+            df = np.zeros(max(len(self.terms), 2 * len(self._df)), dtype=np.int64)
+            df[: len(self._df)] = self._df
+            self._df = df
+        return ids
+
+    def partial_fit(self, texts, skip_seen=False):
+        """Add `texts` to the document-frequency counts.
+
+        With `skip_seen`, texts that were already counted are left out.
+        """
+        with self._lock:
+            for text in texts:
+                if not isinstance(text, str) or not text:
+                    continue
+                digest = text_digest(text)
+                if skip_seen and digest in self._seen:
+                    continue
+                self._seen.add(digest)
+                self.unsaved += 1
+                terms = set(candidate_terms(text, (1, self.max_ngram)))
+                if terms:
+                    np.add.at(self._df, self._term_ids(list(terms), grow=True), 1)
+                self.n_docs += 1
+        return self
+
+    def fit_corpus(self, client, tables=("Tweet", "Reply"), page_size=1000):
+        """Fit document frequencies on the `body` of every row in `tables`."""
+        for table in tables:
+            batch = []
+            for row in iter_rows(client, table, "body", page_size, prefetch=True):
+                batch.append(row.get("body"))
+                if len(batch) >= page_size:
+                    self.partial_fit(batch)
+                    batch = []
+            self.partial_fit(batch)
+        return self
+
+    def save(self, path):
+        """Write the fitted counts to `path` (an .npz file), replacing it atomically."""
+        with self._lock:
+            arrays = {
+                "terms": np.array(self.terms, dtype=str),
+                "df": self._df[: len(self.terms)],
+                "seen": np.fromiter(self._seen, dtype=np.uint64, count=len(self._seen)),
+                "n_docs": np.int64(self.n_docs),
+                "fitted_at": np.float64(self.fitted_at),
+                "max_ngram": np.int64(self.max_ngram),
+            }
+            self.unsaved = 0
+        partial = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(partial, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(partial, path)
+
+    @classmethod
+    def load(cls, path):
+        """An extractor with the counts `save` wrote to `path`."""
+        with np.load(path, allow_pickle=False) as data:
+            extractor = cls(int(data["max_ngram"]))
+            extractor.terms = [str(term) for term in data["terms"]]
+            extractor.vocabulary = {term: i for i, term in enumerate(extractor.terms)}
+            extractor._df = np.zeros(max(1024, len(extractor.terms)), dtype=np.int64)
+            extractor._df[: len(extractor.terms)] = data["df"]
+            extractor._seen = {int(digest) for digest in data["seen"]}
+            extractor.n_docs = int(data["n_docs"])
+            extractor.fitted_at = float(data["fitted_at"])
+        return extractor
+
+    def extract_many(self, texts, top_n=5, ngram_range=(1, 1)):
+        """Top `top_n` [keyword, score] pairs for each of `texts`, in order."""
+        self.partial_fit(texts, skip_seen=True)
+        low, high = ngram_range
+        ngram_range = (max(1, low), min(max(low, high), self.max_ngram))
+        doc_ids = []
+        all_terms = []
+        for doc, text in enumerate(texts):
+            if isinstance(text, str) and text:
+                terms = candidate_terms(text, ngram_range)
+                all_terms.extend(terms)
+                doc_ids.extend([doc] * len(terms))
+        results = [[] for _ in texts]
+        if not all_terms:
+            return results
+
+        with self._lock:
+            # Terms outside the fitted vocabulary get ids past its end
+            term_ids = self._term_ids(all_terms, grow=False)
+            unseen = term_ids < 0
+            n_known = len(self.terms)
+            extra = {}
+            for i in np.flatnonzero(unseen):
+                term_ids[i] = n_known + extra.setdefault(all_terms[i], len(extra))
+            df = np.concatenate(
+                [self._df[:n_known], np.zeros(len(extra), dtype=np.int64)]
+            )
+            n_docs = self.n_docs
+        names = self.terms[:n_known] + list(extra)
+
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        width = len(names)
+        pairs, counts = np.unique(doc_ids * width + term_ids, return_counts=True)
+        docs, term_ids = np.divmod(pairs, width)
+        doc_lengths = np.bincount(doc_ids, minlength=len(texts))
+        idf = np.log((1 + n_docs) / (1 + df[term_ids])) + 1
+        scores = counts / doc_lengths[docs] * idf
+
+        # Rank terms within each text and keep the first `top_n`
+        order = np.lexsort((-scores, docs))
+        docs, term_ids, scores = docs[order], term_ids[order], scores[order]
+        starts = np.searchsorted(docs, docs, side="left")
+        keep = np.arange(len(docs)) - starts < top_n
+        for doc, term_id, score in zip(docs[keep], term_ids[keep], scores[keep]):
+            results[doc].append([names[term_id], round(float(score), 4)])
+        return results
+
+    def extract(self, text, top_n=5, ngram_range=(1, 1)):
+        return self.extract_many([text], top_n, ngram_range)[0]
+
+
+KEYWORD_MODEL_PATH = os.getenv(
+    "KEYWORD_MODEL_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "keyword_model.npz"),
+)
+# Refit on the whole corpus once the counts are this old, to drop deleted rows
+KEYWORD_REFIT_SECONDS = float(os.getenv("KEYWORD_REFIT_SECONDS", str(24 * 3600)))
+# Save the counts after this many newly counted texts
+KEYWORD_SAVE_EVERY = int(os.getenv("KEYWORD_SAVE_EVERY", "1000"))
+
+_extractor = None
+_extractor_lock = threading.Lock()
+_refitting = False
+
+
+def _fit_extractor():
+    """A new extractor fit on the corpus and saved, or None if the fit failed."""
+    extractor = TfidfKeywordExtractor()
+    try:
+        extractor.fit_corpus(supabase)
+    except Exception as e:
+        logger.warning("Error fitting keyword corpus: %s", e)
+        return None
+    _save(extractor)
+    return extractor
+
+
+def _save(extractor):
+    try:
+        extractor.save(KEYWORD_MODEL_PATH)
+    except Exception as e:
+        logger.warning("Error saving keyword model: %s", e)
+
+
+def _load():
+    """The saved extractor, or an empty one due for a fit right away."""
+    if os.path.exists(KEYWORD_MODEL_PATH):
+        try:
+            return TfidfKeywordExtractor.load(KEYWORD_MODEL_PATH)
+        except Exception as e:
+            logger.warning("Error loading keyword model: %s", e)
+    extractor = TfidfKeywordExtractor()
+    extractor.fitted_at = 0.0
+    return extractor
+
+
+def _refit():
+    global _extractor, _refitting
+    extractor = _fit_extractor()
+    with _extractor_lock:
+        if extractor is not None:
+            _extractor = extractor
+        else:
+            # Keep the current counts and try again after another period
+            _extractor.fitted_at = time.time()
+        _refitting = False
+
+
+def get_local_extractor():
+    """The process-wide extractor.
+
+    Its counts are loaded from `KEYWORD_MODEL_PATH` and saved again every
+    `KEYWORD_SAVE_EVERY` new texts. Once they are `KEYWORD_REFIT_SECONDS` old,
+    or when there is no saved model, a background fit on the Tweet/Reply
+    corpus replaces them; the current extractor serves until it is done, so
+    callers never wait for a fit. Until the first fit finishes, an empty
+    extractor scores texts against the ones it has seen so far.
+    """
+    global _extractor, _refitting
+    if _extractor is None:
+        with _extractor_lock:
+            if _extractor is None:
+                _extractor = _load()
+    extractor = _extractor
+    if extractor.unsaved >= KEYWORD_SAVE_EVERY:
+        _save(extractor)
+    if time.time() - extractor.fitted_at > KEYWORD_REFIT_SECONDS:
+        with _extractor_lock:
+            start, _refitting = not _refitting, True
+        if start:
+            threading.Thread(target=_refit, name="keyword-refit", daemon=True).start()
+    return extractor
@@ -1,10 +1,12 @@
 from collect_data import *
 from generate import *
-from datatypes import set_image_and_get_url
+from datatypes import set_image_and_get_url, counter_aggregator, bulk_writer
+import metrics
+from metrics import count_error, logger
+import logging
 import random
 import time
 import datetime
-from collections import defaultdict
 import math
 
 # Ratio of AI users to human users
@@ -28,7 +30,9 @@ max_bios_generated_batch = 5
 
 def generate_bios(n=max_bios_generated_batch):
 
-    completion = openai_client.beta.chat.completions.parse(
+    completion = openai_call(
+        "generate_bios",
+        openai_client.beta.chat.completions.parse,
         model="gpt-4o-mini",
         messages=[
             {
@@ -50,18 +54,29 @@ def generate_bios(n=max_bios_generated_batch):
         else:
             raise ValueError("Invalid parse")
     except Exception as e:
-        print(message.refusal)
-        print(f"error:{e}")
+        count_error("openai", "generate_bios", f"{message.refusal} ({e})")
         return ""
 
 
 def maintain_ai_human_ratio():
     """Check the number of human and AI users and ensure the ratio is maintained."""
-    humans = supabase.from_("User").select("id").neq("provider", "ai").execute().data
-    ais = supabase.from_("User").select("id").eq("provider", "ai").execute().data
-
-    human_count = len(humans)
-    ai_count = len(ais)
+    # Count-only queries; only the Content-Range total is transferred
+    human_count = (
+        supabase.from_("User")
+        .select("id", count="exact")
+        .neq("provider", "ai")
+        .limit(1)
+        .execute()
+        .count
+    )
+    ai_count = (
+        supabase.from_("User")
+        .select("id", count="exact")
+        .eq("provider", "ai")
+        .limit(1)
+        .execute()
+        .count
+    )
 
     current_ratio = ai_count / max(human_count, 1)
     if current_ratio < TARGET_AI_HUMAN_RATIO:
@@ -76,7 +91,7 @@ def maintain_ai_human_ratio():
 
         for seed in ai_seeds:
             create_ai_user(seed, human_count, ai_count)
-            print(f"created new AI user with username {seed.username}")
+            logger.info("created new AI user with username %s", seed.username)
 
 
 def create_ai_user(seed, human_cnt, ai_cnt):
@@ -124,31 +139,20 @@ def create_ai_user(seed, human_cnt, ai_cnt):
 
     supabase.from_("User").insert(profile_data).execute()
 
-    print(f"Created new AI user: {profile_data['username']}")
-
+    logger.info("Created new AI user: %s", profile_data["username"])
 
-def get_user_last_activity():
-    """Fetch the latest activity (tweets or replies) for each user."""
 
-    # Step 1: Fetch the latest tweet for each user
-    tweet_activity = (
-        supabase.from_("Tweet")
-        .select("userId, createdAt")
-        .order("createdAt", desc=True)
-        .execute()
-        .data
-    )
+def get_user_last_activity(limit, ai=None):
+    """The `limit` users with the newest tweet or reply, as {userId: datetime}.
 
-    # Step 2: Fetch the latest reply for each user
-    reply_activity = (
-        supabase.from_("Reply")
-        .select("userId, createdAt")
-        .order("createdAt", desc=True)
-        .execute()
-        .data
+    One `last_active_users` call (see the matching migration) reads each user's
+    latest row from the activity indexes instead of streaming both tables.
+    `ai` restricts the result to AI users (True) or humans (False).
+    """
+    rows = (
+        supabase.rpc("last_active_users", {"max_users": limit, "ai": ai}).execute().data
     )
-
-    return tweet_activity, reply_activity
+    return {row["userId"]: parse_timestamp(row["lastActivity"]) for row in rows}
 
 
 def parse_timestamp(timestamp_str):
@@ -166,89 +170,40 @@ def parse_timestamp(timestamp_str):
         raise ValueError(f"Could not parse timestamp: {timestamp_str}")
 
 
-def combine_user_activity(tweet_activity, reply_activity):
-    """Combine tweet and reply activity to find the latest activity for each user."""
-
-    user_last_activity = defaultdict(lambda: datetime.datetime.min)
-
-    # Step 1: Process tweet activity
-    for tweet in tweet_activity:
-        user_id = tweet["userId"]
-        created_at = parse_timestamp(tweet["createdAt"])
-
-        # Update the latest activity for this user if this tweet is more recent
-        if created_at > user_last_activity[user_id]:
-            user_last_activity[user_id] = created_at
-
-    # Step 2: Process reply activity
-    for reply in reply_activity:
-        user_id = reply["userId"]
-        created_at = parse_timestamp(reply["createdAt"])
-
-        # Update the latest activity for this user if this reply is more recent
-        if created_at > user_last_activity[user_id]:
-            user_last_activity[user_id] = created_at
-
-    return user_last_activity
-
-
-def filter_and_sort_users_by_activity(user_last_activity, limit=10):
-    """Filter out AI users and sort by the latest activity."""
+def filter_and_sort_users_by_activity(limit=10):
+    """Most recently active users, humans before AI users half of the time."""
 
-    # Fetch all users with their `provider` field to distinguish AI from humans
-    users = (
-        supabase.from_("User")
-        .select("id, provider")
-        .in_("id", list(user_last_activity.keys()))  # Only get users that have activity
-        .execute()
-        .data
-    )
-
-    # Filter out AI users and create a list of tuples (user_id, last_activity)
-    human_users = [
-        (user["id"], user_last_activity[user["id"]])
-        for user in users
-        if user["provider"] != "ai"  # Filter out AI users
-    ]
-
-    ai_users = [
-        (user["id"], user_last_activity[user["id"]])
-        for user in users
-        if user["provider"] == "ai"  # Filter out AI users
-    ]
-
-    # Sort by latest activity (most recent first)
+    # Half of the time humans and AI users compete on activity alone
     if random.random() < 0.5:
-        human_users = human_users + ai_users
-        ai_users = []
-
-    sorted_human_users = sorted(human_users, key=lambda x: x[1], reverse=True)
-    sorted_ai_users = sorted(ai_users, key=lambda x: x[1], reverse=True)
+        groups = [None]
+    else:
+        groups = [False, True]
+
+    sorted_users = []
+    for ai in groups:
+        if len(sorted_users) >= limit:
+            break
+        user_last_activity = get_user_last_activity(limit - len(sorted_users), ai)
+        # Sort by latest activity (most recent first)
+        sorted_users += sorted(
+            user_last_activity.items(), key=lambda x: x[1], reverse=True
+        )
 
     # Return the top `limit` users
-    return (sorted_human_users + sorted_ai_users)[:limit]
+    return sorted_users[:limit]
 
 
 def get_recent_active_users(limit=10):
-    """Get the most recent active users (both tweet and reply) and filter out AI users."""
-
-    # Step 1: Get user activity data
-    tweet_activity, reply_activity = get_user_last_activity()
-
-    # Step 2: Combine the tweet and reply activity to find the latest activity per user
-    user_last_activity = combine_user_activity(tweet_activity, reply_activity)
+    """Get the most recent active users (both tweet and reply), humans first."""
 
-    # Step 3: Filter out AI users and sort by latest activity
-    sorted_human_users = filter_and_sort_users_by_activity(user_last_activity, limit)
-
-    return sorted_human_users
+    return filter_and_sort_users_by_activity(limit)
 
 
 def post_ai_comment(author_user_id, target_user_id, tweet_id):
     """AI user posts a comment on a target user's tweet."""
     tweet_response = (
         supabase.from_("Tweet")
-        .select("body, images,replyCount")
+        .select("body, images")
         .eq("id", tweet_id)
         .single()
         .execute()
@@ -256,7 +211,6 @@ def post_ai_comment(author_user_id, target_user_id, tweet_id):
     tweet_data = tweet_response.data  # get("data", {})
     tweet_content = tweet_data.get("body", "")
     tweet_images = tweet_data.get("images", [])
-    tweet_replyCount = tweet_data.get("replyCount", 0)
     # Create the prompt for AI comment generation with tweet content
     prompt_topic = f"comment on this tweet: '{tweet_content}'\n"
     if tweet_images:
@@ -274,12 +228,16 @@ def post_ai_comment(author_user_id, target_user_id, tweet_id):
         "createdAt": str(datetime.datetime.utcnow()),
         "images": [],
     }
-    supabase.from_("Reply").insert(reply_data).execute()
-    supabase.from_("Tweet").update({"replyCount": tweet_replyCount + 1}).eq(
-        "id", tweet_id
-    ).execute()
+    # Buffered with the rest of this cycle's fan-out and sent as one insert
+    bulk_writer.submit(
+        "Reply",
+        reply_data,
+        on_success=lambda reply: counter_aggregator.increment(
+            "Tweet", tweet_id, "replyCount"
+        ),
+    )
 
-    print(f"AI user {author_user_id} commented on tweet {tweet_id}")
+    logger.info("AI user %s commented on tweet %s", author_user_id, tweet_id)
 
 
 def post_ai_like(author_user_id, tweet_id):
@@ -290,21 +248,17 @@ def post_ai_like(author_user_id, tweet_id):
         "tweetId": tweet_id,
         "createdAt": str(datetime.datetime.utcnow()),
     }
-    tweet_response = (
-        supabase.from_("Tweet")
-        .select("likeCount")
-        .eq("id", tweet_id)
-        .single()
-        .execute()
+    # Buffered with the rest of this cycle's fan-out and sent as one insert;
+    # the count is coalesced with other likes and applied atomically
+    bulk_writer.submit(
+        "Like",
+        like_data,
+        on_success=lambda like: counter_aggregator.increment(
+            "Tweet", tweet_id, "likeCount"
+        ),
     )
-    tweet_data = tweet_response.data
-    tweet_likeCount = tweet_data.get("likeCount", 0)
-    supabase.from_("Like").insert(like_data).execute()
-    supabase.from_("Tweet").update({"likeCount": tweet_likeCount + 1}).eq(
-        "id", tweet_id
-    ).execute()
 
-    print(f"AI user {author_user_id} liked tweet {tweet_id}")
+    logger.info("AI user %s liked tweet %s", author_user_id, tweet_id)
 
 
 def post_ai_tweet(author_user_id, target_user_id):
@@ -333,7 +287,9 @@ def post_ai_tweet(author_user_id, target_user_id):
         }
 
     supabase.from_("Tweet").insert(tweet_data).execute()
-    print(f"AI user {author_user_id} posted a new tweet targeted at {target_user_id}")
+    logger.info(
+        "AI user %s posted a new tweet targeted at %s", author_user_id, target_user_id
+    )
 
 
 def assign_ai_interactions(tweet_id, human_user_id, num_comments=3, num_likes=5):
@@ -352,17 +308,17 @@ def assign_ai_interactions(tweet_id, human_user_id, num_comments=3, num_likes=5)
     # print(ai_users)
 
     # Assign comments
-    print(num_comments)
+    logger.debug("assigning %s comments", num_comments)
     for i in range(num_comments):
         ai_user_id = ai_users[i]["id"]
         post_ai_comment(ai_user_id, human_user_id, tweet_id)
-        print(f"ai comment posted")
+        logger.info("ai comment posted")
 
     # Assign likes
     for i in range(num_comments, min(num_comments + num_likes, len(ai_users))):
         ai_user_id = ai_users[i]["id"]
         post_ai_like(ai_user_id, tweet_id)
-        print(f"ai like posted")
+        logger.info("ai like posted")
 
 
 def main_driver_loop():
@@ -370,7 +326,7 @@ def main_driver_loop():
     try:
         # Maintain the AI-to-human ratio
         maintain_ai_human_ratio()
-        print("ratio maintained")
+        logger.info("ratio maintained")
         # Get the most recent human tweets
         recent_tweets = (
             supabase.from_("Tweet")
@@ -413,7 +369,8 @@ def main_driver_loop():
             num_likes = math.floor(random.randint(0, 2) / 2)
             assign_ai_interactions(tweet_id, human_user_id, num_comments, num_likes)
 
-        print("interactions completed")
+        bulk_writer.flush()
+        logger.info("interactions completed")
 
         recent_users = get_recent_active_users(limit=10)
 
@@ -433,22 +390,22 @@ def main_driver_loop():
 
         target_user = random.choice(recent_users)[0]  # Get the user_id of a recent user
         post_ai_tweet(ai_user["id"], target_user)
-        print("post completed")
+        logger.info("post completed")
 
-        human_users = (
-            supabase.from_("User").select("id").neq("provider", "ai").execute().data
-        )
-        for human in human_users:
-            analyze_and_update_user_profile(human.get("id", ""))
-        print("Profile updates complete")
+        refreshed = refresh_changed_profiles()
+        logger.info("Profile updates complete (%s users refreshed)", len(refreshed))
 
         # Repeat the process after a certain interval (e.g., 60 seconds)
     except Exception as e:
-        print(f"Error: {e}")
-    print("loop complete, sleeping 20s")
+        logger.error("Error: %s", e)
+    metrics.export()
+    logger.info("loop complete, sleeping 20s")
     time.sleep(20)
     main_driver_loop()
 
 
 # Run the main driver loop
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(message)s"
+)
 main_driver_loop()
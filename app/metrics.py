@@ -0,0 +1,332 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# One instrumentation surface for every external dependency. Calls are keyed
+# by (service, operation), e.g. ("openai", "generate_bios"), ("ayfie", "POST")
+# or ("supabase", "GET Tweet"), and each key accumulates a latency histogram,
+# error count, payload bytes and, for OpenAI, token usage and estimated cost.
+
+logger = logging.getLogger("y")
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# USD per million (prompt, completion) tokens
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+
+METRICS_EXPORT_PATH = os.getenv("METRICS_EXPORT_PATH")
+
+# OpenAI quota shared by every caller in the process
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "200000"))
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.requests = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.total += seconds
+        self.requests += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the `q` quantile."""
+        if not self.requests:
+            return 0.0
+        rank = q * self.requests
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `per_minute` tokens per minute."""
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited = 0.0
+
+    def acquire(self, amount=1):
+        """Block until `amount` tokens are available, then take them."""
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                delay = (amount - self._tokens) / self.rate
+                self.waited += delay
+            time.sleep(delay)
+
+
+class CallMetrics:
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.errors = 0
+        self.retries = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+
+    def snapshot(self):
+        latency = self.latency
+        return {
+            "calls": latency.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "latency_mean": (
+                latency.total / latency.requests if latency.requests else 0.0
+            ),
+            "latency_p50": latency.quantile(0.5),
+            "latency_p95": latency.quantile(0.95),
+            "latency_p99": latency.quantile(0.99),
+            "latency_buckets": dict(
+                zip([str(b) for b in latency.buckets] + ["+Inf"], latency.counts)
+            ),
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost_usd": round(self.cost, 6),
+        }
+
+
+_lock = threading.Lock()
+_metrics = {}
+
+
+def _get(service, operation):
+    key = (service, operation)
+    metrics = _metrics.get(key)
+    if metrics is None:
+        metrics = _metrics.setdefault(key, CallMetrics())
+    return metrics
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """Estimated USD cost of a call, using the longest matching MODEL_PRICES prefix."""
+    matches = [name for name in MODEL_PRICES if model and model.startswith(name)]
+    if not matches:
+        return 0.0
+    prompt_price, completion_price = MODEL_PRICES[max(matches, key=len)]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+
+
+def record(
+    service,
+    operation,
+    seconds,
+    error=False,
+    request_bytes=0,
+    response_bytes=0,
+    prompt_tokens=0,
+    completion_tokens=0,
+    model=None,
+):
+    """Add one finished call to the (service, operation) metrics."""
+    with _lock:
+        metrics = _get(service, operation)
+        metrics.latency.observe(seconds)
+        metrics.errors += bool(error)
+        metrics.request_bytes += request_bytes or 0
+        metrics.response_bytes += response_bytes or 0
+        metrics.prompt_tokens += prompt_tokens
+        metrics.completion_tokens += completion_tokens
+        metrics.cost += estimate_cost(model, prompt_tokens, completion_tokens)
+
+
+def count_retry(service, operation):
+    with _lock:
+        _get(service, operation).retries += 1
+
+
+def count_response_bytes(service, operation, response_bytes):
+    """Add body bytes read after the call was recorded, e.g. from a stream."""
+    with _lock:
+        _get(service, operation).response_bytes += response_bytes
+
+
+def count_error(service, operation, message):
+    """Count an error that didn't come from a timed call and log it."""
+    with _lock:
+        _get(service, operation).errors += 1
+    logger.warning("%s %s: %s", service, operation, message)
+
+
+class Call:
+    """Mutable record handed out by `track` for the caller to fill in."""
+
+    __slots__ = (
+        "request_bytes",
+        "response_bytes",
+        "prompt_tokens",
+        "completion_tokens",
+        "model",
+    )
+
+    def __init__(self):
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.model = None
+
+
+@contextmanager
+def track(service, operation):
+    """Time the enclosed call; an exception counts as an error and propagates."""
+    call = Call()
+    start = time.monotonic()
+    error = False
+    try:
+        yield call
+    except BaseException:
+        error = True
+        raise
+    finally:
+        record(
+            service,
+            operation,
+            time.monotonic() - start,
+            error,
+            call.request_bytes,
+            call.response_bytes,
+            call.prompt_tokens,
+            call.completion_tokens,
+            call.model,
+        )
+
+
+def openai_call(operation, create, **kwargs):
+    """Call an OpenAI `create`/`parse` method, recording latency, tokens and cost."""
+    with track("openai", operation) as call:
+        call.model = kwargs.get("model")
+        messages = json.dumps(kwargs.get("messages", []), default=str)
+        call.request_bytes = len(messages.encode("utf-8"))
+        response = create(**kwargs)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            call.prompt_tokens = usage.prompt_tokens or 0
+            call.completion_tokens = usage.completion_tokens or 0
+        call.response_bytes = sum(
+            len((choice.message.content or "").encode("utf-8"))
+            for choice in response.choices
+        )
+    return response
+
+
+openai_requests = TokenBucket(OPENAI_RPM)
+openai_tokens = TokenBucket(OPENAI_TPM)
+
+
+def acquire_openai_quota(tokens):
+    """Block until one request and `tokens` tokens of the OpenAI quota are free."""
+    openai_requests.acquire()
+    openai_tokens.acquire(tokens)
+
+
+def snapshot():
+    """Current metrics as {"service/operation": {...}}."""
+    with _lock:
+        return {
+            f"{service}/{operation}": metrics.snapshot()
+            for (service, operation), metrics in sorted(_metrics.items())
+        }
+
+
+def _labels(service, operation):
+    operation = operation.replace("\\", "\\\\").replace('"', '\\"')
+    return f'service="{service}",operation="{operation}"'
+
+
+def prometheus_text():
+    """Metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        items = sorted(_metrics.items())
+        counters = [
+            ("y_external_calls_total", "Completed calls", lambda m: m.latency.requests),
+            ("y_external_errors_total", "Failed calls", lambda m: m.errors),
+            ("y_external_retries_total", "Retried attempts", lambda m: m.retries),
+            ("y_external_request_bytes_total", "Bytes sent", lambda m: m.request_bytes),
+            (
+                "y_external_response_bytes_total",
+                "Bytes received",
+                lambda m: m.response_bytes,
+            ),
+            (
+                "y_external_prompt_tokens_total",
+                "Prompt tokens",
+                lambda m: m.prompt_tokens,
+            ),
+            (
+                "y_external_completion_tokens_total",
+                "Completion tokens",
+                lambda m: m.completion_tokens,
+            ),
+            ("y_external_cost_usd_total", "Estimated cost in USD", lambda m: m.cost),
+        ]
+        for name, help_text, value in counters:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for (service, operation), metrics in items:
+                lines.append(
+                    f"{name}{{{_labels(service, operation)}}} {value(metrics)}"
+                )
+
+        name = "y_external_latency_seconds"
+        lines += [f"# HELP {name} Call latency", f"# TYPE {name} histogram"]
+        for (service, operation), metrics in items:
+            labels = _labels(service, operation)
+            latency = metrics.latency
+            cumulative = 0
+            for bound, count in zip(latency.buckets + ("+Inf",), latency.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {latency.total}")
+            lines.append(f"{name}_count{{{labels}}} {latency.requests}")
+    return "\n".join(lines) + "\n"
+
+
+def export(path=METRICS_EXPORT_PATH):
+    """Write metrics to `path`: Prometheus text for `.prom`, else a JSON line.
+
+    The `.prom` file is replaced atomically on each call so a node exporter's
+    textfile collector never reads half a file; other paths get one appended
+    `{"time": ..., "metrics": ...}` line per call.
+    """
+    if not path:
+        return
+    if path.endswith(".prom"):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(prometheus_text())
+        os.replace(tmp, path)
+    else:
+        with open(path, "a") as f:
+            f.write(json.dumps({"time": time.time(), "metrics": snapshot()}) + "\n")
@@ -0,0 +1,83 @@
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_PAGE_SIZE = 1000
+
+
+def _with_keyset_columns(columns, order_by):
+    if columns.strip() == "*":
+        return columns
+    names = [name.strip() for name in columns.split(",")]
+    for key in (order_by, "id"):
+        if key not in names:
+            names.append(key)
+    return ", ".join(names)
+
+
+def _after_filter(order_by, value, row_id):
+    # Rows strictly after (value, id) in (order_by, id) order
+    return f'{order_by}.gt."{value}",' f'and({order_by}.eq."{value}",id.gt."{row_id}")'
+
+
+def iter_pages(
+    client,
+    table,
+    columns="*",
+    page_size=DEFAULT_PAGE_SIZE,
+    prefetch=False,
+    where=None,
+    order_by="createdAt",
+    after=None,
+):
+    """Yield lists of rows from `table`, keyset-paginated by (`order_by`, id).
+
+    Each page is a bounded query, so no request hits the PostgREST row cap and
+    at most one page (two with `prefetch`) is held in memory. `where` may add
+    extra filters to every page query, e.g. `lambda q: q.neq("provider", "ai")`.
+    `after`, an (`order_by` value, id) pair, starts the scan past that row.
+    With `prefetch` the next page is fetched on a background thread while the
+    caller consumes the current one.
+    """
+    columns = _with_keyset_columns(columns, order_by)
+    start = tuple(after) if after is not None else None
+
+    def fetch(after):
+        query = client.table(table).select(columns)
+        if where is not None:
+            query = where(query)
+        if after is not None:
+            query = query.or_(_after_filter(order_by, *after))
+        # A single comma-separated order clause sorts by `order_by`, then id
+        response = query.order(f"{order_by},id").limit(page_size).execute()
+        if response.error:
+            raise Exception(f"Error fetching {table} page: {response.error}")
+        return response.data
+
+    def last_key(page):
+        if len(page) < page_size:
+            return None
+        return page[-1][order_by], page[-1]["id"]
+
+    if not prefetch:
+        after = start
+        while True:
+            page = fetch(after)
+            if page:
+                yield page
+            after = last_key(page)
+            if after is None:
+                return
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending = executor.submit(fetch, start)
+        while pending is not None:
+            page = pending.result()
+            after = last_key(page)
+            pending = executor.submit(fetch, after) if after is not None else None
+            if page:
+                yield page
+
+
+def iter_rows(client, table, columns="*", page_size=DEFAULT_PAGE_SIZE, **kwargs):
+    """Yield rows of `table` one at a time; see `iter_pages`."""
+    for page in iter_pages(client, table, columns, page_size, **kwargs):
+        yield from page
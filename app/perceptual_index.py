@@ -0,0 +1,205 @@
+import os
+import sqlite3
+import threading
+
+import numpy as np
+from PIL import Image
+
+from description_cache import IMAGE_CACHE_PATH
+
+
+def dhash(img, size=8):
+    """64-bit difference hash of a PIL image.
+
+    The image is shrunk to (size + 1) x size greyscale and each bit records
+    whether a pixel is brighter than its right-hand neighbour, so re-encodes,
+    rescales and small pixel changes land within a few bits of each other.
+    """
+    if img.format == "JPEG":
+        img.draft("L", (size * 8, size * 8))
+    pixels = np.asarray(
+        img.convert("L").resize((size + 1, size), Image.BILINEAR), dtype=np.int16
+    )
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes under Hamming distance.
+
+    Each child edge is labelled with its distance to the parent, so a radius
+    search only descends into edges within `radius` of the query's distance
+    to the node (triangle inequality) instead of scanning every hash.
+    """
+
+    def __init__(self):
+        self._root = None
+        self.size = 0
+
+    def add(self, key, value):
+        """Store `value` under `key`, replacing the value of an equal key."""
+        if self._root is None:
+            self._root = [key, value, {}]
+            self.size = 1
+            return
+        node = self._root
+        while True:
+            distance = hamming(key, node[0])
+            if distance == 0:
+                node[1] = value
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [key, value, {}]
+                self.size += 1
+                return
+            node = child
+
+    def nearest(self, key, radius):
+        """The `(distance, value)` closest to `key` within `radius`, or None."""
+        if self._root is None:
+            return None
+        best = None
+        stack = [self._root]
+        while stack:
+            node_key, value, children = stack.pop()
+            distance = hamming(key, node_key)
+            if distance <= radius and (best is None or distance < best[0]):
+                best = (distance, value)
+                if distance == 0:
+                    break
+            low, high = distance - radius, distance + radius
+            stack.extend(
+                child for edge, child in children.items() if low <= edge <= high
+            )
+        return best
+
+
+class PerceptualIndex:
+    """Persistent map from an image's dHash to the content hash it was described under.
+
+    Hashes are stored in a SQLite table next to the description cache and kept
+    in a BK-tree in memory. Rows written by other processes are picked up
+    before each lookup. Adding a hash again replaces the content hash it maps
+    to, and every `prune_every` adds the rows whose description has been
+    evicted from the cache are deleted.
+    """
+
+    def __init__(self, path, max_distance=6, prune_every=100):
+        self.path = path
+        self.max_distance = max_distance
+        self.prune_every = prune_every
+        self._tree = BKTree()
+        self._last_rowid = 0
+        self._adds_since_prune = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.matches = 0
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS perceptual_hashes ("
+            "hash TEXT NOT NULL, content_hash TEXT NOT NULL)"
+        )
+        if not conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'perceptual_hashes_hash'"
+        ).fetchone():
+            # Older files may hold several rows per hash; keep the newest
+            with conn:
+                conn.execute("BEGIN")
+                conn.execute(
+                    "DELETE FROM perceptual_hashes WHERE rowid NOT IN ("
+                    "SELECT MAX(rowid) FROM perceptual_hashes GROUP BY hash)"
+                )
+                conn.execute(
+                    "CREATE UNIQUE INDEX perceptual_hashes_hash "
+                    "ON perceptual_hashes (hash)"
+                )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _refresh(self):
+        rows = (
+            self._connect()
+            .execute(
+                "SELECT rowid, hash, content_hash FROM perceptual_hashes "
+                "WHERE rowid > ? ORDER BY rowid",
+                (self._last_rowid,),
+            )
+            .fetchall()
+        )
+        for rowid, key, content_hash in rows:
+            self._tree.add(int(key, 16), content_hash)
+            self._last_rowid = rowid
+
+    def find(self, key):
+        """Content hash of a stored image within `max_distance` bits of `key`."""
+        if self.max_distance <= 0:
+            return None
+        with self._lock:
+            self._refresh()
+            self.lookups += 1
+            match = self._tree.nearest(key, self.max_distance)
+            if match is not None:
+                self.matches += 1
+                return match[1]
+        return None
+
+    def add(self, key, content_hash):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO perceptual_hashes VALUES (?, ?)",
+            (format(key, "016x"), content_hash),
+        )
+        with self._lock:
+            self._adds_since_prune += 1
+            due = self._adds_since_prune >= self.prune_every
+            if due:
+                self._adds_since_prune = 0
+        if due:
+            self.prune()
+
+    def prune(self):
+        """Delete hashes whose content hash has no description left in the cache."""
+        conn = self._connect()
+        if not conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'descriptions'"
+        ).fetchone():
+            return 0
+        deleted = conn.execute(
+            "DELETE FROM perceptual_hashes WHERE content_hash NOT IN "
+            "(SELECT key FROM descriptions)"
+        ).rowcount
+        if deleted:
+            # Rows can't be removed from a BK-tree, so build it again
+            with self._lock:
+                self._tree = BKTree()
+                self._last_rowid = 0
+                self._refresh()
+        return deleted
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self._tree.size,
+                "lookups": self.lookups,
+                "matches": self.matches,
+                "match_rate": self.matches / self.lookups if self.lookups else 0.0,
+                "max_distance": self.max_distance,
+            }
+
+
+# Maximum Hamming distance (out of 64 bits) for two images to count as the
+# same picture; 0 turns near-duplicate reuse off
+IMAGE_DUPLICATE_DISTANCE = int(os.getenv("IMAGE_DUPLICATE_DISTANCE", "6"))
+
+image_index = PerceptualIndex(IMAGE_CACHE_PATH, IMAGE_DUPLICATE_DISTANCE)
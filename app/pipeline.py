@@ -0,0 +1,192 @@
+import queue
+import threading
+import time
+
+from metrics import LatencyHistogram, logger
+
+# Marks the end of a stage's input; each worker consumes exactly one
+_DONE = object()
+
+
+class Stage:
+    """One step of a `Pipeline`: `fn` applied by `workers` threads.
+
+    Items wait for the stage in a queue holding at most `queue_size` entries,
+    so a slow stage makes the stage feeding it block instead of letting work
+    pile up in memory. With `batch_size`, `fn` takes a list of up to that many
+    queued items and returns their results in the same order; if a batch
+    fails, its items are retried one at a time so only the failing ones drop.
+    """
+
+    def __init__(self, name, fn, workers=1, queue_size=None, batch_size=None):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.batch_size = batch_size
+        self.queue_size = queue_size or 2 * workers * (batch_size or 1)
+        self.latency = LatencyHistogram()
+        self.processed = 0
+        self.errors = 0
+        # Seconds workers spent waiting for room in the next stage's queue
+        self.blocked = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, error=False, processed=1):
+        """Record one call of `fn`, which handled `processed` items."""
+        with self._lock:
+            self.latency.observe(seconds)
+            if error:
+                self.errors += 1
+            else:
+                self.processed += processed
+
+    def observe_blocked(self, seconds):
+        with self._lock:
+            self.blocked += seconds
+
+    def stats(self, elapsed):
+        with self._lock:
+            latency = self.latency
+            busy = latency.total / (self.workers * elapsed) if elapsed else 0.0
+            return {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "processed": self.processed,
+                "errors": self.errors,
+                "throughput": self.processed / elapsed if elapsed else 0.0,
+                "latency_mean": (
+                    latency.total / latency.requests if latency.requests else 0.0
+                ),
+                "latency_p50": latency.quantile(0.5),
+                "latency_p95": latency.quantile(0.95),
+                "utilization": busy,
+                "blocked_seconds": self.blocked,
+            }
+
+
+class Pipeline:
+    """Streams items through a chain of stages running concurrently.
+
+    Each stage has its own worker threads and bounded input queue, so a user
+    can be in the LLM stage while the next ones are still being fetched. An
+    item whose stage raises is logged and dropped without affecting the rest.
+    Stats accumulate over every `run`.
+    """
+
+    def __init__(self, stages):
+        self.stages = stages
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def run(self, items, key=None):
+        """Push `items` through every stage and wait for them to finish.
+
+        `key(item)` identifies an item in logs and results (default: the item
+        itself). Returns `(completed, failed)`: the keys that cleared the last
+        stage, and {key: exception} for the items that didn't.
+        """
+        key = key or (lambda item: item)
+        queues = [queue.Queue(stage.queue_size) for stage in self.stages]
+        remaining = [stage.workers for stage in self.stages]
+        completed, failed = [], {}
+        start = time.monotonic()
+
+        threads = []
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._work,
+                    args=(index, queues, remaining, completed, failed),
+                    name=f"{stage.name}-{n}",
+                    daemon=True,
+                )
+                thread.start()
+                threads.append(thread)
+
+        try:
+            for item in items:
+                queues[0].put((key(item), item))
+        finally:
+            for _ in range(self.stages[0].workers):
+                queues[0].put(_DONE)
+            for thread in threads:
+                thread.join()
+            with self._lock:
+                self.elapsed += time.monotonic() - start
+        return completed, failed
+
+    def _take(self, stage, inbox):
+        """Next entries for `stage`: one item, or up to a batch of queued items.
+
+        Returns `(entries, done)`; `done` means the input has ended.
+        """
+        entry = inbox.get()
+        if entry is _DONE:
+            return [], True
+        entries = [entry]
+        while len(entries) < (stage.batch_size or 1):
+            try:
+                entry = inbox.get_nowait()
+            except queue.Empty:
+                break
+            if entry is _DONE:
+                return entries, True
+            entries.append(entry)
+        return entries, False
+
+    def _apply(self, stage, entries, failed):
+        """Run `stage` on `entries`, returning [(key, result)] for the successes."""
+        start = time.monotonic()
+        try:
+            if stage.batch_size:
+                results = stage.fn([value for _, value in entries])
+            else:
+                results = [stage.fn(entries[0][1])]
+        except Exception as e:
+            if len(entries) > 1:
+                # Retry one at a time so the error is charged to the right item
+                stage.observe(time.monotonic() - start, processed=0)
+                return [
+                    done
+                    for entry in entries
+                    for done in self._apply(stage, [entry], failed)
+                ]
+            item_key = entries[0][0]
+            stage.observe(time.monotonic() - start, error=True)
+            logger.warning("%s stage failed for %s: %s", stage.name, item_key, e)
+            with self._lock:
+                failed[item_key] = e
+            return []
+        stage.observe(time.monotonic() - start, processed=len(entries))
+        return [(item_key, result) for (item_key, _), result in zip(entries, results)]
+
+    def _work(self, index, queues, remaining, completed, failed):
+        stage = self.stages[index]
+        inbox = queues[index]
+        outbox = queues[index + 1] if index + 1 < len(queues) else None
+        done = False
+        while not done:
+            entries, done = self._take(stage, inbox)
+            if not entries:
+                continue
+            for item_key, result in self._apply(stage, entries, failed):
+                if outbox is None:
+                    with self._lock:
+                        completed.append(item_key)
+                    continue
+                waited = time.monotonic()
+                outbox.put((item_key, result))
+                stage.observe_blocked(time.monotonic() - waited)
+
+        # The last worker out tells the next stage that no more input is coming
+        with self._lock:
+            remaining[index] -= 1
+            last = remaining[index] == 0
+        if last and outbox is not None:
+            for _ in range(self.stages[index + 1].workers):
+                outbox.put(_DONE)
+
+    def stats(self):
+        with self._lock:
+            elapsed = self.elapsed
+        return {stage.name: stage.stats(elapsed) for stage in self.stages}
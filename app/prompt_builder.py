@@ -0,0 +1,170 @@
+import math
+import re
+
+# Word runs and single punctuation marks; a run costs one token per 4 chars
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+# Truncated lines shorter than this many tokens are dropped instead
+MIN_TRUNCATED_TOKENS = 8
+
+
+def estimate_tokens(text):
+    """Approximate GPT token count of `text`, rounded up."""
+    return sum(math.ceil(len(piece) / 4) for piece in _PIECES.findall(text or ""))
+
+
+def compact(value):
+    """Short plain-text rendering of a profile value, leaving out empty fields.
+
+    Dicts become `key: value; key: value`, lists `a, b, c`, and strings have
+    their whitespace collapsed, instead of Python reprs full of quotes and
+    brackets. None and NaN (missing DataFrame cells) count as empty.
+    """
+    if isinstance(value, dict):
+        return "; ".join(
+            f"{key}: {text}" for key, item in value.items() if (text := compact(item))
+        )
+    if isinstance(value, (list, tuple)):
+        return ", ".join(text for item in value if (text := compact(item)))
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    return " ".join(str(value).split())
+
+
+def keyword_terms(keywords):
+    """The terms of a `get_keywords` result: [[term, score], ...], a dict or a list."""
+    if isinstance(keywords, dict):
+        return list(keywords)
+    return [
+        keyword[0] if isinstance(keyword, (list, tuple)) else keyword
+        for keyword in keywords or []
+        if keyword
+    ]
+
+
+def dedupe(values):
+    """`values` without blanks and repeats (ignoring case), in first-seen order."""
+    seen = {}
+    for value in values:
+        text = compact(value)
+        if text and text.lower() not in seen:
+            seen[text.lower()] = text
+    return list(seen.values())
+
+
+# (label, column) of the UserProfile fields shown to the model
+PROFILE_FIELDS = (
+    ("Age group", "ageGroup"),
+    ("Gender", "gender"),
+    ("Race", "race"),
+    ("Location", "location"),
+    ("Income range", "incomeRange"),
+    ("Relationship status", "relationshipStatus"),
+    ("Education", "education"),
+    ("Occupation", "occupation"),
+    ("Interests", "interests"),
+    ("Additional facts", "facts"),
+)
+
+
+def labeled_lines(pairs):
+    """`label: value` lines for the (label, value) pairs whose value isn't empty."""
+    return [f"{label}: {text}" for label, value in pairs if (text := compact(value))]
+
+
+def profile_lines(profile):
+    """The known fields of a UserProfile row, one `label: value` line each."""
+    profile = profile or {}
+    return labeled_lines((label, profile.get(key)) for label, key in PROFILE_FIELDS)
+
+
+def _truncate(line, tokens):
+    """The longest prefix of `line` that fits in `tokens`, marked with an ellipsis."""
+    words = line.split(" ")
+    low, high = 0, len(words)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(" ".join(words[:middle]) + " …") <= tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return " ".join(words[:low]) + " …" if low else None
+
+
+class PromptBuilder:
+    """Assembles a prompt from named sections under a hard token budget.
+
+    Each section is a list of lines with an optional title. When everything
+    doesn't fit in `budget` tokens, sections are filled in priority order
+    (highest first) and each keeps as many of its lines, in order, as the
+    remaining budget allows, so the end of a low-priority list is what gets
+    cut. A line that only partly fits is shortened. Sections are rendered in
+    the order they were added. Token counts are estimates (see
+    `estimate_tokens`); `report` gives them per section.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self._sections = []
+        self._report = None
+
+    def add(self, name, lines, priority=0, title=None):
+        """Add section `name`: a string or a list of lines. Blank lines are skipped."""
+        if isinstance(lines, str):
+            lines = [lines]
+        lines = [line for line in lines if line and line.strip()]
+        self._sections.append(
+            {"name": name, "title": title, "lines": lines, "priority": priority}
+        )
+        return self
+
+    def build(self):
+        remaining = self.budget
+        kept = {}
+        report = {}
+        for section in sorted(self._sections, key=lambda s: -s["priority"]):
+            name = section["name"]
+            lines = []
+            # The blank line before the section, and the newline ending each line
+            used = 1
+            if section["title"]:
+                used += estimate_tokens(section["title"]) + 1
+            if section["lines"] and used < remaining:
+                for line in section["lines"]:
+                    cost = estimate_tokens(line) + 1
+                    if used + cost > remaining:
+                        room = remaining - used - 1
+                        if room >= MIN_TRUNCATED_TOKENS:
+                            line = _truncate(line, room)
+                            if line is not None:
+                                lines.append(line)
+                                used += estimate_tokens(line) + 1
+                        break
+                    lines.append(line)
+                    used += cost
+            if not lines:
+                used = 0
+            remaining -= used
+            kept[name] = lines
+            report[name] = {
+                "tokens": used,
+                "lines": len(lines),
+                "dropped": len(section["lines"]) - len(lines),
+            }
+
+        blocks = []
+        for section in self._sections:
+            lines = kept[section["name"]]
+            if lines:
+                title = [section["title"]] if section["title"] else []
+                blocks.append("\n".join(title + lines))
+        report["total"] = self.budget - remaining
+        report["budget"] = self.budget
+        self._report = report
+        return "\n\n".join(blocks)
+
+    def report(self):
+        """Estimated tokens, kept lines and dropped lines per section, from `build`."""
+        if self._report is None:
+            self.build()
+        return self._report
@@ -0,0 +1,193 @@
+import email.utils
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from clients import HTTP_CONNECT_TIMEOUT, HTTP_MAX_KEEPALIVE, HTTP_TIMEOUT
+
+# Shared requests transport for outbound calls that don't go through an SDK
+# client (Ayfie, Stability, image downloads): one keep-alive session per host,
+# connect/read timeouts on every call, and jittered exponential retries.
+
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "30"))
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# Methods that are safe to send twice; others may have been acted on (and
+# billed) before a connection drop or 5xx, so are only retried on request
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+# Metrics service names for known hosts; others are reported by host name
+SERVICE_NAMES = {
+    "portal.ayfie.com": "ayfie",
+    "api.stability.ai": "stability",
+}
+
+_lock = threading.Lock()
+_sessions = {}
+_services = set()
+
+
+def _host(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _service(url):
+    netloc = urlsplit(url).netloc
+    return SERVICE_NAMES.get(netloc, netloc)
+
+
+def _body_size(body):
+    if isinstance(body, (bytes, str)):
+        return len(body)
+    return 0
+
+
+def _count_streamed_body(response, service, method):
+    """Count the body bytes read through `iter_content` once `response` closes.
+
+    A streamed body is still unread when the call is recorded, and neither
+    Content-Length (absent on chunked responses) nor the socket position
+    (not tracked for chunked reads) gives its size.
+    """
+    iter_content, close = response.iter_content, response.close
+    read = 0
+    counted = False
+
+    def counting_iter_content(*args, **kwargs):
+        nonlocal read
+        for chunk in iter_content(*args, **kwargs):
+            read += len(chunk)
+            yield chunk
+
+    def close_and_count():
+        nonlocal counted
+        if not counted:
+            counted = True
+            metrics.count_response_bytes(service, method, read)
+        close()
+
+    response.iter_content = counting_iter_content
+    response.close = close_and_count
+
+
+def get_session(url):
+    """The keep-alive session for `url`'s host, created on first use."""
+    host = _host(url)
+    session = _sessions.get(host)
+    if session is None:
+        with _lock:
+            session = _sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=HTTP_MAX_KEEPALIVE
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _sessions[host] = session
+    return session
+
+
+def _retry_after(response):
+    """Seconds the server asked us to wait, from a Retry-After header."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff for retry number `attempt` (from 0)."""
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2**attempt))
+
+
+def request(
+    method,
+    url,
+    timeout=None,
+    retries=HTTP_MAX_RETRIES,
+    retry_unsafe=False,
+    **kwargs,
+):
+    """Send a request over the host's pooled session, retrying transient failures.
+
+    Connection errors, timeouts and 429/5xx responses are retried up to
+    `retries` times, waiting for the server's Retry-After when it sends one
+    and a jittered exponential backoff otherwise. Methods outside
+    IDEMPOTENT_METHODS (POST, PATCH) are only retried on a 429 with a
+    Retry-After, which the server rejected without acting on, unless
+    `retry_unsafe` says repeating the call is harmless. Other responses,
+    including a final 429/5xx, are returned as-is for the caller to check.
+    `timeout` defaults to (HTTP_CONNECT_TIMEOUT, HTTP_TIMEOUT).
+    """
+    session = get_session(url)
+    service = _service(url)
+    _services.add(service)
+    timeout = timeout or (HTTP_CONNECT_TIMEOUT, HTTP_TIMEOUT)
+    safe = retry_unsafe or method.upper() in IDEMPOTENT_METHODS
+    attempt = 0
+    while True:
+        start = time.monotonic()
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            metrics.record(service, method, time.monotonic() - start, error=True)
+            if attempt >= retries or not safe:
+                raise
+            delay = backoff_delay(attempt)
+        else:
+            metrics.record(
+                service,
+                method,
+                time.monotonic() - start,
+                error=response.status_code >= 400,
+                request_bytes=_body_size(response.request.body),
+                response_bytes=0 if kwargs.get("stream") else len(response.content),
+            )
+            if kwargs.get("stream"):
+                _count_streamed_body(response, service, method)
+            if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                return response
+            delay = _retry_after(response)
+            if not safe and (response.status_code != 429 or delay is None):
+                return response
+            if delay is None:
+                delay = backoff_delay(attempt)
+            delay = min(delay, HTTP_BACKOFF_MAX)
+            response.close()
+        metrics.count_retry(service, method)
+        attempt += 1
+        time.sleep(delay)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def transport_stats():
+    """Call, error, retry, byte and latency metrics for each service called here."""
+    return {
+        key: value
+        for key, value in metrics.snapshot().items()
+        if key.split("/", 1)[0] in _services
+    }
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future
+
+from analyze import get_keywords_many
+from description_cache import DescriptionCache
+from image_executor import image_describer
+
+
+def tweet_content_hash(body, images):
+    """Hash of the tweet fields enrichment is derived from."""
+    parts = [body or ""] + [image for image in images or [] if image]
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class TweetEnricher:
+    """Persistent tweet id -> keywords and image descriptions.
+
+    A tweet is enriched once however many users posted, replied to or liked
+    it. Each record stores the content hash of the body and images it was
+    computed from, so an edited tweet is re-enriched and an unchanged one
+    never is. Concurrent requests for the same tweet share one computation.
+    Records with failed keyword extractions or image descriptions are
+    returned but not stored, so they are retried next time.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.coalesced = 0
+
+    def _cached(self, tweet_id, content_hash):
+        stored = self.cache.get(tweet_id)
+        if stored is None:
+            return None
+        record = json.loads(stored)
+        if record["content_hash"] != content_hash:
+            with self._lock:
+                self.invalidations += 1
+            return None
+        return record
+
+    def _enrich(self, tweets):
+        """Compute records for {tweet_id: (body, images)}, storing complete ones."""
+        bodies = [body for body, _ in tweets.values()]
+        keywords = get_keywords_many(bodies)
+        descriptions = image_describer.describe_urls(
+            [image for _, images in tweets.values() for image in images]
+        )
+        records = {}
+        for (tweet_id, (body, images)), tweet_keywords in zip(tweets.items(), keywords):
+            record = {
+                "content_hash": tweet_content_hash(body, images),
+                "keywords": tweet_keywords,
+                "image_descriptions": [
+                    descriptions[image] for image in images if image in descriptions
+                ],
+            }
+            # Failed extractions come back empty; leave those to be retried
+            complete = len(record["image_descriptions"]) == len(images) and (
+                tweet_keywords or not body.strip()
+            )
+            if complete:
+                self.cache[tweet_id] = json.dumps(record)
+            records[tweet_id] = record
+        return records
+
+    def _finish(self, tweet_id):
+        with self._lock:
+            return self._in_flight.pop(tweet_id)
+
+    def enrich_many(self, tweets):
+        """Records for {tweet_id: (body, images)}, enriching only new or changed tweets.
+
+        Returns {tweet_id: {"content_hash", "keywords", "image_descriptions"}}.
+        """
+        records = {}
+        owned = {}
+        waiting = {}
+        for tweet_id, (body, images) in tweets.items():
+            images = [image for image in images or [] if image]
+            body = body or ""
+            record = self._cached(tweet_id, tweet_content_hash(body, images))
+            if record is not None:
+                records[tweet_id] = record
+                continue
+            with self._lock:
+                future = self._in_flight.get(tweet_id)
+                if future is not None:
+                    self.coalesced += 1
+                    waiting[tweet_id] = future
+                    continue
+                self._in_flight[tweet_id] = Future()
+                self.misses += 1
+            owned[tweet_id] = (body, images)
+        with self._lock:
+            self.hits += len(records)
+
+        if owned:
+            try:
+                computed = self._enrich(owned)
+            except Exception as e:
+                for tweet_id in owned:
+                    self._finish(tweet_id).set_exception(e)
+                raise
+            for tweet_id, record in computed.items():
+                self._finish(tweet_id).set_result(record)
+            records.update(computed)
+
+        for tweet_id, future in waiting.items():
+            records[tweet_id] = future.result()
+        return records
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._in_flight),
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "cache": self.cache.stats(),
+            }
+
+
+TWEET_ENRICHMENT_PATH = os.getenv(
+    "TWEET_ENRICHMENT_PATH",
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "tweet_enrichment.sqlite3"
+    ),
+)
+TWEET_ENRICHMENT_MAX_ENTRIES = int(os.getenv("TWEET_ENRICHMENT_MAX_ENTRIES", "200000"))
+
+tweet_enricher = TweetEnricher(
+    DescriptionCache(TWEET_ENRICHMENT_PATH, TWEET_ENRICHMENT_MAX_ENTRIES)
+)
@@ -1,7 +1,11 @@
-from supabase import create_client, Client
 from datatypes import *
 import pandas as pd
 from analyze import *
+from clients import supabase, openai_client
+from description_cache import image_cache
+from metrics import count_error, logger, openai_call
+from pagination import iter_pages
+from prompt_builder import PromptBuilder, profile_lines
 import requests
 import os
 from openai import OpenAI
@@ -13,20 +17,15 @@ from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 from typing import Optional, List
 
-
 load_dotenv(
     os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env")
 )
-image_cache = {}
-
-# Initialize Supabase Client
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 AYFIE_API_KEY = os.getenv("AYFIE_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+
+# Hard cap on the estimated size of a strategy prompt
+STRATEGY_PROMPT_TOKENS = int(os.getenv("STRATEGY_PROMPT_TOKENS", "800"))
 
 
 class strList(BaseModel):
@@ -36,7 +35,19 @@ class strList(BaseModel):
 
 
 def get_strategies(user_profile, n=3):
-    completion = openai_client.beta.chat.completions.parse(
+    builder = PromptBuilder(STRATEGY_PROMPT_TOKENS)
+    builder.add(
+        "request",
+        f"Generate up to {n} advertising strategies (short, quick tactics that you decide would be effective in getting the user's business) based on the following user profile:",
+        10,
+    )
+    builder.add("profile", profile_lines(user_profile), 5)
+    prompt = builder.build()
+    logger.debug("Strategy prompt tokens: %s", builder.report())
+
+    completion = openai_call(
+        "get_strategies",
+        openai_client.beta.chat.completions.parse,
         model="gpt-4o-mini",
         messages=[
             {
@@ -45,19 +56,7 @@ def get_strategies(user_profile, n=3):
             },
             {
                 "role": "user",
-                "content": f"""Generate up to {n} advertising strategies (short, quick tactics that you decide would be effective in getting the user's business) based on the following user profile:
-                
-                Age Group: {user_profile.get('ageGroup', 'unknown')}
-                Gender: {user_profile.get('gender', 'unknown')}
-                Race: {user_profile.get('race', 'unknown')}
-                Location: {user_profile.get('location', 'unknown')}
-                Income Range: {user_profile.get('incomeRange', 'unknown')}
-                Relationship Status: {user_profile.get('relationshipStatus', 'unknown')}
-                Education: {user_profile.get('education', 'unknown')}
-                Occupation: {user_profile.get('occupation', 'unknown')}
-                Interests: {', '.join(user_profile.get('interests', []))}
-                Additional Facts: {', '.join(user_profile.get('facts', []))}
-                """,
+                "content": prompt,
             },
         ],
         max_tokens=n * 50,
@@ -71,8 +70,7 @@ def get_strategies(user_profile, n=3):
         else:
             raise ValueError("Invalid parse")
     except Exception as e:
-        print(message.refusal)
-        print(f"error:{e}")
+        count_error("openai", "get_strategies", f"{message.refusal} ({e})")
         return []
 
 
@@ -81,45 +79,15 @@ def get_strategies(user_profile, n=3):
 #     print(get_strategies(up))
 
 
-def export_user_profiles_to_pico_html():
-    # Fetch all UserProfiles
-    user_profiles = supabase.from_("UserProfile").select("*").execute().data
-
-    # Fetch all Users (only the fields we need)
-    users = supabase.from_("User").select("id, name, username").execute().data
-
-    # Convert the data to DataFrames
-    df_user_profiles = pd.DataFrame(user_profiles)
-
-    df_user_profiles["strategies"] = df_user_profiles.apply(
-        lambda row: " | ".join(get_strategies(row.to_dict())), axis=1
-    )
-    df_user_profiles["facts"] = df_user_profiles.apply(
-        lambda row: " | ".join(row["facts"]), axis=1
-    )
-    df_user_profiles["interests"] = df_user_profiles.apply(
-        lambda row: " | ".join(row["interests"]), axis=1
-    )
-
-    df_users = pd.DataFrame(users)
-
-    # Merge the two DataFrames on the `userId` and `id` fields
-    merged_df = pd.merge(
-        df_user_profiles, df_users, left_on="userId", right_on="id", how="left"
+def _html_table_rows(df):
+    """Render DataFrame rows as <tr> elements, unescaped like `to_html(escape=False)`."""
+    return "".join(
+        "<tr>" + "".join(f"<td>{value}</td>" for value in row) + "</tr>\n"
+        for row in df.itertuples(index=False, name=None)
     )
 
-    # Drop the unnecessary `id_y` column from the `User` table
-    merged_df.drop(columns=["id_y"], inplace=True)
-
-    # Rename `id_x` to `userProfileId` to avoid confusion
-    merged_df.rename(columns={"id_x": "userProfileId"}, inplace=True)
-
-    # Reorder columns to place 'name' and 'username' first
-    columns_order = ["name", "username"] + [
-        col for col in merged_df.columns if col not in ["name", "username"]
-    ]
-    merged_df = merged_df[columns_order]
 
+def export_user_profiles_to_pico_html(page_size=200):
     # PicoCSS - Link to PicoCSS CDN
     pico_css = """
     <link rel="stylesheet" href="https://unpkg.com/@picocss/pico@1.*/css/pico.min.css">
@@ -139,9 +107,6 @@ def export_user_profiles_to_pico_html():
                 <h1>User Profiles</h1>
     """
 
-    # Convert the DataFrame to HTML
-    html_table = merged_df.to_html(index=False, escape=False)
-
     # Add a footer and close the HTML tags
     html_footer = """
             </main>
@@ -149,15 +114,70 @@ def export_user_profiles_to_pico_html():
     </html>
     """
 
-    # Combine the HTML parts
-    final_html = html_header + html_table + html_footer
-
-    # Save the final HTML to a file
+    # Stream UserProfiles a page at a time and append each page's rows to the
+    # file, so memory stays bounded by the page size rather than the table
     html_file_path = "user_profiles_pico.html"
     with open(html_file_path, "w") as f:
-        f.write(final_html)
-
-    print(f"UserProfiles have been exported to {html_file_path}")
+        f.write(html_header)
+        table_open = False
+
+        for user_profiles in iter_pages(supabase, "UserProfile", "*", page_size):
+            # Fetch the Users for this page (only the fields we need)
+            user_ids = [profile["userId"] for profile in user_profiles]
+            users = (
+                supabase.from_("User")
+                .select("id, name, username")
+                .in_("id", user_ids)
+                .execute()
+                .data
+            )
+
+            # Convert the data to DataFrames
+            df_user_profiles = pd.DataFrame(user_profiles)
+
+            df_user_profiles["strategies"] = df_user_profiles.apply(
+                lambda row: " | ".join(get_strategies(row.to_dict())), axis=1
+            )
+            df_user_profiles["facts"] = df_user_profiles.apply(
+                lambda row: " | ".join(row["facts"] or []), axis=1
+            )
+            df_user_profiles["interests"] = df_user_profiles.apply(
+                lambda row: " | ".join(row["interests"] or []), axis=1
+            )
+
+            df_users = pd.DataFrame(users, columns=["id", "name", "username"])
+
+            # Merge the two DataFrames on the `userId` and `id` fields
+            merged_df = pd.merge(
+                df_user_profiles, df_users, left_on="userId", right_on="id", how="left"
+            )
+
+            # Drop the unnecessary `id_y` column from the `User` table
+            merged_df.drop(columns=["id_y"], inplace=True)
+
+            # Rename `id_x` to `userProfileId` to avoid confusion
+            merged_df.rename(columns={"id_x": "userProfileId"}, inplace=True)
+
+            # Reorder columns to place 'name' and 'username' first
+            columns_order = ["name", "username"] + [
+                col for col in merged_df.columns if col not in ["name", "username"]
+            ]
+            merged_df = merged_df[columns_order]
+
+            if not table_open:
+                header_cells = "".join(f"<th>{col}</th>" for col in columns_order)
+                f.write(
+                    '<table border="1" class="dataframe">\n'
+                    f"<thead><tr>{header_cells}</tr></thead>\n<tbody>\n"
+                )
+                table_open = True
+            f.write(_html_table_rows(merged_df))
+
+        if table_open:
+            f.write("</tbody>\n</table>")
+        f.write(html_footer)
+
+    logger.info("UserProfiles have been exported to %s", html_file_path)
 
 
 # Call the function
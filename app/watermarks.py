@@ -0,0 +1,82 @@
+import json
+import os
+import sqlite3
+import threading
+
+# Watermark kinds kept per user: the newest createdAt already analyzed for each
+# activity table, and a hash of the profile fields the analysis reads
+ACTIVITY_TABLES = {"tweets": "Tweet", "replies": "Reply", "likes": "Like"}
+PROFILE = "profile"
+
+# Pseudo user id under which the global scan cursors are stored: one per
+# activity table, and one over User.profileUpdatedAt under PROFILE
+GLOBAL = "*"
+
+
+def encode_cursor(key):
+    """Stored form of a (timestamp, id) keyset cursor; None stays None."""
+    return json.dumps(list(key)) if key is not None else None
+
+
+def decode_cursor(value):
+    """The (timestamp, id) pair `encode_cursor` stored, or None."""
+    return tuple(json.loads(value)) if value else None
+
+
+class WatermarkStore:
+    """Persistent (user id, kind) -> value map for incremental profiling."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS watermarks ("
+            "user_id TEXT NOT NULL, kind TEXT NOT NULL, value TEXT NOT NULL, "
+            "PRIMARY KEY (user_id, kind))"
+        )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, user_id):
+        """All watermarks of `user_id` as {kind: value}."""
+        rows = self._connect().execute(
+            "SELECT kind, value FROM watermarks WHERE user_id = ?", (user_id,)
+        )
+        return dict(rows.fetchall())
+
+    def find(self, kind, value):
+        """Ids of the users whose `kind` watermark is `value`."""
+        rows = self._connect().execute(
+            "SELECT user_id FROM watermarks WHERE kind = ? AND value = ? "
+            "AND user_id != ?",
+            (kind, value, GLOBAL),
+        )
+        return [user_id for (user_id,) in rows.fetchall()]
+
+    def update(self, user_id, marks):
+        """Store `marks` ({kind: value}) for `user_id`; None values are skipped."""
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?)",
+                [
+                    (user_id, kind, value)
+                    for kind, value in marks.items()
+                    if value is not None
+                ],
+            )
+
+
+WATERMARK_PATH = os.getenv(
+    "WATERMARK_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "watermarks.sqlite3"),
+)
+
+watermarks = WatermarkStore(WATERMARK_PATH)
@@ -0,0 +1,26 @@
+-- CreateFunction
+-- Applies a batch of counter deltas in one transaction. `increments` is a JSON
+-- array of {"table", "id", "column", "delta"} objects.
+CREATE OR REPLACE FUNCTION "increment_counters"(increments JSONB)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    item JSONB;
+BEGIN
+    FOR item IN SELECT * FROM jsonb_array_elements(increments)
+    LOOP
+        IF NOT (
+            (item->>'table' = 'Tweet' AND item->>'column' IN ('likeCount', 'retweetCount', 'replyCount'))
+            OR (item->>'table' = 'User' AND item->>'column' IN ('likeCount', 'followersCount', 'followingCount'))
+        ) THEN
+            RAISE EXCEPTION 'Unsupported counter %.%', item->>'table', item->>'column';
+        END IF;
+        EXECUTE format(
+            'UPDATE %I SET %I = %I + $1 WHERE "id" = $2',
+            item->>'table', item->>'column', item->>'column'
+        )
+        USING (item->>'delta')::INTEGER, item->>'id';
+    END LOOP;
+END;
+$$;
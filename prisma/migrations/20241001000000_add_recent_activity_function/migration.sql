@@ -0,0 +1,44 @@
+-- CreateFunction
+-- Newest `per_user` rows of `activity` ("Tweet", "Reply" or "Like") for each
+-- of `user_ids`, as JSON objects. `since` optionally maps a user id to a
+-- createdAt; only that user's rows after it are returned. Reply and Like rows
+-- carry the liked/replied-to tweet's body and images under "Tweet", matching
+-- the PostgREST embed `*, Tweet(body, images)`.
+CREATE OR REPLACE FUNCTION "recent_activity"(
+    activity TEXT,
+    user_ids TEXT[],
+    per_user INTEGER,
+    since JSONB DEFAULT '{}'
+)
+RETURNS SETOF JSONB
+LANGUAGE plpgsql
+STABLE
+AS $$
+BEGIN
+    IF activity NOT IN ('Tweet', 'Reply', 'Like') THEN
+        RAISE EXCEPTION 'Unsupported activity table %', activity;
+    END IF;
+    RETURN QUERY EXECUTE format(
+        'SELECT CASE WHEN %L = ''Tweet'' THEN to_jsonb(a) ELSE to_jsonb(a) || jsonb_build_object(
+                ''Tweet'',
+                (SELECT jsonb_build_object(''body'', t."body", ''images'', t."images")
+                 FROM "Tweet" t WHERE t."id" = to_jsonb(a)->>''tweetId'')
+            ) END
+         FROM unnest($1) AS u("id")
+         CROSS JOIN LATERAL (
+             SELECT * FROM %I r
+             WHERE r."userId" = u."id"
+               AND ($3->>u."id" IS NULL OR r."createdAt" > ($3->>u."id")::TIMESTAMP)
+             ORDER BY r."createdAt" DESC
+             LIMIT $2
+         ) a',
+        activity, activity
+    )
+    USING user_ids, per_user, COALESCE(since, '{}');
+END;
+$$;
+
+-- CreateIndex
+CREATE INDEX IF NOT EXISTS "Tweet_userId_createdAt_idx" ON "Tweet"("userId", "createdAt" DESC);
+CREATE INDEX IF NOT EXISTS "Reply_userId_createdAt_idx" ON "Reply"("userId", "createdAt" DESC);
+CREATE INDEX IF NOT EXISTS "Like_userId_createdAt_idx" ON "Like"("userId", "createdAt" DESC);
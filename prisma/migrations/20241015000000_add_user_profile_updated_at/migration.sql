@@ -0,0 +1,30 @@
+-- AlterTable
+-- When a user's name, bio or profile image last changed, so the profile
+-- refresh can find edited profiles with a keyset scan instead of reading
+-- every User row. Counter updates don't touch it.
+ALTER TABLE "User" ADD COLUMN "profileUpdatedAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+-- CreateIndex
+CREATE INDEX "User_profileUpdatedAt_id_idx" ON "User"("profileUpdatedAt", "id");
+
+-- CreateFunction
+CREATE OR REPLACE FUNCTION "touch_user_profile"()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW."profileUpdatedAt" := CURRENT_TIMESTAMP;
+    RETURN NEW;
+END;
+$$;
+
+-- CreateTrigger
+CREATE TRIGGER "User_touch_profile"
+BEFORE UPDATE OF "name", "bio", "profileImage" ON "User"
+FOR EACH ROW
+WHEN (
+    OLD."name" IS DISTINCT FROM NEW."name"
+    OR OLD."bio" IS DISTINCT FROM NEW."bio"
+    OR OLD."profileImage" IS DISTINCT FROM NEW."profileImage"
+)
+EXECUTE FUNCTION "touch_user_profile"();
@@ -0,0 +1,29 @@
+-- CreateFunction
+-- The `max_users` users with the newest tweet or reply, newest first, with the
+-- createdAt of that row as "lastActivity". `ai` restricts the result to AI
+-- users (true) or everyone else (false); NULL returns both. Each user's latest
+-- row is one probe of the ("userId", "createdAt" DESC) indexes, so the cost
+-- follows the number of users rather than the size of the activity tables.
+CREATE OR REPLACE FUNCTION "last_active_users"(
+    max_users INTEGER,
+    ai BOOLEAN DEFAULT NULL
+)
+RETURNS TABLE ("userId" TEXT, "provider" TEXT, "lastActivity" TIMESTAMP(3))
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT u."id", u."provider", a."lastActivity"
+    FROM "User" u
+    CROSS JOIN LATERAL (
+        SELECT GREATEST(
+            (SELECT t."createdAt" FROM "Tweet" t WHERE t."userId" = u."id"
+             ORDER BY t."createdAt" DESC LIMIT 1),
+            (SELECT r."createdAt" FROM "Reply" r WHERE r."userId" = u."id"
+             ORDER BY r."createdAt" DESC LIMIT 1)
+        ) AS "lastActivity"
+    ) a
+    WHERE a."lastActivity" IS NOT NULL
+      AND (ai IS NULL OR (u."provider" = 'ai') = ai)
+    ORDER BY a."lastActivity" DESC, u."id"
+    LIMIT max_users;
+$$;
@@ -0,0 +1,53 @@
+-- CreateTable
+-- Ids of the increment_counters batches already applied, so a batch resent
+-- after a timeout or dropped connection is not counted twice. Rows older than
+-- a day are pruned by the function itself.
+CREATE TABLE "CounterBatch" (
+    "id" TEXT NOT NULL,
+    "appliedAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "CounterBatch_pkey" PRIMARY KEY ("id")
+);
+
+-- CreateIndex
+CREATE INDEX "CounterBatch_appliedAt_idx" ON "CounterBatch"("appliedAt");
+
+-- DropFunction
+DROP FUNCTION IF EXISTS "increment_counters"(JSONB);
+
+-- CreateFunction
+-- As before, plus `batch_id`: a batch whose id was already recorded is
+-- skipped, and the id is recorded in the same transaction as the updates.
+CREATE OR REPLACE FUNCTION "increment_counters"(
+    increments JSONB,
+    batch_id TEXT DEFAULT NULL
+)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    item JSONB;
+BEGIN
+    IF batch_id IS NOT NULL THEN
+        INSERT INTO "CounterBatch" ("id") VALUES (batch_id) ON CONFLICT DO NOTHING;
+        IF NOT FOUND THEN
+            RETURN;
+        END IF;
+        DELETE FROM "CounterBatch" WHERE "appliedAt" < CURRENT_TIMESTAMP - INTERVAL '1 day';
+    END IF;
+    FOR item IN SELECT * FROM jsonb_array_elements(increments)
+    LOOP
+        IF NOT (
+            (item->>'table' = 'Tweet' AND item->>'column' IN ('likeCount', 'retweetCount', 'replyCount'))
+            OR (item->>'table' = 'User' AND item->>'column' IN ('likeCount', 'followersCount', 'followingCount'))
+        ) THEN
+            RAISE EXCEPTION 'Unsupported counter %.%', item->>'table', item->>'column';
+        END IF;
+        EXECUTE format(
+            'UPDATE %I SET %I = %I + $1 WHERE "id" = $2',
+            item->>'table', item->>'column', item->>'column'
+        )
+        USING (item->>'delta')::INTEGER, item->>'id';
+    END LOOP;
+END;
+$$;
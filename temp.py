@@ -1,17 +1,11 @@
 # ai_content_inserter.py
-from supabase import create_client, Client
 import os
+import sys
 import uuid
 import asyncio
-from dotenv import load_dotenv
-
-load_dotenv()
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+from clients import supabase
 
 # Path to the local image file you want to upload
 local_file_path = "public/bird.png"
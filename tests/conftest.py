@@ -0,0 +1,23 @@
+import os
+import sys
+import tempfile
+
+# The app modules build their caches, stores and clients at import time, so
+# point everything at a scratch directory and the in-memory backend first
+_scratch = tempfile.mkdtemp(prefix="y-tests-")
+for name, filename in [
+    ("IMAGE_CACHE_PATH", "image_descriptions.sqlite3"),
+    ("KEYWORD_CACHE_PATH", "keywords.sqlite3"),
+    ("KEYWORD_MODEL_PATH", "keyword_model.npz"),
+    ("DOWNLOAD_INDEX_PATH", "downloads.sqlite3"),
+    ("WATERMARK_PATH", "watermarks.sqlite3"),
+    ("TWEET_ENRICHMENT_PATH", "tweet_enrichment.sqlite3"),
+    ("FILE_CACHE_DIR", "file_cache"),
+]:
+    os.environ.setdefault(name, os.path.join(_scratch, filename))
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+)
@@ -0,0 +1,43 @@
+import asyncio
+
+import async_datatypes
+from async_datatypes import AsyncLike, AsyncTweet, AsyncUser
+from datatypes import Tweet, User, counter_aggregator
+from entity_cache import tweet_cache, user_cache
+
+
+def test_each_event_loop_gets_its_own_semaphore_and_client():
+    async def create_user(name):
+        return await AsyncUser.create(username=name)
+
+    first = asyncio.run(create_user("first-loop"))
+    second = asyncio.run(create_user("second-loop"))
+    assert first.id != second.id
+    assert asyncio.run(AsyncUser.get_by_id(second.id)).username == "second-loop"
+
+
+def test_like_updates_counts_and_drops_cached_entries(monkeypatch):
+    async def setup():
+        author = await AsyncUser.create(username="author")
+        fan = await AsyncUser.create(username="fan")
+        return author, fan, await AsyncTweet.create(author.id, "hello")
+
+    author, fan, tweet = asyncio.run(setup())
+    # Warm the caches the way sync readers would
+    assert Tweet.get_by_id(tweet.id).likeCount == 0
+    assert User.get_by_id(author.id).likeCount == 0
+
+    queries = []
+    table = async_datatypes.table
+    monkeypatch.setattr(
+        async_datatypes, "table", lambda name: queries.append(name) or table(name)
+    )
+    asyncio.run(AsyncLike.create(fan.id, tweet.id))
+    # The author came from the cache, so only the insert hit the database
+    assert queries == ["Like"]
+    assert tweet_cache.get(tweet.id) is None
+    assert user_cache.get(author.id) is None
+
+    counter_aggregator.flush()
+    assert Tweet.get_by_id(tweet.id).likeCount == 1
+    assert User.get_by_id(author.id).likeCount == 1
@@ -0,0 +1,54 @@
+from batch_loader import BatchLoader
+from entity_cache import EntityCache
+from local_backend import MemoryBackend
+
+
+class CountingBackend(MemoryBackend):
+    """Records the ids of every `.in_()` query it answers."""
+
+    def __init__(self):
+        super().__init__()
+        self.queries = []
+
+    def execute(self, query):
+        for node in query.filters:
+            if node[0] == "cmp" and node[1] == "in":
+                self.queries.append(list(node[3]))
+        return super().execute(query)
+
+
+def make_loader(n_users, cache=None, chunk_size=200):
+    client = CountingBackend()
+    client.table("User").insert(
+        [{"id": f"u{i:03}", "username": f"user{i}"} for i in range(n_users)]
+    ).execute()
+    loader = BatchLoader(
+        client, "User", lambda row: row["username"], cache, chunk_size=chunk_size
+    )
+    return loader, client
+
+
+def test_entities_come_back_in_request_order_with_missing_ids():
+    loader, _ = make_loader(5)
+    entities, missing = loader.load_many(["u003", "nope", "u001", "u003"])
+    assert entities == ["user3", "user1", "user3"]
+    assert missing == ["nope"]
+    assert loader.load("nope") is None
+
+
+def test_lookups_are_split_into_chunks_of_200():
+    loader, client = make_loader(450)
+    ids = [f"u{i:03}" for i in range(450)]
+    entities, missing = loader.load_many(ids + ids[:10])
+    assert len(entities) == 460 and missing == []
+    assert [len(chunk) for chunk in client.queries] == [200, 200, 50]
+
+
+def test_cached_entities_are_not_fetched_again():
+    cache = EntityCache()
+    loader, client = make_loader(3, cache)
+    loader.load_many(["u000", "u001"])
+    client.queries.clear()
+    entities, _ = loader.load_many(["u001", "u002", "u000"])
+    assert entities == ["user1", "user2", "user0"]
+    assert client.queries == [["u002"]]
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from batches import ColumnarBatch, TweetBatch
+
+
+def test_columnar_batch_is_abstract():
+    with pytest.raises(TypeError):
+        ColumnarBatch()
+
+
+def test_tweet_batch_round_trip_and_filter():
+    batch = TweetBatch.from_rows(
+        [
+            {
+                "id": "a",
+                "userId": "u",
+                "body": "x",
+                "likeCount": 5,
+                "createdAt": "2024-09-14T01:02:03.456",
+            },
+            {"id": "b", "userId": "u", "body": "y", "likeCount": None},
+        ]
+    )
+    assert len(batch) == 2
+    assert list(batch.likeCount) == [5, 0]
+    popular = batch[batch.likeCount > 1]
+    assert [tweet.id for tweet in popular] == ["a"]
+    assert batch[0].createdAt == "2024-09-14T01:02:03.456"
+
+
+def test_missing_timestamp_becomes_none():
+    batch = TweetBatch.from_rows([{"id": "a", "userId": "u", "createdAt": None}])
+    assert np.isnat(batch.createdAt[0])
+    assert batch[0].createdAt is None
@@ -0,0 +1,78 @@
+import httpx
+import pytest
+
+from bulk_writer import BulkWriter
+from local_backend import MemoryBackend
+
+
+class RecordingBackend(MemoryBackend):
+    """Counts insert calls; `down` makes them fail like a dropped connection."""
+
+    def __init__(self):
+        super().__init__()
+        self.inserts = 0
+        self.down = False
+
+    def execute(self, query):
+        if query.action == "insert":
+            self.inserts += 1
+            if self.down:
+                raise httpx.ConnectError("connection refused")
+        return super().execute(query)
+
+
+def make_writer():
+    client = RecordingBackend()
+    return BulkWriter(client, max_batch_size=10, max_latency=60), client
+
+
+def test_rows_are_written_in_one_insert_and_resolve_to_stored_rows():
+    writer, client = make_writer()
+    stored = []
+    futures = [
+        writer.submit("User", {"id": f"u{i}", "username": f"user{i}"}) for i in range(3)
+    ]
+    futures.append(
+        writer.submit(
+            "User",
+            {"id": "u3", "username": "user3"},
+            factory=lambda row: row["username"],
+            on_success=stored.append,
+        )
+    )
+    writer.flush()
+
+    assert client.inserts == 1
+    # The server fills in column defaults
+    assert futures[0].result()["followersCount"] == 0
+    assert futures[3].result() == "user3"
+    assert stored == ["user3"]
+    assert writer.stats()["rows_written"] == 4
+
+
+def test_rejected_rows_fail_alone():
+    writer, client = make_writer()
+    client.table("User").insert({"id": "taken", "username": "old"}).execute()
+    good = writer.submit("User", {"id": "u1", "username": "new"})
+    bad = writer.submit("User", {"id": "taken", "username": "dup"})
+    writer.flush()
+
+    assert good.result()["username"] == "new"
+    with pytest.raises(Exception, match="duplicate key"):
+        bad.result()
+    assert writer.stats()["rows_failed"] == 1
+
+
+def test_transport_errors_fail_the_batch_without_per_row_retries():
+    writer, client = make_writer()
+    futures = [
+        writer.submit("User", {"id": f"u{i}", "username": f"user{i}"}) for i in range(3)
+    ]
+    client.down = True
+    writer.flush()
+
+    assert client.inserts == 1
+    for future in futures:
+        with pytest.raises(httpx.ConnectError):
+            future.result()
+    assert writer.stats()["rows_failed"] == 3
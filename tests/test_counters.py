@@ -0,0 +1,97 @@
+from counters import CounterAggregator
+from local_backend import MemoryBackend
+
+
+class FlakyBackend(MemoryBackend):
+    """Records increment_counters calls; `fail` makes the next ones raise,
+    before or after the batch is applied."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+        self.fail = None
+
+    def rpc(self, name, params=None):
+        call = super().rpc(name, params)
+        backend = self
+
+        class Call:
+            def execute(self):
+                backend.calls.append(params)
+                if backend.fail == "before":
+                    raise TimeoutError("connect timeout")
+                response = call.execute()
+                if backend.fail == "after":
+                    raise TimeoutError("read timeout")
+                return response
+
+        return Call()
+
+
+def make_backend():
+    backend = FlakyBackend()
+    backend.table("Tweet").insert(
+        [{"id": "t1", "userId": "u", "body": "hi"}, {"id": "t2", "userId": "u"}]
+    ).execute()
+    return backend
+
+
+def like_count(backend, tweet_id):
+    return backend.get("Tweet", tweet_id)["likeCount"]
+
+
+def test_increments_are_coalesced_into_one_call():
+    backend = make_backend()
+    aggregator = CounterAggregator(backend, flush_interval=60, max_pending=100)
+    for _ in range(3):
+        aggregator.increment("Tweet", "t1", "likeCount")
+    aggregator.increment("Tweet", "t2", "likeCount", 2)
+    aggregator.increment("Tweet", "t2", "likeCount", -2)
+    aggregator.flush()
+
+    assert len(backend.calls) == 1
+    assert backend.calls[0]["increments"] == [
+        {"table": "Tweet", "id": "t1", "column": "likeCount", "delta": 3}
+    ]
+    assert like_count(backend, "t1") == 3
+    assert aggregator.stats() == {
+        "pending": 0,
+        "unconfirmed": 0,
+        "increments": 5,
+        "writes": 1,
+    }
+
+
+def test_batch_that_failed_before_running_is_applied_on_retry():
+    backend = make_backend()
+    aggregator = CounterAggregator(backend, flush_interval=60, max_pending=100)
+    aggregator.increment("Tweet", "t1", "likeCount")
+    backend.fail = "before"
+    aggregator.flush()
+    assert like_count(backend, "t1") == 0
+    assert aggregator.stats()["unconfirmed"] == 1
+
+    backend.fail = None
+    aggregator.flush()
+    assert like_count(backend, "t1") == 1
+    assert aggregator.stats()["unconfirmed"] == 0
+
+
+def test_batch_that_timed_out_after_committing_is_not_counted_twice():
+    backend = make_backend()
+    aggregator = CounterAggregator(backend, flush_interval=60, max_pending=100)
+    aggregator.increment("Tweet", "t1", "likeCount")
+    backend.fail = "after"
+    aggregator.flush()
+    assert like_count(backend, "t1") == 1
+
+    backend.fail = None
+    aggregator.increment("Tweet", "t1", "likeCount")
+    aggregator.flush()
+
+    # The unconfirmed batch is resent under its id, then the newer one follows
+    assert [call["batch_id"] for call in backend.calls[:2]] == [
+        backend.calls[0]["batch_id"]
+    ] * 2
+    assert backend.calls[2]["batch_id"] != backend.calls[0]["batch_id"]
+    assert like_count(backend, "t1") == 2
@@ -0,0 +1,67 @@
+import pytest
+
+import description_cache
+from description_cache import DescriptionCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(description_cache.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def make_cache(tmp_path):
+    def make(**kwargs):
+        return DescriptionCache(str(tmp_path / "cache.sqlite3"), **kwargs)
+
+    return make
+
+
+def last_used(cache, key):
+    return (
+        cache._connect()
+        .execute("SELECT last_used FROM descriptions WHERE key = ?", (key,))
+        .fetchone()[0]
+    )
+
+
+def test_trim_keeps_the_most_recently_used_entries(clock, make_cache):
+    cache = make_cache(max_entries=2)
+    for key in ("a", "b", "c"):
+        cache[key] = f"description {key}"
+        clock[0] += 1
+    assert cache["a"] == "description a"
+
+    assert cache.evict() == 1
+    assert "b" not in cache
+    assert cache.get("a") == "description a"
+    assert cache.get("c") == "description c"
+
+
+def test_expired_entries_miss_and_are_deleted(clock, make_cache):
+    cache = make_cache(max_age=60)
+    cache["old"] = "stale"
+    clock[0] += 30
+    cache["new"] = "fresh"
+    clock[0] += 40
+
+    assert cache.get("old") is None
+    assert cache.get("new") == "fresh"
+    assert cache.evict() == 1
+    assert cache.stats()["size"] == 1
+
+
+def test_hits_write_access_times_in_batches(clock, make_cache):
+    cache = make_cache(touch_batch=3)
+    for key in ("a", "b", "c"):
+        cache[key] = key
+    clock[0] += 10
+
+    cache.get("a")
+    cache.get("b")
+    assert last_used(cache, "a") == 1_000_000.0
+    cache.get("c")
+    assert last_used(cache, "a") == 1_000_010.0
+    assert last_used(cache, "c") == 1_000_010.0
@@ -0,0 +1,97 @@
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import download_index as downloads
+from image_pipeline import fetch_image
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    """Serves `server.body` with an ETag, answering 304 to a matching one."""
+
+    def do_GET(self):
+        server = self.server
+        server.requests += 1
+        etag = '"%s"' % hashlib.md5(server.body).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(server.body)))
+        self.end_headers()
+        self.wfile.write(server.body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ImageHandler)
+    server.body = b"first"
+    server.requests = 0
+    server.url = f"http://127.0.0.1:{server.server_port}/bird.png"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    index = downloads.DownloadIndex(str(tmp_path / "downloads.sqlite3"))
+    monkeypatch.setattr(downloads, "download_index", index)
+    monkeypatch.setattr("image_pipeline.download_index", index)
+    return index
+
+
+def response(etag):
+    fake = requests.Response()
+    fake.headers["ETag"] = etag
+    return fake
+
+
+def test_record_clears_path_when_content_changes(index):
+    index.record("u", "a", response('"a"'), "/cache/a.png")
+    index.record("u", "a", response('"a"'))
+    assert index.get("u")["path"] == "/cache/a.png"
+
+    index.record("u", "b", response('"b"'))
+    entry = index.get("u")
+    assert entry["content_hash"] == "b"
+    assert entry["path"] is None
+
+
+def test_download_file_revalidates(server, index, tmp_path):
+    first = downloads.download_file(server.url, str(tmp_path))
+    assert open(first, "rb").read() == b"first"
+    assert downloads.download_file(server.url, str(tmp_path)) == first
+    assert server.requests == 2
+
+    server.body = b"second"
+    second = downloads.download_file(server.url, str(tmp_path))
+    assert second != first
+    assert open(second, "rb").read() == b"second"
+
+
+def test_revalidate_returns_the_changed_body(server, index):
+    assert downloads.revalidate(server.url) == (None, None)
+    assert server.requests == 0
+
+    data, content_hash = fetch_image(server.url)
+    assert downloads.revalidate(server.url) == (content_hash, None)
+
+    server.body = b"second"
+    requests_before = server.requests
+    content_hash, data = downloads.revalidate(server.url)
+    assert data == b"second"
+    assert content_hash == hashlib.md5(b"second").hexdigest()
+    assert server.requests == requests_before + 1
+    assert index.get(server.url)["content_hash"] == content_hash
@@ -0,0 +1,73 @@
+import pytest
+
+import datatypes
+import entity_cache
+from entity_cache import EntityCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(entity_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = EntityCache(ttl=10)
+    cache.set("a", "user a")
+    clock[0] += 9
+    assert cache.get("a") == "user a"
+    clock[0] += 2
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = EntityCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_get_or_load_returns_the_same_instance_until_invalidated(clock):
+    cache = EntityCache()
+    loads = []
+
+    def load(key):
+        loads.append(key)
+        return object()
+
+    first = cache.get_or_load("a", load)
+    assert cache.get_or_load("a", load) is first
+    cache.invalidate("a")
+    assert cache.get_or_load("a", load) is not first
+    assert loads == ["a", "a"]
+    # Missing rows aren't cached
+    assert cache.get_or_load("missing", lambda key: None) is None
+
+
+def test_stats_count_hits_and_misses(clock):
+    cache = EntityCache()
+    cache.get("a")
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("a")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+    assert stats["hit_rate"] == pytest.approx(2 / 3)
+
+
+def test_follow_invalidates_instead_of_changing_the_cached_user():
+    follower = datatypes.User.create(username="follower")
+    followed = datatypes.User.create(username="followed")
+    cached = datatypes.User.get_by_id(follower.id)
+    datatypes.User.get_by_id(followed.id)
+
+    cached.follow(followed.id)
+    assert cached.followingCount == 0
+    assert entity_cache.user_cache.get(follower.id) is None
+    assert entity_cache.user_cache.get(followed.id) is None
@@ -0,0 +1,44 @@
+import os
+import time
+
+import pytest
+
+import file_cache
+from file_cache import FileCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(file_cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_writes_over_budget_evict_the_least_recently_used(tmp_path, clock):
+    cache = FileCache(str(tmp_path), max_bytes=10)
+    for name in ("a", "b"):
+        cache.write(cache.path(name), b"12345")
+        clock[0] += 1
+    assert cache.get("a") is not None
+    clock[0] += 1
+    cache.write(cache.path("c"), b"12345")
+
+    files = [name for name in os.listdir(tmp_path) if not name.startswith(".index")]
+    assert sorted(files) == ["a", "c"]
+    assert cache.stats()["evicted_files"] == 1
+
+
+def test_compact_leaves_untracked_files_alone(tmp_path, clock):
+    (tmp_path / "checked-in.png").write_bytes(b"x" * 100)
+    stale = tmp_path / "abandoned.part"
+    stale.write_bytes(b"partial")
+    os.utime(stale, (time.time() - 2 * file_cache.STALE_PART_AGE,) * 2)
+    cache = FileCache(str(tmp_path), max_bytes=10)
+    cache.write(cache.path("kept"), b"12345")
+    cache.write(cache.path("gone"), b"12345")
+    os.remove(cache.path("gone"))
+
+    stats = cache.compact()
+    assert (stats["files"], stats["bytes"], stats["evicted_files"]) == (1, 5, 0)
+    assert (tmp_path / "checked-in.png").exists()
+    assert not stale.exists()
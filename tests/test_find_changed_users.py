@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+import collect_data
+from local_backend import MemoryBackend
+from watermarks import GLOBAL, PROFILE, WatermarkStore
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = MemoryBackend()
+    monkeypatch.setattr(collect_data, "supabase", client)
+    client.table("User").insert(
+        [
+            {"id": "h1", "username": "h1", "provider": "email", "bio": "hi"},
+            {"id": "h2", "username": "h2", "provider": "email", "bio": "yo"},
+            {"id": "ai", "username": "ai", "provider": "ai", "bio": "bot"},
+        ]
+    ).execute()
+    return client
+
+
+@pytest.fixture
+def store(tmp_path):
+    return WatermarkStore(str(tmp_path / "watermarks.sqlite3"))
+
+
+def settle(store, client):
+    """Run one cycle as if every changed user was refreshed successfully."""
+    changed, cursors = collect_data.find_changed_users(store)
+    for user_id in changed:
+        user = client.table("User").select("*").eq("id", user_id).execute().data[0]
+        store.update(user_id, {PROFILE: collect_data.profile_hash(user)})
+    store.update(GLOBAL, cursors)
+    return sorted(changed)
+
+
+def test_first_cycle_sees_every_human(client, store):
+    assert settle(store, client) == ["h1", "h2"]
+    assert settle(store, client) == []
+
+
+def test_activity_and_profile_edits_are_picked_up(client, store):
+    settle(store, client)
+    # profileUpdatedAt has millisecond resolution
+    time.sleep(0.005)
+    client.table("Tweet").insert(
+        [
+            {"id": "t1", "userId": "h1", "body": "x"},
+            {"id": "t2", "userId": "ai", "body": "y"},
+        ]
+    ).execute()
+    client.table("User").update({"bio": "new"}).eq("id", "h2").execute()
+    # Counter updates don't move profileUpdatedAt
+    client.table("User").update({"followersCount": 5}).eq("id", "h1").execute()
+    assert settle(store, client) == ["h1", "h2"]
+    assert settle(store, client) == []
+
+
+def test_activity_rows_sharing_a_timestamp_are_not_skipped(client, store):
+    settle(store, client)
+    client.table("Tweet").insert(
+        [{"id": "t1", "userId": "h1", "createdAt": "2024-01-01T00:00:00"}]
+    ).execute()
+    assert settle(store, client) == ["h1"]
+    client.table("Tweet").insert(
+        [{"id": "t2", "userId": "h2", "createdAt": "2024-01-01T00:00:00"}]
+    ).execute()
+    assert settle(store, client) == ["h2"]
+
+
+def test_failed_users_are_retried(client, store):
+    settle(store, client)
+    store.update("h1", {PROFILE: ""})
+    assert settle(store, client) == ["h1"]
@@ -0,0 +1,80 @@
+import threading
+import time
+
+import pytest
+
+import image_executor
+import metrics
+from image_executor import ImageDescriber
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+class FakeCache(dict):
+    def get(self, key, default=None):
+        return super().get(key, default)
+
+
+@pytest.fixture
+def images(monkeypatch):
+    """URLs map to content via `contents`; describing blocks until `release`."""
+    state = {"contents": {}, "calls": [], "release": threading.Event()}
+
+    def fetch_image(url):
+        content = state["contents"][url]
+        if content is None:
+            raise IOError(f"404 for {url}")
+        return content.encode(), content
+
+    def describe(data, content_hash, cache, describe):
+        state["calls"].append(content_hash)
+        state["release"].wait(5)
+        return f"picture of {content_hash}"
+
+    monkeypatch.setattr(image_executor, "revalidate", lambda url: (None, None))
+    monkeypatch.setattr(image_executor, "fetch_image", fetch_image)
+    monkeypatch.setattr(image_executor, "describe_image_bytes", describe)
+    return state
+
+
+def test_requests_for_a_url_in_flight_share_one_future(images):
+    images["contents"]["http://x/a.png"] = "a"
+    describer = ImageDescriber(FakeCache(), max_workers=2)
+    first = describer.submit("http://x/a.png")
+    second = describer.submit("http://x/a.png")
+    assert second is first
+    images["release"].set()
+
+    assert first.result(5) == "picture of a"
+    assert images["calls"] == ["a"]
+    assert describer.stats()["coalesced"] == 1
+
+
+def test_urls_with_the_same_content_are_described_once(images):
+    images["contents"].update({"http://x/a.png": "same", "http://y/b.png": "same"})
+    describer = ImageDescriber(FakeCache(), max_workers=2)
+    first = describer.submit("http://x/a.png")
+    second = describer.submit("http://y/b.png")
+    # Let both downloads reach the shared description before it finishes
+    wait_until(lambda: describer.stats()["coalesced"] == 1)
+    images["release"].set()
+
+    assert first.result(5) == second.result(5) == "picture of same"
+    assert images["calls"] == ["same"]
+
+
+def test_failures_are_counted_and_left_out(images):
+    images["contents"].update({"http://x/ok.png": "ok", "http://x/gone.png": None})
+    images["release"].set()
+    describer = ImageDescriber(FakeCache(), max_workers=2)
+    before = metrics.snapshot().get("images/describe", {}).get("errors", 0)
+
+    descriptions = describer.describe_urls(["http://x/ok.png", "http://x/gone.png"])
+    assert descriptions == {"http://x/ok.png": "picture of ok"}
+    assert describer.stats()["errors"] == 1
+    assert metrics.snapshot()["images/describe"]["errors"] == before + 1
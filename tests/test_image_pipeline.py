@@ -0,0 +1,52 @@
+import os
+from io import BytesIO
+
+from PIL import Image
+
+from image_pipeline import prepare_image, save_copy
+
+
+def encode(size, format, color=(200, 30, 30)):
+    buff = BytesIO()
+    Image.new("RGB", size, color).save(buff, format=format)
+    return buff.getvalue()
+
+
+def decoded_format(data):
+    with Image.open(BytesIO(data)) as img:
+        return img.format, img.size
+
+
+def test_small_jpeg_is_passed_through_unchanged():
+    data = encode((64, 48), "JPEG")
+    prepared = prepare_image(data, max_width=100, max_height=100)
+    assert prepared.data is data
+    assert (prepared.mime_type, prepared.width, prepared.height) == (
+        "image/jpeg",
+        64,
+        48,
+    )
+
+
+def test_other_formats_are_converted_to_jpeg():
+    prepared = prepare_image(encode((64, 48), "BMP"), max_width=100, max_height=100)
+    assert prepared.mime_type == "image/jpeg"
+    assert decoded_format(prepared.data) == ("JPEG", (64, 48))
+
+
+def test_oversized_images_are_shrunk_to_fit():
+    prepared = prepare_image(encode((400, 100), "PNG"), max_width=100, max_height=100)
+    assert prepared.mime_type == "image/jpeg"
+    assert decoded_format(prepared.data) == ("JPEG", (100, 25))
+
+
+def test_copies_are_named_by_content(tmp_path):
+    red, blue = encode((8, 8), "PNG"), encode((8, 8), "PNG", (0, 0, 200))
+    first = save_copy("http://x/cat.png?v=1", red, "aaa", str(tmp_path))
+    second = save_copy("http://y/cat.png", blue, "bbb", str(tmp_path))
+    assert first != second
+    assert os.path.basename(first) == "aaa.png"
+    with open(second, "rb") as f:
+        assert f.read() == blue
+    # Without an extension in the URL, the image format supplies one
+    assert save_copy("http://x/img", red, "aaa", str(tmp_path)).endswith("aaa.png")
@@ -0,0 +1,175 @@
+import pytest
+
+from local_backend import MemoryBackend, SQLiteBackend
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend()
+    return SQLiteBackend(str(tmp_path / "store.sqlite3"))
+
+
+def add_users(backend):
+    backend.table("User").insert(
+        [
+            {"id": "a", "username": "ann", "bio": "hi", "followersCount": 3},
+            {"id": "b", "username": "bob", "bio": None, "followersCount": 1},
+            {"id": "c", "username": "cat", "followersCount": 2},
+        ]
+    ).execute()
+
+
+def test_insert_select_update_delete(backend):
+    add_users(backend)
+    rows = backend.table("User").select("id, username").eq("id", "a").execute().data
+    assert rows == [{"id": "a", "username": "ann"}]
+    # Column defaults are filled in like the database would
+    assert (
+        backend.table("User").select("*").eq("id", "b").execute().data[0]["likeCount"]
+        == 0
+    )
+
+    backend.table("User").update({"username": "anne"}).eq("id", "a").execute()
+    assert (
+        backend.table("User").select("username").eq("id", "a").single().execute()
+    ).data == {"username": "anne"}
+
+    backend.table("User").delete().eq("id", "c").execute()
+    ids = [row["id"] for row in backend.table("User").select("id").execute().data]
+    assert sorted(ids) == ["a", "b"]
+
+
+def test_is_none_matches_missing_values(backend):
+    add_users(backend)
+    rows = backend.table("User").select("id").is_("bio", None).execute().data
+    assert sorted(row["id"] for row in rows) == ["b", "c"]
+    rows = backend.table("User").select("id").is_("bio", "null").execute().data
+    assert sorted(row["id"] for row in rows) == ["b", "c"]
+
+
+def test_is_rejects_unknown_values(backend):
+    with pytest.raises(ValueError):
+        backend.table("User").select("id").is_("bio", "maybe")
+
+
+@pytest.mark.parametrize(
+    "desc, expected", [(False, ["a", "b", "c"]), (True, ["c", "b", "a"])]
+)
+def test_ordering_puts_nulls_where_postgres_does(backend, desc, expected):
+    # Postgres: NULLs last ascending, first descending
+    backend.table("Tweet").insert(
+        [
+            {"id": "a", "userId": "u", "body": "1", "parentId": "p1"},
+            {"id": "b", "userId": "u", "body": "2", "parentId": "p2"},
+            {"id": "c", "userId": "u", "body": "3", "parentId": None},
+        ]
+    ).execute()
+    rows = (
+        backend.table("Tweet").select("id").order("parentId", desc=desc).execute().data
+    )
+    assert [row["id"] for row in rows] == expected
+
+
+def test_order_and_limit_by_several_columns(backend):
+    backend.table("Tweet").insert(
+        [
+            {"id": "b", "userId": "u", "createdAt": "2024-01-01T00:00:00"},
+            {"id": "a", "userId": "u", "createdAt": "2024-01-01T00:00:00"},
+            {"id": "c", "userId": "u", "createdAt": "2023-01-01T00:00:00"},
+        ]
+    ).execute()
+    rows = (
+        backend.table("Tweet")
+        .select("id")
+        .order("createdAt,id")
+        .limit(2)
+        .execute()
+        .data
+    )
+    assert [row["id"] for row in rows] == ["c", "a"]
+
+
+def test_recent_activity_returns_newest_rows_per_user(backend):
+    backend.table("Tweet").insert(
+        [
+            {"id": "t1", "userId": "u", "body": "one", "createdAt": "2024-01-01"},
+            {"id": "t2", "userId": "u", "body": "two", "createdAt": "2024-01-02"},
+            {"id": "t3", "userId": "v", "body": "three", "createdAt": "2024-01-03"},
+        ]
+    ).execute()
+    backend.table("Like").insert(
+        [{"id": "l1", "userId": "v", "tweetId": "t1", "createdAt": "2024-01-04"}]
+    ).execute()
+
+    tweets = (
+        backend.rpc(
+            "recent_activity",
+            {"activity": "Tweet", "user_ids": ["u", "v"], "per_user": 1},
+        )
+        .execute()
+        .data
+    )
+    assert [row["id"] for row in tweets] == ["t2", "t3"]
+
+    likes = (
+        backend.rpc(
+            "recent_activity",
+            {
+                "activity": "Like",
+                "user_ids": ["v"],
+                "per_user": 5,
+                "since": {"v": "2024-01-03"},
+            },
+        )
+        .execute()
+        .data
+    )
+    assert likes[0]["Tweet"] == {"body": "one", "images": []}
+
+
+def test_last_active_users_takes_the_newest_tweet_or_reply(backend):
+    backend.table("User").insert(
+        [
+            {"id": "a", "username": "ann", "provider": "google"},
+            {"id": "b", "username": "bob", "provider": "ai"},
+            {"id": "c", "username": "cat", "provider": "google"},
+        ]
+    ).execute()
+    backend.table("Tweet").insert(
+        [
+            {"id": "t1", "userId": "a", "body": "1", "createdAt": "2024-01-01"},
+            {"id": "t2", "userId": "b", "body": "2", "createdAt": "2024-01-02"},
+        ]
+    ).execute()
+    backend.table("Reply").insert(
+        [{"id": "r1", "userId": "a", "tweetId": "t2", "createdAt": "2024-01-03"}]
+    ).execute()
+
+    def last_active(**params):
+        rows = backend.rpc("last_active_users", params).execute().data
+        return [(row["userId"], row["lastActivity"][:10]) for row in rows]
+
+    assert last_active(max_users=5) == [("a", "2024-01-03"), ("b", "2024-01-02")]
+    assert last_active(max_users=1) == [("a", "2024-01-03")]
+    assert last_active(max_users=5, ai=True) == [("b", "2024-01-02")]
+    assert last_active(max_users=5, ai=False) == [("a", "2024-01-03")]
+
+
+def test_increment_counters_rejects_unknown_columns(backend):
+    add_users(backend)
+    backend.rpc(
+        "increment_counters",
+        {
+            "increments": [
+                {"table": "User", "id": "a", "column": "followersCount", "delta": 2}
+            ]
+        },
+    ).execute()
+    row = backend.table("User").select("followersCount").eq("id", "a").execute()
+    assert row.data == [{"followersCount": 5}]
+    with pytest.raises(Exception):
+        backend.rpc(
+            "increment_counters",
+            {"increments": [{"table": "User", "id": "a", "column": "bio", "delta": 1}]},
+        ).execute()
@@ -0,0 +1,72 @@
+import threading
+
+import local_keywords
+from local_keywords import TfidfKeywordExtractor, candidate_terms
+
+
+def test_candidate_terms_split_on_stopwords():
+    assert candidate_terms("The quick fox and the lazy dog", (1, 2)) == [
+        "quick",
+        "fox",
+        "quick fox",
+        "lazy",
+        "dog",
+        "lazy dog",
+    ]
+
+
+def test_extract_many_counts_new_texts_once():
+    extractor = TfidfKeywordExtractor().partial_fit(["rust compiler", "rust crates"])
+    assert extractor.n_docs == 2
+
+    extractor.extract_many(["python typing", "rust compiler"])
+    # "rust compiler" was already counted by partial_fit
+    assert extractor.n_docs == 3
+    extractor.extract_many(["python typing"])
+    assert extractor.n_docs == 3
+    assert extractor._df[extractor.vocabulary["python"]] == 1
+
+
+def test_rare_terms_score_higher():
+    extractor = TfidfKeywordExtractor().partial_fit(
+        ["music today", "music again", "music tonight"]
+    )
+    (keywords,) = extractor.extract_many(["music guitar"], top_n=2)
+    assert [term for term, _ in keywords] == ["guitar", "music"]
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "model.npz")
+    extractor = TfidfKeywordExtractor().partial_fit(["solar power", "solar panels"])
+    extractor.save(path)
+    assert extractor.unsaved == 0
+
+    loaded = TfidfKeywordExtractor.load(path)
+    assert loaded.n_docs == 2
+    assert loaded.fitted_at == extractor.fitted_at
+    assert loaded.extract_many(["solar panels"]) == extractor.extract_many(
+        ["solar panels"]
+    )
+    # The loaded model remembers which texts it has counted
+    assert loaded.n_docs == 2
+
+
+def test_first_use_fits_in_the_background(tmp_path, monkeypatch):
+    release = threading.Event()
+    fitted = TfidfKeywordExtractor().partial_fit(["corpus text"])
+
+    def slow_fit():
+        release.wait(5)
+        return fitted
+
+    monkeypatch.setattr(local_keywords, "_extractor", None)
+    monkeypatch.setattr(local_keywords, "KEYWORD_MODEL_PATH", str(tmp_path / "m.npz"))
+    monkeypatch.setattr(local_keywords, "_fit_extractor", slow_fit)
+
+    extractor = local_keywords.get_local_extractor()
+    assert extractor is not fitted and extractor.n_docs == 0
+    release.set()
+    for thread in threading.enumerate():
+        if thread.name == "keyword-refit":
+            thread.join(5)
+    assert local_keywords.get_local_extractor() is fitted
@@ -0,0 +1,74 @@
+import time
+
+import metrics
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = metrics.TokenBucket(per_minute=6000, capacity=10)
+    bucket.acquire(10)
+    start = time.monotonic()
+    bucket.acquire(5)
+    # 5 tokens at 100 per second
+    assert time.monotonic() - start >= 0.04
+    assert bucket.waited > 0
+
+
+def test_record_accumulates_calls_bytes_tokens_and_cost():
+    metrics.record("svc-a", "op", 0.03, request_bytes=10, response_bytes=20)
+    metrics.record(
+        "svc-a",
+        "op",
+        2.0,
+        error=True,
+        prompt_tokens=1_000_000,
+        completion_tokens=1_000_000,
+        model="gpt-4o-mini-2024-07-18",
+    )
+    stats = metrics.snapshot()["svc-a/op"]
+    assert (stats["calls"], stats["errors"]) == (2, 1)
+    assert (stats["request_bytes"], stats["response_bytes"]) == (10, 20)
+    assert (stats["prompt_tokens"], stats["completion_tokens"]) == (10**6, 10**6)
+    assert stats["cost_usd"] == 0.75
+    assert stats["latency_buckets"]["0.05"] == 1
+    assert stats["latency_p99"] == 2.5
+
+
+def test_track_records_failures_and_reraises():
+    with metrics.track("svc-b", "ok") as call:
+        call.response_bytes = 5
+    try:
+        with metrics.track("svc-b", "fails"):
+            raise ValueError("boom")
+    except ValueError:
+        pass
+    stats = metrics.snapshot()
+    assert (stats["svc-b/ok"]["errors"], stats["svc-b/ok"]["response_bytes"]) == (0, 5)
+    assert (stats["svc-b/fails"]["calls"], stats["svc-b/fails"]["errors"]) == (1, 1)
+
+
+def test_openai_call_counts_encoded_bytes():
+    class Message:
+        content = "café ☕"
+
+    class Response:
+        usage = None
+        choices = [type("Choice", (), {"message": Message})]
+
+    metrics.openai_call(
+        "svc-c", lambda **kwargs: Response(), messages=[{"content": "naïve"}]
+    )
+    stats = metrics.snapshot()["openai/svc-c"]
+    assert stats["response_bytes"] == len("café ☕".encode("utf-8")) == 9
+    assert stats["request_bytes"] == len('[{"content": "na\\u00efve"}]')
+
+
+def test_prometheus_text_exposes_counters_and_cumulative_buckets():
+    metrics.record("svc-d", 'say "hi"', 0.02, response_bytes=3)
+    metrics.record("svc-d", 'say "hi"', 0.2)
+    text = metrics.prometheus_text()
+    labels = 'service="svc-d",operation="say \\"hi\\""'
+    assert f"y_external_calls_total{{{labels}}} 2" in text
+    assert f"y_external_response_bytes_total{{{labels}}} 3" in text
+    assert f'y_external_latency_seconds_bucket{{{labels},le="0.025"}} 1' in text
+    assert f'y_external_latency_seconds_bucket{{{labels},le="0.25"}} 2' in text
+    assert f'y_external_latency_seconds_bucket{{{labels},le="+Inf"}} 2' in text
@@ -0,0 +1,38 @@
+from local_backend import MemoryBackend
+from pagination import iter_pages, iter_rows
+
+
+def test_pages_do_not_skip_rows_sharing_a_timestamp():
+    client = MemoryBackend()
+    client.table("Tweet").insert(
+        [
+            {"id": f"t{i:02}", "userId": "u", "createdAt": "2024-01-01T00:00:00"}
+            for i in range(7)
+        ]
+    ).execute()
+    pages = list(iter_pages(client, "Tweet", "id", page_size=3))
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [row["id"] for page in pages for row in page] == [
+        f"t{i:02}" for i in range(7)
+    ]
+
+
+def test_scan_resumes_after_a_key_and_orders_by_another_column():
+    client = MemoryBackend()
+    client.table("User").insert(
+        [
+            {"id": "a", "username": "a", "profileUpdatedAt": "2024-01-02"},
+            {"id": "b", "username": "b", "profileUpdatedAt": "2024-01-01"},
+            {"id": "c", "username": "c", "profileUpdatedAt": "2024-01-02"},
+        ]
+    ).execute()
+    rows = iter_rows(
+        client,
+        "User",
+        "id",
+        page_size=2,
+        prefetch=True,
+        order_by="profileUpdatedAt",
+        after=("2024-01-02T00:00:00.000", "a"),
+    )
+    assert [row["id"] for row in rows] == ["c"]
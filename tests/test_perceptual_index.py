@@ -0,0 +1,84 @@
+import random
+
+import numpy as np
+from PIL import Image
+
+from description_cache import DescriptionCache
+from perceptual_index import BKTree, PerceptualIndex, dhash, hamming
+
+
+def test_nearest_matches_brute_force():
+    rng = random.Random(7)
+    keys = [rng.getrandbits(64) for _ in range(500)]
+    tree = BKTree()
+    for i, key in enumerate(keys):
+        tree.add(key, i)
+    assert tree.size == len(set(keys))
+
+    for _ in range(50):
+        query = keys[rng.randrange(len(keys))] ^ (1 << rng.randrange(64))
+        best = min(hamming(query, key) for key in keys)
+        distance, value = tree.nearest(query, 6)
+        assert distance == best
+        assert hamming(query, keys[value]) == best
+
+
+def test_nearest_respects_radius():
+    tree = BKTree()
+    assert tree.nearest(0, 6) is None
+    tree.add(0, "zero")
+    tree.add(0, "duplicate")
+    assert tree.size == 1
+    assert tree.nearest(0b111, 2) is None
+    # Adding an equal key replaces its value
+    assert tree.nearest(0b111, 3) == (3, "duplicate")
+
+
+def gradient(width, height):
+    x = np.linspace(0, 255, width)
+    y = np.linspace(0, 64, height)[:, None]
+    return Image.fromarray((x + y).astype(np.uint8))
+
+
+def test_dhash_survives_rescaling():
+    image = gradient(320, 200)
+    assert hamming(dhash(image), dhash(image.resize((160, 100)))) <= 4
+    assert hamming(dhash(image), dhash(image.transpose(Image.FLIP_LEFT_RIGHT))) > 20
+
+
+def test_index_reads_rows_added_by_other_processes(tmp_path):
+    path = str(tmp_path / "index.sqlite3")
+    reader = PerceptualIndex(path, max_distance=4)
+    writer = PerceptualIndex(path, max_distance=4)
+    writer.add(0xFF00, "abc")
+    assert reader.find(0xFF01) == "abc"
+    assert reader.find(0x00FF) is None
+    assert reader.stats()["matches"] == 1
+    assert PerceptualIndex(path, max_distance=0).find(0xFF00) is None
+
+
+def test_re_adding_a_hash_replaces_its_content_hash(tmp_path):
+    path = str(tmp_path / "index.sqlite3")
+    reader = PerceptualIndex(path, max_distance=4)
+    writer = PerceptualIndex(path, max_distance=4)
+    writer.add(0xFF00, "old")
+    assert reader.find(0xFF00) == "old"
+    writer.add(0xFF00, "new")
+    assert reader.find(0xFF01) == "new"
+    assert reader.stats()["size"] == 1
+
+
+def test_prune_drops_hashes_of_evicted_descriptions(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = DescriptionCache(path)
+    index = PerceptualIndex(path, max_distance=4, prune_every=2)
+    cache["kept"] = "a lighthouse"
+    cache["evicted"] = "a harbour"
+    index.add(0xFF00, "kept")
+    cache.clear()
+    cache["kept"] = "a lighthouse"
+    index.add(0x00FF, "evicted")
+
+    assert index.find(0x00FF) is None
+    assert index.find(0xFF00) == "kept"
+    assert index.stats()["size"] == 1
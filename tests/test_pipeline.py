@@ -0,0 +1,99 @@
+import threading
+import time
+
+from pipeline import Pipeline, Stage
+
+
+def test_items_flow_through_every_stage():
+    seen = []
+    lock = threading.Lock()
+
+    def record(item):
+        with lock:
+            seen.append(item)
+        return item
+
+    pipeline = Pipeline(
+        [
+            Stage("double", lambda item: item * 2, workers=3),
+            Stage("inc", lambda item: item + 1, workers=2),
+            Stage("record", record),
+        ]
+    )
+    completed, failed = pipeline.run(range(20))
+    assert sorted(completed) == list(range(20))
+    assert failed == {}
+    assert sorted(seen) == [2 * i + 1 for i in range(20)]
+    stats = pipeline.stats()
+    assert [stats[name]["processed"] for name in ("double", "inc", "record")] == [
+        20,
+        20,
+        20,
+    ]
+
+
+def test_failing_items_are_dropped_and_reported():
+    def check(item):
+        if item % 5 == 0:
+            raise ValueError(item)
+        return item
+
+    pipeline = Pipeline([Stage("check", check, workers=2), Stage("pass", str)])
+    completed, failed = pipeline.run(range(10), key=lambda item: f"item-{item}")
+    assert sorted(failed) == ["item-0", "item-5"]
+    assert isinstance(failed["item-5"], ValueError)
+    assert len(completed) == 8
+    assert pipeline.stats()["check"]["errors"] == 2
+
+
+def test_failed_batch_is_retried_one_item_at_a_time():
+    batches = []
+
+    def square_all(items):
+        batches.append(list(items))
+        if 3 in items:
+            raise ValueError("bad batch")
+        return [item * item for item in items]
+
+    results = []
+    pipeline = Pipeline(
+        [
+            Stage("square", square_all, batch_size=4),
+            Stage("collect", results.append),
+        ]
+    )
+    completed, failed = pipeline.run(range(8))
+    assert list(failed) == [3]
+    assert sorted(completed) == [0, 1, 2, 4, 5, 6, 7]
+    assert sorted(results) == [0, 1, 4, 16, 25, 36, 49]
+    assert max(len(batch) for batch in batches) > 1
+
+
+def test_slow_stage_bounds_the_queue_in_front_of_it():
+    in_flight = []
+    lock = threading.Lock()
+    started = []
+
+    def fast(item):
+        with lock:
+            started.append(item)
+            in_flight.append(len(started) - len(done))
+        return item
+
+    done = []
+
+    def slow(item):
+        time.sleep(0.002)
+        with lock:
+            done.append(item)
+
+    slow_stage = Stage("slow", slow, queue_size=2)
+    Pipeline([Stage("fast", fast), slow_stage]).run(range(30))
+    # Queue of 2, one item in the slow worker and one held by the fast worker
+    assert max(in_flight) <= slow_stage.queue_size + 2
+    assert len(done) == 30
+
+
+def test_empty_input_finishes():
+    pipeline = Pipeline([Stage("a", str, workers=2), Stage("b", str, workers=2)])
+    assert pipeline.run([]) == ([], {})
@@ -0,0 +1,81 @@
+import pytest
+
+import collect_data
+from local_backend import MemoryBackend
+from pipeline import Pipeline, Stage
+from watermarks import WatermarkStore
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = MemoryBackend()
+    monkeypatch.setattr(collect_data, "supabase", client)
+    monkeypatch.setattr(collect_data, "PROFILE_FETCH_BATCH_SIZE", 2)
+    client.table("User").insert(
+        [
+            {"id": user_id, "username": user_id, "provider": "email", "bio": user_id}
+            for user_id in ("u1", "u2", "u3")
+        ]
+    ).execute()
+    client.table("Tweet").insert(
+        [
+            {
+                "id": f"{user_id}-t{day}",
+                "userId": user_id,
+                "body": f"{user_id} day {day}",
+                "createdAt": f"2024-01-0{day}",
+            }
+            for user_id in ("u1", "u2")
+            for day in (1, 2, 3)
+        ]
+    ).execute()
+    client.table("Reply").insert(
+        [{"id": "r1", "userId": "u1", "tweetId": "u2-t1", "body": "nice"}]
+    ).execute()
+    client.table("Like").insert(
+        [{"id": "l1", "userId": "u3", "tweetId": "u1-t3"}]
+    ).execute()
+    client.table("UserProfile").insert(
+        [{"id": "p1", "userId": "u2", "interests": ["chess"]}]
+    ).execute()
+    return client
+
+
+def test_batched_fetch_matches_per_user_reads(client):
+    since = {"u1": {"tweets": "2024-01-01T00:00:00.000"}}
+    many = collect_data.fetch_users_activity(
+        ["u1", "u2", "u3", "ghost"], 2, 2, 2, since
+    )
+    for user_id in ("u1", "u2", "u3"):
+        one = collect_data.fetch_user_activity(user_id, 2, 2, 2, since.get(user_id))
+        for kind in ("tweets", "replies", "likes", "prevProfile"):
+            assert many[user_id][kind] == one[kind], (user_id, kind)
+        assert many[user_id]["user"]["bio"] == user_id
+    assert [row["id"] for row in many["u1"]["tweets"]] == ["u1-t3", "u1-t2"]
+    assert many["u1"]["replies"][0]["Tweet"]["body"] == "u2 day 1"
+    assert many["ghost"]["user"] is None
+
+
+def test_fetch_stage_runs_in_batches(client, tmp_path):
+    store = WatermarkStore(str(tmp_path / "watermarks.sqlite3"))
+    batch_sizes = []
+
+    def fetch(jobs):
+        batch_sizes.append(len(jobs))
+        return collect_data._fetch_stage(jobs)
+
+    jobs = [
+        {"userId": user_id, "limits": (1, 1, 1), "store": store}
+        for user_id in ("u1", "u2", "u3")
+    ]
+    results = []
+    pipeline = Pipeline(
+        [Stage("fetch", fetch, batch_size=3), Stage("collect", results.append)]
+    )
+    completed, failed = pipeline.run(jobs, key=lambda job: job["userId"])
+    assert sorted(completed) == ["u1", "u2", "u3"]
+    assert failed == {}
+    by_user = {job["userId"]: job for job in results}
+    assert [row["id"] for row in by_user["u2"]["activity"]["tweets"]] == ["u2-t3"]
+    assert by_user["u3"]["user"]["bio"] == "u3"
+    assert sum(batch_sizes) == 3
@@ -0,0 +1,104 @@
+import re
+
+import collect_data
+from prompt_builder import PromptBuilder, compact, dedupe, estimate_tokens
+
+
+def test_compact_and_dedupe():
+    assert compact({"a": [1, None, "x  y"], "b": float("nan"), "c": ""}) == "a: 1, x y"
+    assert dedupe(["Cats", "cats", " ", None, "dogs"]) == ["Cats", "dogs"]
+
+
+def test_everything_fits_in_insertion_order():
+    builder = PromptBuilder(1000)
+    builder.add("a", ["one", "two"], 1, "A:")
+    builder.add("b", "three", 5)
+    assert builder.build() == "A:\none\ntwo\n\nthree"
+    report = builder.report()
+    assert report["a"]["dropped"] == 0
+    assert report["total"] <= 1000
+
+
+def test_low_priority_lines_are_cut_first():
+    lines = [f"line number {n} with some words" for n in range(20)]
+    builder = PromptBuilder(100)
+    builder.add("low", lines, 1, "Low:")
+    builder.add("high", lines[:5], 9, "High:")
+    prompt = builder.build()
+    report = builder.report()
+    assert report["high"]["dropped"] == 0
+    assert report["low"]["dropped"] > 0
+    assert report["total"] <= 100
+    assert estimate_tokens(prompt) <= 100
+    # Kept lines are a prefix of the section
+    low = prompt.split("Low:\n")[1].split("\n\n")[0].split("\n")
+    assert low[0] == lines[0]
+
+
+def test_a_line_that_partly_fits_is_shortened():
+    builder = PromptBuilder(20)
+    builder.add("text", " ".join(["word"] * 40))
+    prompt = builder.build()
+    assert prompt.endswith(" …")
+    assert builder.report()["text"]["lines"] == 1
+
+
+def item(text, keywords=(), images=()):
+    return {
+        "text": text,
+        "keywords": [[keyword, 1.0] for keyword in keywords],
+        "image_descriptions": list(images),
+    }
+
+
+def analysis(tweets=(), replies=(), likes=()):
+    return {
+        "tweets": list(tweets),
+        "replies": list(replies),
+        "likes": list(likes),
+        "prevProfile": {"id": "p", "occupation": "chef"},
+    }
+
+
+USER = {"bio": "cooking and travel", "bio_keywords": [["cooking", 1.0]]}
+
+
+def test_profile_prompt_lists_each_image_once():
+    prompt = collect_data.compile_profile_prompt(
+        analysis(
+            tweets=[item("pasta", images=["a bowl of pasta"])],
+            likes=[item("more pasta", images=["a bowl of pasta", "a kitchen"])],
+        ),
+        USER,
+    )
+    assert "- pasta [images 1]" in prompt
+    assert "- more pasta [images 1, 2]" in prompt
+    assert "1. a bowl of pasta\n2. a kitchen" in prompt
+    assert "occupation: chef" in prompt and "id:" not in prompt
+
+
+def test_cut_images_are_not_referenced():
+    long = " ".join(["detail"] * 60)
+    tweets = [
+        item(f"tweet {n} " + " ".join(["text"] * 10), images=[f"image {n} {long}"])
+        for n in range(12)
+    ]
+    prompt = collect_data.compile_profile_prompt(analysis(tweets=tweets), USER, 400)
+    listed = set(re.findall(r"^(\d+)\. ", prompt, re.MULTILINE))
+    referenced = {
+        ref
+        for refs in re.findall(r"\[images ([\d, ]+)\]", prompt)
+        for ref in refs.split(", ")
+    }
+    assert referenced <= listed
+
+
+def test_keywords_only_count_kept_items():
+    likes = [item(f"like {n} " + "filler " * 30, ["liked"]) for n in range(40)]
+    prompt = collect_data.compile_profile_prompt(
+        analysis(tweets=[item("hello", ["food"])], likes=likes), USER, 300
+    )
+    kept = prompt.count("- like ")
+    assert 0 < kept < 40
+    keywords = prompt.split("Keywords (occurrences):\n")[1].split("\n")[0]
+    assert f"liked ({kept})" in keywords or (kept == 1 and "liked" in keywords)
@@ -0,0 +1,135 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+import requests
+
+import clients
+import metrics
+import transport
+
+
+class FakeSession:
+    """Answers each call with the next status code, or raises the next error."""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, method, url, timeout=None, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        status, headers = outcome if isinstance(outcome, tuple) else (outcome, {})
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(headers)
+        response._content = b"body"
+        response._content_consumed = True
+        response.request = requests.Request(method, url).prepare()
+        return response
+
+
+@pytest.fixture
+def session(monkeypatch):
+    def install(*outcomes):
+        fake = FakeSession(outcomes)
+        monkeypatch.setattr(transport, "get_session", lambda url: fake)
+        return fake
+
+    monkeypatch.setattr(transport, "backoff_delay", lambda attempt: 0)
+    return install
+
+
+def test_get_retries_server_errors(session):
+    fake = session(503, requests.ConnectionError(), 200)
+    assert transport.get("https://example.test/a").status_code == 200
+    assert fake.calls == 3
+
+
+def test_post_is_not_retried_after_a_server_error(session):
+    fake = session(503, 200)
+    assert transport.post("https://example.test/a").status_code == 503
+    assert fake.calls == 1
+
+    fake = session(requests.ConnectionError(), 200)
+    with pytest.raises(requests.ConnectionError):
+        transport.post("https://example.test/a")
+    assert fake.calls == 1
+
+
+def test_post_waits_out_a_rate_limit(session):
+    fake = session((429, {"Retry-After": "0"}), 200)
+    assert transport.post("https://example.test/a").status_code == 200
+    assert fake.calls == 2
+
+    fake = session(429, 200)
+    assert transport.post("https://example.test/a").status_code == 429
+    assert fake.calls == 1
+
+
+def test_post_retries_when_the_caller_opts_in(session):
+    fake = session(503, 200)
+    response = transport.post("https://example.test/a", retry_unsafe=True)
+    assert response.status_code == 200
+    assert fake.calls == 2
+
+
+def test_retries_are_bounded(session):
+    fake = session(503, 503, 503)
+    assert transport.get("https://example.test/a", retries=2).status_code == 503
+    assert fake.calls == 3
+
+
+def response_bytes(service, method):
+    return metrics.snapshot().get(f"{service}/{method}", {}).get("response_bytes", 0)
+
+
+def test_response_bytes_come_from_the_body(session):
+    session(200)
+    before = response_bytes("example.test", "GET")
+    transport.get("https://example.test/a")
+    assert response_bytes("example.test", "GET") == before + len(b"body")
+
+
+class ChunkedHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        # Chunked, so there is no Content-Length to go by
+        self.send_response(200)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for chunk in (b"x" * 1000, b"y" * 500):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, *args):
+        pass
+
+
+def test_streamed_body_is_counted_when_closed():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ChunkedHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        service = f"127.0.0.1:{server.server_port}"
+        with transport.get(f"http://{service}/", stream=True) as response:
+            assert b"".join(response.iter_content(256)) == b"x" * 1000 + b"y" * 500
+        assert response_bytes(service, "GET") == 1500
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_supabase_calls_record_the_body_size():
+    def handler(request):
+        return httpx.Response(200, content=iter([b"[", b"{}", b"]"]))
+
+    client = clients._pooled_http_client(
+        "supabase", base_url="https://db.test", transport=httpx.MockTransport(handler)
+    )
+    before = response_bytes("supabase", "GET Tweet")
+    assert client.get("/rest/v1/Tweet").json() == [{}]
+    assert response_bytes("supabase", "GET Tweet") == before + 4
@@ -0,0 +1,96 @@
+import threading
+
+import pytest
+
+import tweet_enrichment
+from description_cache import DescriptionCache
+from tweet_enrichment import TweetEnricher
+
+
+class FakeServices:
+    """Stands in for keyword extraction and image description, counting calls."""
+
+    def __init__(self):
+        self.texts = []
+        self.urls = []
+        self.failing_urls = set()
+        self.release = None
+
+    def get_keywords_many(self, texts):
+        if self.release is not None:
+            self.release.wait()
+        self.texts.extend(texts)
+        return [[[text.split()[0], 1.0]] if text.strip() else [] for text in texts]
+
+    def describe_urls(self, urls):
+        self.urls.extend(urls)
+        return {
+            url: f"picture of {url}" for url in urls if url not in self.failing_urls
+        }
+
+
+@pytest.fixture
+def services(monkeypatch):
+    services = FakeServices()
+    monkeypatch.setattr(
+        tweet_enrichment, "get_keywords_many", services.get_keywords_many
+    )
+    monkeypatch.setattr(
+        tweet_enrichment.image_describer, "describe_urls", services.describe_urls
+    )
+    return services
+
+
+@pytest.fixture
+def enricher(tmp_path):
+    return TweetEnricher(DescriptionCache(str(tmp_path / "enrichment.sqlite3")))
+
+
+def test_tweets_are_enriched_once(services, enricher):
+    records = enricher.enrich_many({"t1": ("hello world", ["a.png"])})
+    assert records["t1"]["keywords"] == [["hello", 1.0]]
+    assert records["t1"]["image_descriptions"] == ["picture of a.png"]
+
+    again = enricher.enrich_many({"t1": ("hello world", ["a.png"]), "t2": ("bye", [])})
+    assert again["t1"] == records["t1"]
+    assert services.texts == ["hello world", "bye"]
+    assert services.urls == ["a.png"]
+    assert enricher.stats()["hits"] == 1
+
+
+def test_edited_tweets_are_enriched_again(services, enricher):
+    enricher.enrich_many({"t1": ("first", [])})
+    record = enricher.enrich_many({"t1": ("second", [])})["t1"]
+    assert record["keywords"] == [["second", 1.0]]
+    assert enricher.stats()["invalidations"] == 1
+
+
+def test_incomplete_records_are_not_stored(services, enricher):
+    services.failing_urls.add("bad.png")
+    record = enricher.enrich_many({"t1": ("text", ["bad.png"])})["t1"]
+    assert record["image_descriptions"] == []
+
+    services.failing_urls.clear()
+    record = enricher.enrich_many({"t1": ("text", ["bad.png"])})["t1"]
+    assert record["image_descriptions"] == ["picture of bad.png"]
+    assert services.urls == ["bad.png", "bad.png"]
+
+
+def test_concurrent_requests_share_one_computation(services, enricher):
+    services.release = threading.Event()
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(enricher.enrich_many({"t1": ("same", [])}))
+        )
+        for _ in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    while enricher.stats()["coalesced"] < 2:
+        threading.Event().wait(0.001)
+    services.release.set()
+    for thread in threads:
+        thread.join()
+    assert services.texts == ["same"]
+    assert all(result["t1"] == results[0]["t1"] for result in results)
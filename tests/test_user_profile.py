@@ -0,0 +1,42 @@
+import collect_data
+import datatypes
+from clients import supabase
+
+
+def profile_rows(user_id):
+    return (
+        supabase.table("UserProfile").select("*").eq("userId", user_id).execute().data
+    )
+
+
+def test_reading_a_missing_profile_never_writes():
+    user = datatypes.User.create(username="no-profile")
+    assert user.userProfile is None
+    assert datatypes.User.prefetch_profiles([user])[0].userProfile is None
+    assert profile_rows(user.id) == []
+
+
+def test_prefetch_attaches_stored_profiles():
+    user = datatypes.User.create(username="with-profile")
+    datatypes.UserProfile.create(user.id, occupation="chef")
+    fresh = datatypes.User.from_db({"id": user.id, "username": "with-profile"})
+    datatypes.User.prefetch_profiles([fresh])
+    assert fresh.userProfile.occupation == "chef"
+
+
+def test_update_profile_creates_the_row_once():
+    user = datatypes.User.create(username="new-profile")
+    user.update_profile(occupation="pilot")
+    user.update_profile(location="Oslo")
+    rows = profile_rows(user.id)
+    assert len(rows) == 1
+    assert (rows[0]["occupation"], rows[0]["location"]) == ("pilot", "Oslo")
+
+
+def test_regenerated_profile_keeps_its_row_id():
+    user = datatypes.User.create(username="regenerated")
+    collect_data.update_user_profile(user.id, {"occupation": "baker"})
+    (first,) = profile_rows(user.id)
+    collect_data.update_user_profile(user.id, {"occupation": "judge"})
+    (second,) = profile_rows(user.id)
+    assert (second["id"], second["occupation"]) == (first["id"], "judge")